@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+# ==============================================================
+# Tomas Bruna
+#
+# On-disk binary cache of a parsed miniprot gff.
+#
+# The cache directory contains:
+#   alignments.bin  Columns of the AlignmentStore and a table of input rows
+#                   saved as raw arrays. The file is memory-mapped on load,
+#                   columns are used directly as typed memoryviews.
+#   miniprot.gtf    Gtf export of all input rows, which does not depend on
+#                   any option.
+#   input.json      Size, mtime and content hash of the cached input. It is
+#                   written last and marks the cache as complete.
+#
+# Rows of the input are not parsed when the cache is used. Only the rows of
+# selected alignments are read from the memory-mapped input by their byte
+# offsets.
+# ==============================================================
+
+
+import json
+import mmap
+import os
+import sys
+from array import array
+import AlignmentStore
+import BinaryContainer
+import ContentHash
+import GffAttributes
+import GffReader
+
+
+CACHE_VERSION = 2
+MAGIC = b'MPHCACHE'
+FORMAT_NAME = "alignment cache"
+
+STRING_COLUMNS = ["IDs", "targets", "contigs", "strands"]
+ARRAY_COLUMNS = ["scores", "coverages", "identities", "starts", "ends",
+                 "CDSlens", "exonContigs", "exonStrands", "exonStarts",
+                 "exonEnds", "exonParents", "exonOffsets",
+                 "alignmentExonStarts", "alignmentExonEnds",
+                 "alignmentContigs", "alignmentStrands"]
+
+
+def lineOffsets(fileName):
+    """Return byte offsets of all lines and the end of the file."""
+    offsets = array('q', [0])
+    position = 0
+    with open(fileName, "rb") as f:
+        for line in f:
+            position += len(line)
+            offsets.append(position)
+    return offsets
+
+
+def rowID(row):
+    """Return the ID of the alignment a row belongs to, in the same way as
+    selectRepresentativeAlignments.selectRows."""
+    if row[0][0] == "#":
+        return None
+    if row[2] == 'mRNA':
+        return GffAttributes.extract(row[8], "ID")
+    return GffAttributes.extract(row[8], "Parent")
+
+
+def rowTable(rows, store):
+    """Group input rows by alignment IDs.
+
+    Returns:
+        IDs: Row IDs, IDs of alignments in the store come first in the
+             store order
+        idRowOffsets: Rows of ID i are at idRows[idRowOffsets[i]:
+                      idRowOffsets[i + 1]]
+        idRows: Row indices grouped by ID, in the input order
+    """
+    IDs = list(store.IDs)
+    idIndices = {ID: i for i, ID in enumerate(IDs)}
+    rowIds = array('i')
+    for row in rows:
+        ID = rowID(row)
+        if ID is None:
+            rowIds.append(-1)
+            continue
+        index = idIndices.get(ID)
+        if index is None:
+            index = len(IDs)
+            idIndices[ID] = index
+            IDs.append(ID)
+        rowIds.append(index)
+
+    counts = [0] * (len(IDs) + 1)
+    for index in rowIds:
+        if index >= 0:
+            counts[index + 1] += 1
+    idRowOffsets = array('q', [0]) * (len(IDs) + 1)
+    for i in range(len(IDs)):
+        idRowOffsets[i + 1] = idRowOffsets[i] + counts[i + 1]
+    idRows = array('q', [0]) * idRowOffsets[-1]
+    fill = array('q', idRowOffsets)
+    for row, index in enumerate(rowIds):
+        if index >= 0:
+            idRows[fill[index]] = row
+            fill[index] += 1
+    return IDs, idRowOffsets, idRows
+
+
+def isValid(miniprot, cacheDir, trustMtime=False):
+    """Check whether the cache in cacheDir was built from the same input.
+
+    A different size invalidates the cache, otherwise the content hash
+    decides. With trustMtime, the content is not hashed if the mtime is the
+    same as when the cache was built. The new mtime is saved if the content
+    is the same.
+    """
+    stateFile = f'{cacheDir}/input.json'
+    if not os.path.isfile(stateFile):
+        return False
+    with open(stateFile) as f:
+        cached = json.load(f)
+    if cached.get("version") != CACHE_VERSION:
+        return False
+
+    if ContentHash.fileState(miniprot)["size"] != cached["size"]:
+        return False
+    state = ContentHash.currentHash(miniprot, cached, trustMtime)
+    if state["hash"] != cached["hash"]:
+        return False
+    if state["mtime"] != cached["mtime"]:
+        cached.update(state)
+        with open(stateFile, "w") as f:
+            json.dump(cached, f, indent=2)
+    return True
+
+
+def invalidate(cacheDir):
+    if os.path.isfile(f'{cacheDir}/input.json'):
+        os.remove(f'{cacheDir}/input.json')
+
+
+def build(miniprot, rows, store, cacheDir):
+    """Save the parsed rows and the store of an input to the cache. The gtf
+    export of all rows has to be saved to cacheDir/miniprot.gtf separately,
+    before calling this function.
+
+    Returns:
+        True if the cache was built. The cache is not built if the rows do
+        not correspond to input lines one to one, or if the rows could not
+        be read back by splitting lines by tabs.
+    """
+    data = GffReader.mapFile(miniprot)
+    if data is not None:
+        with data:
+            plainText = GffReader.isPlainText(data)
+        if not plainText:
+            sys.stderr.write("warning: The input contains quotes or carriage "
+                             "returns, the parsed input is not cached.\n")
+            return False
+
+    offsets = lineOffsets(miniprot)
+    if len(offsets) - 1 != len(rows):
+        sys.stderr.write("warning: Input rows do not match input lines, "
+                         "the parsed input is not cached.\n")
+        return False
+
+    IDs, idRowOffsets, idRows = rowTable(rows, store)
+    strings = {name: getattr(store, name) for name in STRING_COLUMNS}
+    strings["rowIDs"] = IDs
+    arrays = {name: getattr(store, name) for name in ARRAY_COLUMNS}
+    arrays["lineOffsets"] = offsets
+    arrays["idRowOffsets"] = idRowOffsets
+    arrays["idRows"] = idRows
+    BinaryContainer.write(f'{cacheDir}/alignments.bin', strings, arrays,
+                          MAGIC)
+
+    state = ContentHash.currentHash(miniprot)
+    state["path"] = os.path.abspath(miniprot)
+    state["version"] = CACHE_VERSION
+    with open(f'{cacheDir}/input.json', "w") as f:
+        json.dump(state, f, indent=2)
+    return True
+
+
+class CachedInput():
+    """Parsed input loaded from the cache."""
+
+    def __init__(self, miniprot, cacheDir):
+        strings, arrays = BinaryContainer.read(f'{cacheDir}/alignments.bin',
+                                               MAGIC, FORMAT_NAME)
+        store = AlignmentStore.AlignmentStore()
+        for name in STRING_COLUMNS:
+            setattr(store, name, strings[name])
+        for name in ARRAY_COLUMNS:
+            setattr(store, name, arrays[name])
+        store.contigIds = {c: i for i, c in enumerate(store.contigs)}
+        store.strandIds = {s: i for i, s in enumerate(store.strands)}
+        self.store = store
+
+        self.rowIDs = strings["rowIDs"]
+        self.lineOffsets = arrays["lineOffsets"]
+        self.idRowOffsets = arrays["idRowOffsets"]
+        self.idRows = arrays["idRows"]
+        self.gtf = f'{cacheDir}/miniprot.gtf'
+
+        with open(miniprot, "rb") as f:
+            self.input = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def selectRows(self, selected):
+        """Return rows of the selected alignments in the input order and
+        their indices in the input."""
+        selected = set(selected)
+        indices = []
+        for i, ID in enumerate(self.rowIDs):
+            if ID in selected:
+                indices += self.idRows[self.idRowOffsets[i]:
+                                       self.idRowOffsets[i + 1]]
+        indices.sort()
+
+        rows = []
+        offsets = self.lineOffsets
+        data = self.input
+        for i in indices:
+            line = str(data[offsets[i]:offsets[i + 1]], "utf-8")
+            rows.append(line.rstrip("\r\n").split("\t"))
+        return rows, indices
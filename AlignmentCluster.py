@@ -9,6 +9,11 @@
 
 import sys
 import math
+from bisect import bisect_left, bisect_right
+
+
+# Smaller clusters are scanned linearly, the interval index does not pay off
+MIN_INDEXED_CLUSTER_SIZE = 32
 
 
 class Border():
@@ -37,21 +42,56 @@ class Block():
                          f'Coverage={self.coverage}']))
 
 
+class IntervalIndex():
+    """Static index of closed intervals for overlap queries.
+
+    Intervals are sorted by their start. Intervals overlapping a query can
+    only start in [query start - longest interval length, query end].
+    """
+
+    def __init__(self, intervals):
+        """
+        Args:
+            intervals: List of (start, end, value) tuples
+        """
+        intervals.sort()
+        self.starts = [interval[0] for interval in intervals]
+        self.ends = [interval[1] for interval in intervals]
+        self.values = [interval[2] for interval in intervals]
+        self.maxLength = max([end - start for start, end, value
+                              in intervals], default=0)
+
+    def overlapping(self, start, end):
+        """Yield values of all intervals overlapping [start, end]."""
+        first = bisect_left(self.starts, start - self.maxLength)
+        last = bisect_right(self.starts, end)
+        ends = self.ends
+        for i in range(first, last):
+            if ends[i] >= start:
+                yield self.values[i]
+
+
 class Cluster():
-    def __init__(self, clusterId):
+    """Cluster of overlapping alignments.
+
+    Alignments are integer indices into an AlignmentStore.
+    """
+
+    def __init__(self, clusterId, store=None):
         self.clusterId = clusterId
+        self.store = store
         self.start = sys.maxsize
         self.end = -sys.maxsize
         self.alignments = []
         self.borders = []
 
     def addAlignment(self, alignment):
-        self.start = min(self.start, alignment.start)
-        self.end = max(self.end, alignment.end)
+        self.start = min(self.start, self.store.starts[alignment])
+        self.end = max(self.end, self.store.ends[alignment])
         self.alignments.append(alignment)
 
     def getContig(self):
-        return self.alignments[0].getContig()
+        return self.store.getContig(self.alignments[0])
 
     def print(self):
         print("\t".join([self.getContig(), str(self.start), str(self.end),
@@ -59,7 +99,7 @@ class Cluster():
 
     def printAlignments(self):
         for alignment in self.alignments:
-            alignment.print(clusterId=self.clusterId)
+            self.store.printAlignment(alignment, clusterId=self.clusterId)
 
     def printSubClusters(self):
         for subCluster in self.subClusters:
@@ -71,11 +111,11 @@ class Cluster():
         self.borders = []
         self.CDSborders = []
         for al in self.alignments:
-            self.borders.append(Border(al.start, True))
-            self.borders.append(Border(al.end, False))
-            for exon in al.exons:
-                self.CDSborders.append(Border(exon.start, True))
-                self.CDSborders.append(Border(exon.end, False))
+            self.borders.append(Border(self.store.starts[al], True))
+            self.borders.append(Border(self.store.ends[al], False))
+            for start, end in self.store.getExons(al):
+                self.CDSborders.append(Border(start, True))
+                self.CDSborders.append(Border(end, False))
         self.borders.sort()
         self.CDSborders.sort()
 
@@ -174,54 +214,95 @@ class Cluster():
 
     def getNextSeed(self, minSeedCov):
         while self.lastSeed < len(self.alignments):
-            if self.alignments[self.lastSeed].used:
+            if self.used[self.lastSeed]:
                 self.lastSeed += 1
             else:
-                if self.alignments[self.lastSeed].coverage < minSeedCov:
-                    self.alignments[self.lastSeed].used = True
+                alignment = self.alignments[self.lastSeed]
+                if self.store.coverages[alignment] < minSeedCov:
+                    self.used[self.lastSeed] = True
                     self.lastSeed += 1
                 else:
-                    self.alignments[self.lastSeed].seed = True
-                    self.alignments[self.lastSeed].selected = True
-                    self.alignments[self.lastSeed].used = True
-                    return self.alignments[self.lastSeed]
+                    self.seeds[self.lastSeed] = True
+                    self.selected[self.lastSeed] = True
+                    self.used[self.lastSeed] = True
+                    return self.lastSeed
         return None
 
-    def processOverlappingAlignmens(self, seed, minOverlap, minScoreFraction,
-                                    topNperSeed, maxSubFrac, minSubCov):
+    def processOverlappingAlignmens(self, seedIndex, minOverlap,
+                                    minScoreFraction, topNperSeed, maxSubFrac,
+                                    minSubCov):
         # maxSubFrac is the maximum coverage of the parent seed by a
         # potential subseed in order for subseed to be used. Setting
         # to 0 turns subseeed off completely.
         # Further, subseed is only selected when it has better average
         # alignment identity than the parent and query coverage >= minSubCov.
-        for i in range(self.lastSeed + 1, len(self.alignments)):
-            alignment = self.alignments[i]
-            if not alignment.used:
-                if alignment.getCDSOverlap(seed) > minOverlap:
-                    if alignment.score > seed.score * minScoreFraction and \
-                            seed.selectedCount < topNperSeed:
-                        alignment.selected = True
-                        alignment.used = True
-                        seed.selectedCount += 1
-                    elif seed.getCDSOverlap(alignment) <= maxSubFrac and \
-                            alignment.coverage >= minSubCov and \
-                            alignment.identity >= seed.identity:
+        store = self.store
+        seed = self.alignments[seedIndex]
+        minScore = store.scores[seed] * minScoreFraction
+        selectedCount = 0
+        for i in self.getCandidates(seed, minOverlap):
+            if not self.used[i]:
+                alignment = self.alignments[i]
+                if store.getCDSOverlap(alignment, seed) > minOverlap:
+                    if store.scores[alignment] > minScore and \
+                            selectedCount < topNperSeed:
+                        self.selected[i] = True
+                        self.used[i] = True
+                        selectedCount += 1
+                    elif store.getCDSOverlap(seed, alignment) <= maxSubFrac \
+                            and store.coverages[alignment] >= minSubCov and \
+                            store.identities[alignment] >= \
+                            store.identities[seed]:
                         # If not selected as a seed rep., give it a chance
                         # to be selected as a sublocus seed later.
                         # A potential issue to consider: All sublocus reps.
                         # need to satisfy the sublocus seed conditions.
                         # Could be resolved by multiple iterations for each
                         # subseed if this really turns out to matter.
-                        alignment.subLocus = True
+                        self.subLocus[i] = True
                     else:
-                        alignment.used = True
+                        self.used[i] = True
+
+    def indexExons(self):
+        intervals = []
+        for i, alignment in enumerate(self.alignments):
+            for start, end in self.store.getExons(alignment):
+                intervals.append((start, end, i))
+        self.exonIndex = IntervalIndex(intervals)
+
+    def getCandidates(self, seed, minOverlap):
+        """Return positions of alignments after the last seed which can
+        overlap the seed by more than minOverlap, in the processing order.
+
+        Only alignments with at least one exon overlapping a seed exon are
+        returned if the cluster is indexed; a zero overlap never passes
+        a non-negative minOverlap.
+        """
+        if self.exonIndex is None or minOverlap < 0:
+            return range(self.lastSeed + 1, len(self.alignments))
+
+        candidates = set()
+        for start, end in self.store.getExons(seed):
+            candidates.update(self.exonIndex.overlapping(start, end))
+        return sorted(i for i in candidates if i > self.lastSeed)
 
     def splitByBestAlignments(self, minOverlap=0.01,
                               minScoreFraction=0.90, minSeedCov=0,
                               topNperSeed=10, maxSubFrac=0.8, minSubCov=0.9):
-        self.alignments.sort()
+        # Best alignments first, the order of equal scores is kept
+        self.alignments.sort(key=self.store.scores.__getitem__, reverse=True)
+        # Selection state of alignments, indexed by their position in
+        # the sorted self.alignments
+        self.used = bytearray(len(self.alignments))
+        self.selected = bytearray(len(self.alignments))
+        self.seeds = bytearray(len(self.alignments))
+        self.subLocus = bytearray(len(self.alignments))
         self.lastSeed = 0
 
+        self.exonIndex = None
+        if len(self.alignments) >= MIN_INDEXED_CLUSTER_SIZE:
+            self.indexExons()
+
         seed = self.getNextSeed(minSeedCov)
         while seed is not None:
             self.processOverlappingAlignmens(seed, minOverlap,
@@ -230,7 +311,7 @@ class Cluster():
             seed = self.getNextSeed(minSeedCov)
 
         selected = []
-        for alignment in self.alignments:
-            if alignment.selected:
-                selected.append(alignment.ID)
+        for i, alignment in enumerate(self.alignments):
+            if self.selected[i]:
+                selected.append(self.store.IDs[alignment])
         return selected
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+# ==============================================================
+# Tomas Bruna
+#
+# Columnar storage of miniprot alignments and their CDS segments (exons).
+#
+# Alignments and exons are referenced by their integer index. Contigs and
+# strands are interned to integers and all per-alignment and per-exon values
+# are kept in compact array buffers instead of per-row Python objects.
+# ==============================================================
+
+
+import sys
+from array import array
+
+
+def lexsort(keys, n):
+    """Return indices 0..n-1 sorted by the given keys, primary key first.
+
+    Like numpy.lexsort, the order is computed by a sequence of stable sorts,
+    starting with the least significant key. Ties keep their input order.
+
+    Args:
+        keys: Sequences of length n which can be indexed by an integer
+        n: Number of elements to sort
+    """
+    order = list(range(n))
+    for key in reversed(keys):
+        order.sort(key=key.__getitem__)
+    return order
+
+
+def intern(value, values, valueIds):
+    valueId = valueIds.get(value)
+    if valueId is None:
+        valueId = len(values)
+        valueIds[value] = valueId
+        values.append(value)
+    return valueId
+
+
+class AlignmentStore():
+
+    def __init__(self):
+        self.contigs = []
+        self.contigIds = {}
+        self.strands = []
+        self.strandIds = {}
+
+        # Alignments
+        self.IDs = []
+        self.targets = []
+        self.scores = array('d')
+        self.coverages = array('d')
+        self.identities = array('d')
+        self.starts = array('q')
+        self.ends = array('q')
+        self.CDSlens = array('q')
+
+        # Exons in the input order. After sortExons() is called, these are
+        # in the (contig, strand, start, end) order.
+        self.exonContigs = array('i')
+        self.exonStrands = array('i')
+        self.exonStarts = array('q')
+        self.exonEnds = array('q')
+        self.exonParents = array('i')
+
+        # Exons grouped by alignments, filled by sortExons(). Exons of
+        # alignment i are at positions exonOffsets[i]:exonOffsets[i + 1].
+        self.exonOffsets = array('q')
+        self.alignmentExonStarts = array('q')
+        self.alignmentExonEnds = array('q')
+        self.alignmentContigs = array('i')
+        self.alignmentStrands = array('i')
+
+    def __len__(self):
+        return len(self.IDs)
+
+    def addAlignment(self, ID, coverage, target):
+        self.IDs.append(ID)
+        self.targets.append(target.split()[0])
+        self.scores.append(0)
+        self.coverages.append(coverage)
+        self.identities.append(0)
+        self.starts.append(sys.maxsize)
+        self.ends.append(-sys.maxsize)
+        self.CDSlens.append(0)
+        return len(self.IDs) - 1
+
+    def addExon(self, alignment, contig, start, end, strand):
+        self.exonContigs.append(intern(contig, self.contigs, self.contigIds))
+        self.exonStrands.append(intern(strand, self.strands, self.strandIds))
+        self.exonStarts.append(start)
+        self.exonEnds.append(end)
+        self.exonParents.append(alignment)
+        if start < self.starts[alignment]:
+            self.starts[alignment] = start
+        if end > self.ends[alignment]:
+            self.ends[alignment] = end
+        self.CDSlens[alignment] += end - start + 1
+
+    def renumber(self, values, column):
+        """Renumber interned values so that the integer order matches the
+        order of the original values."""
+        ranks = [0] * len(values)
+        for rank, valueId in enumerate(sorted(range(len(values)),
+                                              key=values.__getitem__)):
+            ranks[valueId] = rank
+        values.sort()
+        return array(column.typecode, [ranks[i] for i in column])
+
+    def sortExons(self):
+        """Sort exons by contig, strand, start and end and group them by
+        alignments. The order of equal exons is kept."""
+        self.exonContigs = self.renumber(self.contigs, self.exonContigs)
+        self.contigIds = {c: i for i, c in enumerate(self.contigs)}
+        self.exonStrands = self.renumber(self.strands, self.exonStrands)
+        self.strandIds = {s: i for i, s in enumerate(self.strands)}
+
+        order = lexsort([self.exonContigs, self.exonStrands, self.exonStarts,
+                         self.exonEnds], len(self.exonStarts))
+        for name in ["exonContigs", "exonStrands", "exonStarts", "exonEnds",
+                     "exonParents"]:
+            column = getattr(self, name)
+            setattr(self, name, array(column.typecode,
+                                      [column[i] for i in order]))
+        del order
+
+        # Exons of each alignment in the global exon order
+        byAlignment = lexsort([self.exonParents], len(self.exonParents))
+        self.alignmentExonStarts = array('q', [self.exonStarts[i]
+                                               for i in byAlignment])
+        self.alignmentExonEnds = array('q', [self.exonEnds[i]
+                                             for i in byAlignment])
+
+        counts = [0] * (len(self) + 1)
+        for parent in self.exonParents:
+            counts[parent + 1] += 1
+        self.exonOffsets = array('q', [0]) * (len(self) + 1)
+        for i in range(len(self)):
+            self.exonOffsets[i + 1] = self.exonOffsets[i] + counts[i + 1]
+
+        self.alignmentContigs = array('i', [-1]) * len(self)
+        self.alignmentStrands = array('i', [-1]) * len(self)
+        for i in reversed(byAlignment):
+            parent = self.exonParents[i]
+            self.alignmentContigs[parent] = self.exonContigs[i]
+            self.alignmentStrands[parent] = self.exonStrands[i]
+
+    def getExons(self, alignment):
+        first = self.exonOffsets[alignment]
+        last = self.exonOffsets[alignment + 1]
+        return zip(self.alignmentExonStarts[first:last],
+                   self.alignmentExonEnds[first:last])
+
+    def getContig(self, alignment):
+        return self.contigs[self.alignmentContigs[alignment]]
+
+    def getStrand(self, alignment):
+        return self.strands[self.alignmentStrands[alignment]]
+
+    def getCDSOverlap(self, alignment, other):
+        """Return the fraction of CDS of alignment overlapped by the CDS of
+        the other alignment."""
+        if self.starts[alignment] > self.ends[other] or \
+           self.ends[alignment] < self.starts[other]:
+            return 0
+        starts = self.alignmentExonStarts
+        ends = self.alignmentExonEnds
+        i = self.exonOffsets[alignment]
+        iLast = self.exonOffsets[alignment + 1]
+        j = self.exonOffsets[other]
+        jLast = self.exonOffsets[other + 1]
+        overlap = 0
+        while i < iLast and j < jLast:
+            end1 = ends[i]
+            start2 = starts[j]
+            if end1 < start2:
+                i += 1
+                continue
+            start1 = starts[i]
+            end2 = ends[j]
+            if end2 < start1:
+                j += 1
+            else:
+                overlap += min(end1, end2) - max(start1, start2) + 1
+                if end1 < end2:
+                    i += 1
+                else:
+                    j += 1
+        return overlap / self.CDSlens[alignment]
+
+    def printAlignment(self, alignment, clusterId='', exons=True):
+        contig = self.getContig(alignment)
+        strand = self.getStrand(alignment)
+        score = self.scores[alignment]
+        ID = self.IDs[alignment]
+        print("\t".join([contig, "miniprot", "mRNA",
+                         str(self.starts[alignment]),
+                         str(self.ends[alignment]), str(score), strand,
+                         ".", f'ID={ID}; score={str(score)};'
+                         f'qcov={str(round(self.coverages[alignment], 4))};'
+                         f'identity='
+                         f'{str(round(self.identities[alignment], 4))};'
+                         f'cluster={str(clusterId)}']))
+        if exons:
+            for start, end in self.getExons(alignment):
+                print("\t".join([contig, "miniprot", "CDS", str(start),
+                                 str(end), ".", strand, ".",
+                                 f'Parent={ID};']))
+
+    def printAlignmentGff2(self, alignment):
+        contig = self.getContig(alignment)
+        strand = self.getStrand(alignment)
+        target = self.targets[alignment]
+        match = f'{target}_{self.IDs[alignment]}'
+        print("\t".join([contig, "miniprot", "match",
+                         str(self.starts[alignment]),
+                         str(self.ends[alignment]),
+                         str(int(self.scores[alignment])), strand, ".",
+                         f'Match {match};'
+                         f'coverage '
+                         f'{str(round(self.coverages[alignment], 2))};'
+                         f'subjectName {target};'
+                         f'Alias {target}'
+                         ]))
+        for start, end in self.getExons(alignment):
+            print("\t".join([contig, "miniprot", "HSP", str(start), str(end),
+                             ".", strand, ".", f'Match {match}']))
+
+    def printLocus(self, alignment, outFh, addQcov=False):
+        toPrint = [self.getContig(alignment), self.getStrand(alignment),
+                   str(self.starts[alignment]), str(self.ends[alignment]),
+                   self.targets[alignment]]
+        if addQcov:
+            toPrint.append(str(round(self.coverages[alignment], 2)))
+        outFh.write("\t".join(toPrint) + "\n")
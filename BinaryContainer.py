@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# ==============================================================
+# Tomas Bruna
+#
+# Binary container of string lists and arrays used by the binary files of
+# miniprothint, such as the alignment cache and the protein support file.
+#
+# The file consists of magic bytes identifying its content, the length of
+# a json header, the header and the data. Strings of a list are saved
+# joined by new lines. Arrays are saved raw, starting at 8 byte aligned
+# offsets, so that they can be used directly as memoryviews of a memory
+# map.
+# ==============================================================
+
+
+import json
+import mmap
+import struct
+import sys
+from array import array
+
+
+FORMAT_VERSION = 1
+
+
+def align(position):
+    return (position + 7) // 8 * 8
+
+
+def write(fileName, strings, arrays, magic):
+    """Write string lists and arrays to a binary file. Arrays start at 8 byte
+    aligned offsets so that they can be cast from a memory map. The file
+    starts with magic bytes identifying its content."""
+    blobs = {name: "\n".join(values).encode() for name, values
+             in strings.items()}
+    header = {"version": FORMAT_VERSION, "strings": {}, "arrays": {}}
+    # Offsets are relative to the end of the header
+    position = 0
+    for name, blob in blobs.items():
+        header["strings"][name] = [position, len(blob), len(strings[name])]
+        position = align(position + len(blob))
+    for name, values in arrays.items():
+        header["arrays"][name] = [values.typecode, position, len(values)]
+        position = align(position + len(values) * values.itemsize)
+
+    headerBytes = json.dumps(header).encode()
+    dataStart = align(len(magic) + 8 + len(headerBytes))
+    with open(fileName, "wb") as f:
+        f.write(magic)
+        f.write(struct.pack('<q', len(headerBytes)))
+        f.write(headerBytes)
+        f.write(b'\0' * (dataStart - f.tell()))
+        for name, (offset, size, count) in header["strings"].items():
+            f.write(b'\0' * (dataStart + offset - f.tell()))
+            f.write(blobs[name])
+        for name, (typecode, offset, count) in header["arrays"].items():
+            f.write(b'\0' * (dataStart + offset - f.tell()))
+            arrays[name].tofile(f)
+
+
+def read(fileName, magic, formatName):
+    """Memory-map a file written by write with the same magic bytes.
+
+    Args:
+        fileName: Name of the file
+        magic: Magic bytes identifying the content
+        formatName: Name of the content in error messages
+
+    Returns:
+        strings: Dictionary of string lists
+        arrays: Dictionary of memoryviews cast to the saved types
+    """
+    with open(fileName, "rb") as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if data[:len(magic)] != magic:
+        sys.exit(f'error: {fileName} is not a miniprothint {formatName} '
+                 'file.')
+    headerLength = struct.unpack('<q', data[len(magic):len(magic) + 8])[0]
+    headerStart = len(magic) + 8
+    header = json.loads(data[headerStart:headerStart + headerLength])
+    if header.get("version") != FORMAT_VERSION:
+        sys.exit(f'error: {fileName} is a {formatName} file of format '
+                 f'version {header.get("version")}, but this miniprothint '
+                 f'reads version {FORMAT_VERSION}. Create the file again.')
+    dataStart = align(headerStart + headerLength)
+
+    view = memoryview(data)
+    strings = {}
+    for name, (offset, size, count) in header["strings"].items():
+        start = dataStart + offset
+        if count == 0:
+            strings[name] = []
+        else:
+            strings[name] = str(view[start:start + size], "utf-8").split("\n")
+    arrays = {}
+    for name, (typecode, offset, count) in header["arrays"].items():
+        start = dataStart + offset
+        itemsize = array(typecode).itemsize
+        arrays[name] = view[start:start + count * itemsize].cast(typecode)
+    return strings, arrays
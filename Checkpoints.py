@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# ==============================================================
+# Tomas Bruna
+#
+# Manifest of pipeline stages for incremental runs.
+#
+# For each finished stage, the content hashes of its input files, its
+# parameters and the content hashes of its output files are saved to
+# workdir/stages.json. A stage is up to date if all of these match the
+# current state and can be skipped. Each file is hashed once per run. The
+# hashes are saved with the file size and mtime, with --trustMtime a file
+# with the same size and mtime is not hashed again.
+# ==============================================================
+
+
+import json
+import os
+import ContentHash
+
+
+MANIFEST_VERSION = 1
+
+
+class Checkpoints():
+
+    def __init__(self, workDir, enabled=True, trustMtime=False):
+        """
+        Args:
+            workDir: Directory with the manifest
+            enabled: If False, no stage is considered up to date. Stages
+                     are still recorded.
+            trustMtime: Reuse saved hashes of files with the same size and
+                        mtime instead of hashing their content
+        """
+        self.fileName = f'{workDir}/stages.json'
+        self.enabled = enabled
+        self.trustMtime = trustMtime
+        # Hashes computed in this run
+        self.hashes = {}
+        self.manifest = {"version": MANIFEST_VERSION, "files": {},
+                         "stages": {}}
+        if os.path.isfile(self.fileName):
+            with open(self.fileName) as f:
+                manifest = json.load(f)
+            if manifest.get("version") == MANIFEST_VERSION:
+                self.manifest = manifest
+
+    def save(self):
+        with open(self.fileName + ".tmp", "w") as f:
+            json.dump(self.manifest, f, indent=2)
+        os.replace(self.fileName + ".tmp", self.fileName)
+
+    def hash(self, fileName):
+        """Return the content hash of a file, or None if it does not
+        exist."""
+        if not os.path.isfile(fileName):
+            return None
+        key = os.path.abspath(fileName)
+        if key not in self.hashes:
+            state = ContentHash.currentHash(
+                fileName, self.manifest["files"].get(key), self.trustMtime)
+            self.manifest["files"][key] = state
+            self.hashes[key] = state["hash"]
+        return self.hashes[key]
+
+    def state(self, inputs, params, outputs):
+        """
+        Args:
+            inputs: Dictionary of input names and files
+            params: JSON serializable parameters of the stage
+            outputs: List of output files
+        """
+        return {"inputs": {name: self.hash(fileName)
+                           for name, fileName in inputs.items()},
+                "params": params,
+                "outputs": {os.path.basename(fileName): self.hash(fileName)
+                            for fileName in outputs}}
+
+    def upToDate(self, stage, inputs, params, outputs):
+        if not self.enabled:
+            return False
+        record = self.manifest["stages"].get(stage)
+        if record is None:
+            return False
+        state = self.state(inputs, params, outputs)
+        if None in state["inputs"].values() or \
+                None in state["outputs"].values():
+            return False
+        # Round trip through JSON to compare parameters as saved
+        state["params"] = json.loads(json.dumps(params))
+        return state == record
+
+    def invalidate(self, stage):
+        """Forget a stage before it is run, so that an interrupted stage is
+        not considered up to date."""
+        if self.manifest["stages"].pop(stage, None) is not None:
+            self.save()
+
+    def record(self, stage, inputs, params, outputs):
+        # The outputs were written by the stage after they were hashed
+        for fileName in outputs:
+            self.hashes.pop(os.path.abspath(fileName), None)
+        self.manifest["stages"][stage] = json.loads(json.dumps(
+            self.state(inputs, params, outputs)))
+        self.save()
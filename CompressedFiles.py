@@ -0,0 +1,384 @@
+#!/usr/bin/env python3
+# ==============================================================
+# Tomas Bruna
+#
+# Transparent reading and writing of gzip (including bgzip) and zstd
+# compressed files.
+#
+# Compressed input is recognized by its first bytes, not by the file
+# extension. The compression of an output is given by its extension (.gz,
+# .bgz, .zst). Gzip is (de)compressed in a background thread, zlib releases
+# the GIL, so the (de)compression runs in parallel with the parsing of the
+# rows. Zstd uses the zstd module of Python 3.14 or the zstandard package
+# if available, otherwise the zstd binary running as a separate process.
+#
+# The input "-" is read from stdin. Stdin can only be read once, inputs
+# which are read twice save the lines needed in the second pass to a Spool.
+# ==============================================================
+
+
+import gzip
+import io
+import queue
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+
+
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+GZIP_EXTENSIONS = (".gz", ".bgz")
+ZSTD_EXTENSIONS = (".zst", ".zstd")
+COMPRESSION_EXTENSIONS = GZIP_EXTENSIONS + ZSTD_EXTENSIONS
+OUTPUT_COMPRESSIONS = {"gz": ".gz", "zst": ".zst"}
+
+STDIN = "-"
+
+CHUNK_SIZE = 1 << 20
+# Maximum number of chunks waiting for the parsing or the compression
+QUEUE_CHUNKS = 16
+
+
+def zstdModule():
+    """Return a module with zstd open() or None if there is none."""
+    try:
+        from compression import zstd
+        return zstd
+    except ImportError:
+        pass
+    try:
+        import zstandard
+        return zstandard
+    except ImportError:
+        return None
+
+
+def zstdBinary():
+    binary = shutil.which("zstd")
+    if binary is None:
+        sys.exit('error: Zstd compressed files need Python 3.14, the '
+                 'zstandard package or the zstd binary in PATH.')
+    return binary
+
+
+def isStdin(fileName):
+    return fileName == STDIN
+
+
+class StdinReader(io.RawIOBase):
+    """Raw stream of stdin. Closing the stream does not close stdin, which
+    may be read again in the same process. Bytes peeked from stdin are
+    returned first."""
+
+    # Peeked bytes which were not read yet, shared by all readers of stdin
+    head = b''
+
+    @classmethod
+    def peek(cls, size):
+        """Return the next size bytes of stdin, fewer only at its end,
+        without consuming them. A pipe may return fewer bytes in one read,
+        so stdin is read until there are enough."""
+        while len(cls.head) < size:
+            chunk = sys.stdin.buffer.read1(size - len(cls.head))
+            if not chunk:
+                break
+            cls.head += chunk
+        return cls.head[:size]
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if StdinReader.head:
+            data = StdinReader.head[:len(buffer)]
+            StdinReader.head = StdinReader.head[len(data):]
+        else:
+            data = sys.stdin.buffer.read1(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def detectCompression(fileName):
+    """Return "gz", "zst" or None based on the first bytes of a file."""
+    if isStdin(fileName):
+        # Peeked bytes are not consumed
+        magic = StdinReader.peek(4)
+    else:
+        with open(fileName, "rb") as f:
+            magic = f.read(4)
+    if magic.startswith(GZIP_MAGIC):
+        return "gz"
+    if magic == ZSTD_MAGIC:
+        return "zst"
+    return None
+
+
+def isCompressed(fileName):
+    return detectCompression(fileName) is not None
+
+
+def outputCompression(fileName):
+    """Return the compression of an output given by its extension."""
+    if fileName.endswith(GZIP_EXTENSIONS):
+        return "gz"
+    if fileName.endswith(ZSTD_EXTENSIONS):
+        return "zst"
+    return None
+
+
+def stripExtension(fileName):
+    """Return a file name without a compression extension."""
+    for extension in COMPRESSION_EXTENSIONS:
+        if fileName.endswith(extension):
+            return fileName[:-len(extension)]
+    return fileName
+
+
+class ThreadedReader(io.RawIOBase):
+    """Raw stream of chunks read from a binary source in a background
+    thread."""
+
+    def __init__(self, source, onClose=None):
+        self.source = source
+        self.onClose = onClose
+        self.chunks = queue.Queue(QUEUE_CHUNKS)
+        self.chunk = memoryview(b'')
+        self.error = None
+        self.finished = False
+        self.stopped = False
+        self.thread = threading.Thread(target=self.readChunks, daemon=True)
+        self.thread.start()
+
+    def readChunks(self):
+        try:
+            while not self.stopped:
+                chunk = self.source.read(CHUNK_SIZE)
+                self.chunks.put(chunk)
+                if not chunk:
+                    break
+        except Exception as error:
+            self.error = error
+            self.chunks.put(b'')
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self.chunk:
+            if self.finished:
+                return 0
+            self.chunk = memoryview(self.chunks.get())
+            if not self.chunk:
+                self.finished = True
+                if self.error is not None:
+                    raise self.error
+                return 0
+        size = min(len(buffer), len(self.chunk))
+        buffer[:size] = self.chunk[:size]
+        self.chunk = self.chunk[size:]
+        return size
+
+    def close(self):
+        if self.closed:
+            return
+        self.stopped = True
+        # Unblock the thread if the queue is full
+        while self.thread.is_alive():
+            try:
+                self.chunks.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        self.source.close()
+        if self.onClose is not None:
+            self.onClose()
+        super().close()
+
+
+class ThreadedWriter(io.RawIOBase):
+    """Raw stream whose chunks are written to a binary target in a
+    background thread."""
+
+    def __init__(self, target, onClose=None):
+        self.target = target
+        self.onClose = onClose
+        self.chunks = queue.Queue(QUEUE_CHUNKS)
+        self.error = None
+        self.thread = threading.Thread(target=self.writeChunks, daemon=True)
+        self.thread.start()
+
+    def writeChunks(self):
+        while True:
+            chunk = self.chunks.get()
+            if chunk is None:
+                break
+            if self.error is None:
+                try:
+                    self.target.write(chunk)
+                except Exception as error:
+                    self.error = error
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        if self.error is not None:
+            raise self.error
+        self.chunks.put(bytes(data))
+        return len(data)
+
+    def close(self):
+        if self.closed:
+            return
+        self.chunks.put(None)
+        self.thread.join()
+        self.target.close()
+        if self.onClose is not None:
+            self.onClose()
+        super().close()
+        if self.error is not None:
+            raise self.error
+
+
+def processCloser(process, fileName):
+    def close():
+        if process.wait() != 0:
+            sys.exit(f'error: zstd failed on {fileName}.')
+    return close
+
+
+def feedProcess(source, process):
+    """Copy a binary stream to the stdin of a process in a background
+    thread."""
+    def feed():
+        try:
+            shutil.copyfileobj(source, process.stdin, CHUNK_SIZE)
+        except BrokenPipeError:
+            pass
+        process.stdin.close()
+    threading.Thread(target=feed, daemon=True).start()
+
+
+def openRead(fileName):
+    compression = detectCompression(fileName)
+    stdin = isStdin(fileName)
+    if compression is None and not stdin:
+        return open(fileName)
+    # Stdin is read through a reader which returns the peeked bytes and
+    # leaves stdin open
+    inputFile = io.BufferedReader(StdinReader(), CHUNK_SIZE) if stdin \
+        else fileName
+    if compression is None:
+        return io.TextIOWrapper(inputFile, encoding=sys.stdin.encoding,
+                                errors=sys.stdin.errors, newline="\n")
+    if compression == "gz":
+        source, onClose = gzip.open(inputFile, "rb"), None
+    else:
+        module = zstdModule()
+        if module is not None:
+            source, onClose = module.open(inputFile, "rb"), None
+        elif stdin:
+            process = subprocess.Popen([zstdBinary(), "-q", "-d", "-c"],
+                                       stdin=subprocess.PIPE,
+                                       stdout=subprocess.PIPE)
+            feedProcess(inputFile, process)
+            source = process.stdout
+            onClose = processCloser(process, "stdin")
+        else:
+            process = subprocess.Popen([zstdBinary(), "-q", "-d", "-c",
+                                        fileName], stdout=subprocess.PIPE)
+            source = process.stdout
+            onClose = processCloser(process, fileName)
+    return io.TextIOWrapper(io.BufferedReader(ThreadedReader(source, onClose),
+                                              CHUNK_SIZE))
+
+
+def openWrite(fileName, mode, compression):
+    binaryMode = mode + "b"
+    if compression == "gz":
+        # Zero mtime makes the output reproducible
+        target = gzip.GzipFile(fileName, binaryMode, mtime=0)
+        onClose = None
+    else:
+        module = zstdModule()
+        if module is not None:
+            target, onClose = module.open(fileName, binaryMode), None
+        else:
+            output = open(fileName, binaryMode)
+            process = subprocess.Popen([zstdBinary(), "-q", "-c"],
+                                       stdin=subprocess.PIPE, stdout=output)
+            output.close()
+            target = process.stdin
+            onClose = processCloser(process, fileName)
+    return io.TextIOWrapper(io.BufferedWriter(ThreadedWriter(target, onClose),
+                                              CHUNK_SIZE))
+
+
+def openFile(fileName, mode="r", compression=None):
+    """Open a text file, which may be compressed.
+
+    Args:
+        fileName: Name of the file
+        mode: "r", "w" or "a". Compressed data is appended as a new gzip
+              member or zstd frame.
+        compression: Compression of a written file, "gz", "zst" or None.
+                     By default, it is given by the file extension. The
+                     compression of a read file is always detected from its
+                     content.
+
+    The file name "-" opens stdin for reading.
+    """
+    if mode == "r":
+        return openRead(fileName)
+    if compression is None:
+        compression = outputCompression(fileName)
+    if compression is None:
+        return open(fileName, mode)
+    return openWrite(fileName, mode, compression)
+
+
+def copyFile(source, target, compression=None):
+    """Copy a file, decompressing and compressing it as needed."""
+    if compression is None:
+        compression = outputCompression(target)
+    if compression is None and not isCompressed(source):
+        shutil.copyfile(source, target)
+        return
+    with openFile(source) as f, openFile(target, "w", compression) as output:
+        shutil.copyfileobj(f, output, CHUNK_SIZE)
+
+
+def outputName(fileName, compression):
+    """Return the name of an output with the extension of a compression
+    given as "gz", "zst" or None."""
+    if compression is None:
+        return fileName
+    return fileName + OUTPUT_COMPRESSIONS[compression]
+
+
+class Spool():
+    """Lines of a single-pass input, such as stdin, saved to a temporary
+    file to be read again."""
+
+    def __init__(self, tempDir=None):
+        """
+        Args:
+            tempDir: Directory of the temporary file, the system default
+                     temporary directory is used if None
+        """
+        self.file = tempfile.TemporaryFile("w+", dir=tempDir)
+
+    def tee(self, lines, keep=None):
+        """Yield lines and save those for which keep(line) is true, or all
+        lines if keep is None."""
+        for line in lines:
+            if keep is None or keep(line):
+                self.file.write(line)
+            yield line
+
+    def lines(self):
+        """Return the saved lines. The spool is removed when they are
+        closed."""
+        self.file.seek(0)
+        return self.file
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+# ==============================================================
+# Tomas Bruna
+#
+# Content hashes of files, shared by the alignment cache and the stage
+# manifest.
+#
+# A file is unchanged only if its content hash is the same. An edit can
+# keep the size and the mtime of a file, so these are trusted instead of
+# the content only if asked to (--trustMtime).
+# ==============================================================
+
+
+import hashlib
+import os
+
+
+def contentHash(fileName):
+    digest = hashlib.blake2b(digest_size=20)
+    with open(fileName, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def fileState(fileName):
+    """Return the size and mtime of a file."""
+    stat = os.stat(fileName)
+    return {"size": stat.st_size, "mtime": stat.st_mtime_ns}
+
+
+def currentHash(fileName, known=None, trustMtime=False):
+    """Return the content hash of a file and its current state.
+
+    Args:
+        fileName: Name of the file
+        known: Previously saved state with "size", "mtime" and "hash" keys,
+               or None
+        trustMtime: Return the known hash without reading the file if the
+                    size and mtime of the file match the known state
+    """
+    state = fileState(fileName)
+    if trustMtime and known is not None and \
+            known.get("size") == state["size"] and \
+            known.get("mtime") == state["mtime"]:
+        state["hash"] = known["hash"]
+    else:
+        state["hash"] = contentHash(fileName)
+    return state
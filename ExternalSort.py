@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# ==============================================================
+# Tomas Bruna
+#
+# Sorting of gff rows which do not need to fit in memory.
+#
+# Rows are sorted in chunks in memory. A chunk is limited by the number
+# of rows and by the estimated memory of the rows. If there is more than
+# one chunk, sorted chunks are spilled to temporary files and merged. The
+# files are closed after they are written and opened again only when they
+# are merged. At most MAX_MERGE_RUNS files are merged, and so open, at
+# once, more runs are first merged in several passes.
+# ==============================================================
+
+
+import heapq
+import os
+import sys
+import tempfile
+
+import CompressedFiles
+
+
+DEFAULT_CHUNK_ROWS = 1000000
+DEFAULT_MEMORY_MB = 1024
+MAX_MERGE_RUNS = 64
+
+# Approximate memory of a row list and of each string in it
+ROW_OVERHEAD = 120
+FIELD_OVERHEAD = 60
+
+
+def number(text):
+    """Parse a coordinate the way sort -n does, non-numeric values are 0."""
+    try:
+        return int(text)
+    except ValueError:
+        return 0
+
+
+def coordinateKey(row):
+    """Sort key ordering rows in the same way as
+    `LC_ALL=C sort -k1,1 -k4,4n -k5,5n`."""
+    if len(row) < 5:
+        return (row[0] if row else "", 0, 0, "\t".join(row))
+    return (row[0], number(row[3]), number(row[4]), "\t".join(row))
+
+
+def rowSize(row):
+    return ROW_OVERHEAD + sum(FIELD_OVERHEAD + len(field) for field in row)
+
+
+def spill(rows, runDir):
+    """Write rows to a new closed file in runDir and return its name."""
+    handle, run = tempfile.mkstemp(dir=runDir)
+    with os.fdopen(handle, "w") as output:
+        for row in rows:
+            output.write("\t".join(row) + "\n")
+    return run
+
+
+def readRun(run):
+    """Yield rows of a run, the run is removed once it is read."""
+    with open(run) as f:
+        for line in f:
+            yield line[:-1].split("\t")
+    os.remove(run)
+
+
+def mergeRuns(runs, key, runDir):
+    """Merge runs until at most MAX_MERGE_RUNS are left. Consecutive runs
+    are merged, which keeps the sort stable."""
+    while len(runs) > MAX_MERGE_RUNS:
+        merged = []
+        for i in range(0, len(runs), MAX_MERGE_RUNS):
+            group = runs[i:i + MAX_MERGE_RUNS]
+            if len(group) == 1:
+                merged.append(group[0])
+                continue
+            merged.append(spill(heapq.merge(*[readRun(run) for run in group],
+                                            key=key), runDir))
+        runs = merged
+    return runs
+
+
+def sortRows(rows, key, chunkRows=DEFAULT_CHUNK_ROWS, tempDir=None,
+             memory=None):
+    """Yield rows sorted by key. The sort is stable.
+
+    Args:
+        rows: Iterable of rows, lists of strings without tabs and newlines
+        key: Sort key function of a row
+        chunkRows: Maximum number of rows sorted in memory at once
+        tempDir: Directory for the temporary files, the system default
+                 temporary directory is used if None
+        memory: Approximate memory limit of the rows sorted in memory at
+                once in bytes, no limit if None
+    """
+    runs = []
+    runDir = None
+    chunk = []
+    chunkSize = 0
+    try:
+        for row in rows:
+            chunk.append(row)
+            if memory is not None:
+                chunkSize += rowSize(row)
+            if len(chunk) >= chunkRows or \
+                    (memory is not None and chunkSize >= memory):
+                chunk.sort(key=key)
+                if runDir is None:
+                    # Runs left by an interrupted sort are removed with
+                    # the directory
+                    runDir = tempfile.TemporaryDirectory(dir=tempDir)
+                runs.append(spill(chunk, runDir.name))
+                chunk = []
+                chunkSize = 0
+        chunk.sort(key=key)
+
+        if not runs:
+            yield from chunk
+            return
+
+        if chunk:
+            runs.append(spill(chunk, runDir.name))
+        del chunk
+        runs = mergeRuns(runs, key, runDir.name)
+        # Merge takes equal rows from earlier runs first, which keeps the
+        # sort stable
+        yield from heapq.merge(*[readRun(run) for run in runs], key=key)
+    finally:
+        if runDir is not None:
+            runDir.cleanup()
+
+
+def sortFile(fileName, key=coordinateKey, memory=DEFAULT_MEMORY_MB * 2**20,
+             tempDir=None, keysFile=None):
+    """Sort lines of a tab separated file in place. If keysFile is given,
+    its lines are sorted along with the lines of the file. The lines of
+    keysFile, such as row numbers, must not contain tabs. A compressed file
+    is sorted into a file with the same compression."""
+    sortedName = fileName + ".sorting"
+    compression = CompressedFiles.outputCompression(fileName)
+    with CompressedFiles.openFile(fileName) as f:
+        rows = (line.rstrip("\n").split("\t") for line in f)
+        if keysFile is None:
+            with CompressedFiles.openFile(sortedName, "w",
+                                          compression) as output:
+                for row in sortRows(rows, key, sys.maxsize, tempDir, memory):
+                    output.write("\t".join(row) + "\n")
+        else:
+            # Each key is sorted as an extra column of its row
+            with open(keysFile) as keys, \
+                    CompressedFiles.openFile(sortedName, "w",
+                                             compression) as output, \
+                    open(keysFile + ".sorting", "w") as keysOutput:
+                keyedRows = (row + [keyLine.rstrip("\n")]
+                             for row, keyLine in zip(rows, keys))
+                for row in sortRows(keyedRows, lambda row: key(row[:-1]),
+                                    sys.maxsize, tempDir, memory):
+                    keysOutput.write(row.pop() + "\n")
+                    output.write("\t".join(row) + "\n")
+            os.replace(keysFile + ".sorting", keysFile)
+    os.replace(sortedName, fileName)
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# ==============================================================
+# Tomas Bruna
+#
+# Parsing of gff attributes (the 9th column) shared by all scripts.
+#
+# An attribute "att" is matched the same way as re.search(att + '=([^;]+)')
+# would match it, the regular expressions are just compiled only once.
+# ==============================================================
+
+
+import re
+
+
+gffPatterns = {}
+
+
+def gffPattern(att):
+    pattern = gffPatterns.get(att)
+    if pattern is None:
+        pattern = re.compile(att + '=([^;]+)')
+        gffPatterns[att] = pattern
+    return pattern
+
+
+def extract(text, att):
+    """Return the value of a gff attribute or None if it is missing."""
+    result = gffPattern(att).search(text)
+    if result:
+        return result.group(1)
+    else:
+        return None
+
+
+class Attributes():
+    """Lazy view of gff attributes of a single row. Each attribute is
+    extracted on its first access and cached for the next ones.
+
+    Use get() for optional attributes and [] for required attributes.
+    """
+
+    __slots__ = ("text", "values")
+
+    def __init__(self, text):
+        self.text = text
+        self.values = {}
+
+    def get(self, att):
+        values = self.values
+        if att in values:
+            return values[att]
+        pattern = gffPatterns.get(att)
+        if pattern is None:
+            pattern = gffPattern(att)
+        result = pattern.search(self.text)
+        value = result.group(1) if result else None
+        values[att] = value
+        return value
+
+    def __getitem__(self, att):
+        value = self.get(att)
+        if value is None:
+            raise KeyError(f'Attribute "{att}" is missing in: {self.text}')
+        return value
+
+    def __contains__(self, att):
+        return self.get(att) is not None
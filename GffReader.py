@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# ==============================================================
+# Tomas Bruna
+#
+# Fast reading of tab-separated gff/gtf rows shared by all scripts.
+#
+# Plain files are memory-mapped and processed in chunks of whole lines as
+# bytes. When only some feature types are requested, their rows are found
+# by a regular expression search over the chunk, the other rows are never
+# decoded or split. The rows are the same as csv.reader(f, delimiter='\t')
+# returns. Inputs which need the csv parsing (quotes, CR line ends) and
+# inputs which cannot be mapped (stdin, compressed files) are read with
+# csv.reader.
+# ==============================================================
+
+
+import csv
+import mmap
+import re
+import CompressedFiles
+
+
+CHUNK_SIZE = 1 << 22
+
+
+def mapFile(fileName):
+    """Return a read-only memory map of a plain file or None if the file
+    cannot be mapped."""
+    if CompressedFiles.isStdin(fileName) or \
+            CompressedFiles.isCompressed(fileName):
+        return None
+    with open(fileName, "rb") as f:
+        try:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty file
+            return None
+
+
+def isPlainText(data):
+    """Check that splitting lines by tabs gives the same rows as the csv
+    reader."""
+    return data.find(b'"') == -1 and data.find(b'\r') == -1
+
+
+def chunks(data):
+    """Yield chunks of whole lines of a memory-mapped file. The last line
+    always ends with a new line."""
+    size = len(data)
+    position = 0
+    while position < size:
+        end = data.find(b'\n', min(position + CHUNK_SIZE, size) - 1)
+        if end == -1:
+            yield data[position:] + b'\n'
+            return
+        yield data[position:end + 1]
+        position = end + 1
+
+
+def featurePattern(features, ignoreCase):
+    """Return a pattern matching lines, preceded by a new line, with the
+    feature types in the third column."""
+    alternatives = b'|'.join(re.escape(feature.encode())
+                             for feature in sorted(features))
+    return re.compile(rb'\n([^\t\n]*\t[^\t\n]*\t(?:' + alternatives +
+                      rb')(?:\t[^\n]*)?)(?=\n)',
+                      re.IGNORECASE if ignoreCase else 0)
+
+
+def splitLines(data):
+    for chunk in chunks(data):
+        lines = chunk.decode().split("\n")
+        lines.pop()
+        for line in lines:
+            # The csv reader returns empty rows for empty lines
+            yield line.split("\t") if line else []
+
+
+def findFeatures(data, features, ignoreCase):
+    pattern = featurePattern(features, ignoreCase)
+    for chunk in chunks(data):
+        # The chunk starts with a line, the pattern needs a new line
+        # before it
+        for line in pattern.findall(b'\n' + chunk):
+            yield line.decode().split("\t")
+
+
+def parseRows(fileName, features, ignoreCase):
+    with CompressedFiles.openFile(fileName) as f:
+        for row in csv.reader(f, delimiter='\t'):
+            if features is None:
+                yield row
+            elif len(row) > 2:
+                featureType = row[2].lower() if ignoreCase else row[2]
+                if featureType in features:
+                    yield row
+
+
+def readRows(fileName, features=None, ignoreCase=False):
+    """Yield rows of a gff file.
+
+    Args:
+        fileName: Name of the file, may be compressed. "-" reads stdin.
+        features: Feature types (the third column) of the yielded rows. All
+                  rows are yielded if None.
+        ignoreCase: Match the feature types case-insensitively, features
+                    must then be given in lowercase. The rows keep the
+                    original case.
+    """
+    if features is not None:
+        features = set(features)
+    data = mapFile(fileName)
+    if data is not None and not isPlainText(data):
+        data.close()
+        data = None
+    if data is None:
+        yield from parseRows(fileName, features, ignoreCase)
+        return
+    with data:
+        if features is None:
+            yield from splitLines(data)
+        elif features:
+            yield from findFeatures(data, features, ignoreCase)
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# ==============================================================
+# Tomas Bruna
+#
+# Compact representation of proteins supporting collapsed hints.
+#
+# The "prots=P1,P2,...;" attribute of collapsed hints is replaced by a
+# reference "protSet=N;" to a list of proteins saved in a binary sidecar
+# file. Protein IDs are interned to integers and identical protein lists
+# are saved only once. The sidecar contains:
+#   proteins    Interned protein IDs
+#   setOffsets  Proteins of set N are setMembers[setOffsets[N]:
+#               setOffsets[N + 1]]
+#   setMembers  Indices of proteins of all sets
+# ==============================================================
+
+
+import sys
+from array import array
+import BinaryContainer
+
+
+MAGIC = b'MPHPROTS'
+FORMAT_NAME = "protein support"
+
+PROTS = " prots="
+REFERENCE = " protSet="
+
+
+def attributeSpan(attributes, prefix):
+    """Return the start of an attribute starting with prefix and the end of
+    its value, the position of the terminating ";". Start is -1 if the
+    attribute is missing."""
+    start = attributes.find(prefix)
+    if start < 0:
+        return -1, -1
+    end = attributes.find(";", start)
+    if end < 0:
+        end = len(attributes)
+    return start, end
+
+
+class ProteinSupport():
+    """Interned proteins and protein sets of collapsed hints."""
+
+    def __init__(self):
+        self.proteins = []
+        self.proteinIds = {}
+        self.setIds = {}
+        self.setOffsets = array('q', [0])
+        self.setMembers = array('i')
+
+    def add(self, prots):
+        """Return the index of a list of protein IDs, the list is saved if
+        it is new."""
+        proteinIds = self.proteinIds
+        members = []
+        for prot in prots:
+            proteinId = proteinIds.get(prot)
+            if proteinId is None:
+                proteinId = len(self.proteins)
+                proteinIds[prot] = proteinId
+                self.proteins.append(prot)
+            members.append(proteinId)
+
+        members = tuple(members)
+        setId = self.setIds.get(members)
+        if setId is None:
+            setId = len(self.setIds)
+            self.setIds[members] = setId
+            self.setMembers.extend(members)
+            self.setOffsets.append(len(self.setMembers))
+        return setId
+
+    def compact(self, attributes):
+        """Replace the prots attribute in the 9th column of a collapsed hint
+        by a protein set reference. Attributes without prots are returned
+        unchanged."""
+        start, end = attributeSpan(attributes, PROTS)
+        if start < 0:
+            return attributes
+        setId = self.add(attributes[start + len(PROTS):end].split(","))
+        return f'{attributes[:start]}{REFERENCE}{setId}{attributes[end:]}'
+
+    def compactLine(self, line):
+        fields = line.rstrip("\n").split("\t")
+        if len(fields) != 9:
+            return line
+        fields[8] = self.compact(fields[8])
+        return "\t".join(fields) + "\n"
+
+    def save(self, fileName):
+        BinaryContainer.write(fileName, {"proteins": self.proteins},
+                              {"setOffsets": self.setOffsets,
+                               "setMembers": self.setMembers}, MAGIC)
+
+
+class SupportFile():
+    """Memory-mapped protein sets saved by ProteinSupport.save."""
+
+    def __init__(self, fileName):
+        strings, arrays = BinaryContainer.read(fileName, MAGIC, FORMAT_NAME)
+        self.fileName = fileName
+        self.proteins = strings["proteins"]
+        self.setOffsets = arrays["setOffsets"]
+        self.setMembers = arrays["setMembers"]
+
+    def __len__(self):
+        return len(self.setOffsets) - 1
+
+    def proteinsOf(self, setId):
+        proteins = self.proteins
+        return [proteins[i] for i in
+                self.setMembers[self.setOffsets[setId]:
+                                self.setOffsets[setId + 1]]]
+
+    def expand(self, attributes):
+        """Replace a protein set reference in the 9th column by the
+        original prots attribute."""
+        start, end = attributeSpan(attributes, REFERENCE)
+        if start < 0:
+            return attributes
+        setId = int(attributes[start + len(REFERENCE):end])
+        if setId >= len(self):
+            sys.exit(f'error: Protein set {setId} is not in {self.fileName}, '
+                     'the hints do not match the protein file.')
+        return f'{attributes[:start]}{PROTS}' \
+            f'{",".join(self.proteinsOf(setId))}{attributes[end:]}'
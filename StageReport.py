@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# ==============================================================
+# Tomas Bruna
+#
+# Instrumentation of pipeline stages.
+#
+# For each measured stage, the wall time, the CPU time (including finished
+# child processes), the peak RSS of the process after the stage and its
+# growth during the stage are recorded, together with counts such as the
+# numbers of input and output rows. Stages can be nested, the times of a
+# stage include its nested stages. Optionally, each top-level stage is
+# profiled with cProfile.
+# ==============================================================
+
+
+import contextlib
+import cProfile
+import json
+import os
+import resource
+import time
+
+
+REPORT_VERSION = 1
+
+
+def peakRss():
+    """Return the peak RSS of the process in MB."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def cpuTime():
+    times = os.times()
+    return times.user + times.system + times.children_user + \
+        times.children_system
+
+
+def sizeDistribution(sizes):
+    """Return summary statistics and a histogram with power of two bins
+    of a list of sizes."""
+    sizes = sorted(sizes)
+    if not sizes:
+        return {"count": 0}
+    histogram = {}
+    for size in sizes:
+        low = 1 << (size.bit_length() - 1) if size > 0 else 0
+        high = max(2 * low - 1, low)
+        label = str(low) if low == high else f'{low}-{high}'
+        histogram[label] = histogram.get(label, 0) + 1
+    return {"count": len(sizes),
+            "min": sizes[0],
+            "median": sizes[len(sizes) // 2],
+            "mean": round(sum(sizes) / len(sizes), 2),
+            "max": sizes[-1],
+            "histogram": histogram}
+
+
+class StageReport():
+
+    def __init__(self, profileDir=None):
+        """
+        Args:
+            profileDir: If given, a cProfile dump of each top-level stage is
+                        saved to profileDir/stage.prof
+        """
+        self.profileDir = profileDir
+        # Values saved with the report, such as the input
+        self.values = {}
+        self.stages = []
+        self.active = []
+        self.wall = time.perf_counter()
+        self.cpu = cpuTime()
+
+    @contextlib.contextmanager
+    def measure(self, name):
+        """Measure a stage run in the with block."""
+        entry = {"stage": name}
+        if self.active:
+            entry["parent"] = self.active[-1]["stage"]
+        self.stages.append(entry)
+        self.active.append(entry)
+
+        profiler = None
+        if self.profileDir is not None and len(self.active) == 1:
+            profiler = cProfile.Profile()
+            profiler.enable()
+        rss = peakRss()
+        cpu = cpuTime()
+        wall = time.perf_counter()
+        try:
+            yield entry
+        finally:
+            entry["wallSeconds"] = round(time.perf_counter() - wall, 3)
+            entry["cpuSeconds"] = round(cpuTime() - cpu, 3)
+            peak = peakRss()
+            entry["peakRssMb"] = round(peak, 1)
+            entry["rssGrowthMb"] = round(peak - rss, 1)
+            if profiler is not None:
+                profiler.disable()
+                if not os.path.isdir(self.profileDir):
+                    os.mkdir(self.profileDir)
+                profiler.dump_stats(f'{self.profileDir}/{name}.prof')
+            self.active.pop()
+
+    def record(self, **values):
+        """Save counts, such as inputRows and outputRows, to the innermost
+        measured stage."""
+        if self.active:
+            self.active[-1].update(values)
+
+    def skip(self, name):
+        self.stages.append({"stage": name, "skipped": True})
+
+    def summary(self):
+        """Return the report with the overall time and memory."""
+        report = {"version": REPORT_VERSION,
+                  "wallSeconds": round(time.perf_counter() - self.wall, 3),
+                  "cpuSeconds": round(cpuTime() - self.cpu, 3),
+                  "peakRssMb": round(peakRss(), 1)}
+        report.update(self.values)
+        report["stages"] = self.stages
+        return report
+
+    def save(self, fileName):
+        with open(fileName + ".tmp", "w") as f:
+            json.dump(self.summary(), f, indent=2)
+        os.replace(fileName + ".tmp", fileName)
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# ==============================================================
+# Tomas Bruna
+#
+# Microbenchmark of gff attribute parsing. Compares the per-call regex
+# extraction used by the scripts before (a pattern is built from a string
+# on each call) with the shared GffAttributes module. The attribute access
+# pattern of print_high_confidence.Filter.decide for introns and of
+# collapseGff.Feature is replayed on synthetic rows.
+# ==============================================================
+
+
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import GffAttributes  # noqa: E402
+
+
+FILTER_ATTRIBUTES = ["al_score", "fullProteinAligned", "topProt",
+                     "splice_sites", "ReScore", "LeScore"]
+COLLAPSE_ATTRIBUTES = ["prot", "al_score", "splice_sites"]
+
+
+def legacyExtract(text, feature):
+    regex = feature + '=([^;]+)'
+    search = re.search(regex, text)
+    if search:
+        return search.groups()[0]
+    else:
+        return None
+
+
+def generateAttributes(n, seed):
+    rng = random.Random(seed)
+    texts = []
+    for i in range(n):
+        texts.append(f'Parent=MP{i:06d};prot={i}_0:{i:06x};'
+                     f'al_score={rng.random():.4f};'
+                     f'LeScore={rng.randint(-10, 150)};'
+                     f'ReScore={rng.randint(-10, 150)};'
+                     f'splice_sites=gt_ag')
+    return texts
+
+
+def legacy(texts, attributes):
+    for text in texts:
+        for att in attributes:
+            legacyExtract(text, att)
+
+
+def shared(texts, attributes):
+    for text in texts:
+        view = GffAttributes.Attributes(text)
+        for att in attributes:
+            view.get(att)
+
+
+def measure(function, texts, attributes, repeats):
+    best = None
+    for i in range(repeats):
+        start = time.perf_counter()
+        function(texts, attributes)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return len(texts) / best
+
+
+def main():
+    args = parseCmd()
+    texts = generateAttributes(args.rows, args.seed)
+    print("\t".join(["access_pattern", "before_rows_per_s",
+                     "after_rows_per_s", "speedup"]))
+    for name, attributes in [("Filter.decide", FILTER_ATTRIBUTES),
+                             ("collapseGff.Feature", COLLAPSE_ATTRIBUTES)]:
+        before = measure(legacy, texts, attributes, args.repeats)
+        after = measure(shared, texts, attributes, args.repeats)
+        print("\t".join([name, str(round(before)), str(round(after)),
+                         str(round(after / before, 2))]))
+
+
+def parseCmd():
+
+    parser = argparse.ArgumentParser(description='Microbenchmark of gff \
+        attribute parsing before and after the introduction of the shared \
+        GffAttributes module.')
+
+    parser.add_argument('--rows', type=int, default=200000,
+                        help='Number of synthetic rows.')
+    parser.add_argument('--repeats', type=int, default=3,
+                        help='Report the best of this many repeats.')
+    parser.add_argument('--seed', type=int, default=1,
+                        help='Random seed.')
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# ==============================================================
+# Tomas Bruna
+#
+# Benchmark of the CDS overlap counting of starts. Compares the previous
+# sweep over sorted inputs, which rescans the CDS list from a pointer for
+# every start, with the binary search over sorted CDS starts and ends in
+# count_cds_overlaps. Synthetic CDS segments are generated in sorted order,
+# as required by the sweep, and streamed to both implementations. A small
+# fraction of the segments is long, see --longFraction.
+# ==============================================================
+
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import count_cds_overlaps  # noqa: E402
+
+
+class CDS:
+
+    def __init__(self, start, end, coverage):
+        self.start = start
+        self.end = end
+        self.coverage = coverage
+
+
+def legacyFilterStarts(starts, cdses):
+    codingSegments = {}
+    for row in cdses:
+        if not row[0] in codingSegments:
+            codingSegments[row[0]] = []
+        coverage = 1
+        if row[5] != ".":
+            coverage = int(row[5])
+        codingSegments[row[0]].append(CDS(int(row[3]), int(row[4]),
+                                          coverage))
+
+    prevChromosome = ""
+    CDSpointer = 0
+    CDSNum = 0
+    for start in starts:
+        chrom = start[0]
+        startStart = int(start[3])
+        startEnd = int(start[4])
+        if prevChromosome != chrom:
+            CDSpointer = 0
+            CDSNum = len(codingSegments[chrom])
+        while (CDSpointer < CDSNum and
+               codingSegments[chrom][CDSpointer].end <= startEnd):
+            CDSpointer += 1
+        startOverlaps = 0
+        i = CDSpointer
+        while i < CDSNum and codingSegments[chrom][i].start < startStart:
+            if (codingSegments[chrom][i].start < startStart
+               and codingSegments[chrom][i].end > startEnd):
+                startOverlaps += codingSegments[chrom][i].coverage
+            i += 1
+        start[8] = "CDS_overlap=" + str(startOverlaps) + ";"
+        yield start
+        prevChromosome = chrom
+
+
+def contigLength(args):
+    return args.cds // args.contigs * args.spacing
+
+
+def generateCDS(args):
+    """Yield CDS rows sorted by contig, start and end."""
+    rng = random.Random(args.seed)
+    perContig = args.cds // args.contigs
+    length = contigLength(args)
+    for c in range(args.contigs):
+        contig = f'contig{c:04d}'
+        starts = sorted(rng.randrange(1, length) for i in range(perContig))
+        rows = []
+        for start in starts:
+            if rng.random() < args.longFraction:
+                end = start + rng.randint(args.maxLength, args.longLength)
+            else:
+                end = start + rng.randint(3, args.maxLength)
+            rows.append((start, end))
+        rows.sort()
+        for start, end in rows:
+            yield [contig, "miniprot", "CDS", str(start), str(end),
+                   str(rng.randint(1, 5)), "+", "0", "."]
+
+
+def generateStarts(args):
+    """Return start codon rows sorted by contig and start."""
+    rng = random.Random(args.seed + 1)
+    length = contigLength(args)
+    starts = []
+    for c in range(args.contigs):
+        contig = f'contig{c:04d}'
+        for position in sorted(rng.randrange(1, length)
+                               for i in range(args.starts // args.contigs)):
+            starts.append([contig, "miniprot", "start_codon", str(position),
+                           str(position + 2), "1", "+", "0", "."])
+    return starts
+
+
+def measure(function, args):
+    starts = generateStarts(args)
+    start = time.perf_counter()
+    result = [row[8] for row in function(starts, generateCDS(args))]
+    return time.perf_counter() - start, result
+
+
+def main():
+    args = parseCmd()
+    generation = time.perf_counter()
+    for row in generateCDS(args):
+        pass
+    generation = time.perf_counter() - generation
+
+    before, expected = measure(legacyFilterStarts, args)
+    after, result = measure(count_cds_overlaps.filterStarts, args)
+    if result != expected:
+        sys.exit('error: The overlap counts differ.')
+
+    print("\t".join(["cds", "starts", "generation_s", "before_s", "after_s",
+                     "speedup"]))
+    # Generation of the CDS rows is included in both times, it is
+    # subtracted for the speedup
+    print("\t".join([str(args.cds), str(args.starts),
+                     f'{generation:.2f}', f'{before:.2f}', f'{after:.2f}',
+                     str(round((before - generation) /
+                               max(after - generation, 1e-9), 2))]))
+
+
+def parseCmd():
+
+    parser = argparse.ArgumentParser(description='Benchmark of the CDS \
+        overlap counting of starts before and after the binary search \
+        index in count_cds_overlaps.')
+
+    parser.add_argument('--cds', type=int, default=10000000,
+                        help='Number of synthetic CDS segments.')
+    parser.add_argument('--starts', type=int, default=100000,
+                        help='Number of synthetic start codons.')
+    parser.add_argument('--contigs', type=int, default=100,
+                        help='Number of contigs.')
+    parser.add_argument('--spacing', type=int, default=50,
+                        help='Average distance between CDS starts.')
+    parser.add_argument('--maxLength', type=int, default=3000,
+                        help='Maximum CDS length.')
+    parser.add_argument('--longFraction', type=float, default=0.0001,
+                        help='Fraction of long CDS segments, such as \
+        alignments spanning large introns. A long CDS stops the pointer of \
+        the sweep, all later CDS are rescanned for each start until its \
+        end.')
+    parser.add_argument('--longLength', type=int, default=200000,
+                        help='Maximum length of long CDS segments.')
+    parser.add_argument('--seed', type=int, default=1,
+                        help='Random seed.')
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+# ==============================================================
+# Tomas Bruna
+#
+# Generate a synthetic miniprot boundary scorer output for benchmarks.
+# Every locus carries one true gene structure and a cluster of protein
+# alignments, which reproduce the structure with random noise (shifted
+# borders, missing terminal exons, partial alignments). Proteins are drawn
+# from a pool of --proteins, so a protein aligns to several loci, as
+# members of gene families do.
+# ==============================================================
+
+
+import argparse
+import io
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import CompressedFiles  # noqa: E402
+
+
+SPLICE_SITES = ['gt_ag', 'gc_ag', 'at_ac', 'ct_ac']
+SPLICE_SITE_WEIGHTS = [0.9, 0.05, 0.03, 0.02]
+
+
+class Gene():
+
+    def __init__(self, contig, strand, start, exonNum, rng):
+        self.contig = contig
+        self.strand = strand
+        self.exons = []
+        position = start
+        for i in range(exonNum):
+            length = rng.randint(60, 400)
+            self.exons.append((position, position + length - 1))
+            position += length + rng.randint(50, 1500)
+        self.end = self.exons[-1][1]
+
+
+def mutateExons(gene, rng):
+    """Return noisy exons of an alignment to the gene and whether the
+    alignment includes the first and the last exon."""
+    exons = list(gene.exons)
+    first = 0
+    last = len(exons)
+    if rng.random() < 0.3 and len(exons) > 1:
+        first = rng.randint(0, len(exons) // 2)
+    if rng.random() < 0.3 and len(exons) > first + 1:
+        last = rng.randint(first + 1, len(exons))
+    mutated = []
+    for start, end in exons[first:last]:
+        if rng.random() < 0.15:
+            start += rng.choice([-9, -6, -3, 3, 6, 9])
+        if rng.random() < 0.15:
+            end += rng.choice([-9, -6, -3, 3, 6, 9])
+        if end - start < 10:
+            end = start + 10
+        mutated.append((start, end))
+    return mutated, first == 0, last == len(gene.exons)
+
+
+def formatFraction(value):
+    return f'{value:.4f}'.rstrip('0').rstrip('.') if value else '0'
+
+
+def row(contig, feature, start, end, score, strand, phase, attributes):
+    return '\t'.join([contig, 'miniprot', feature, str(start), str(end),
+                      str(score), strand, phase, attributes]) + '\n'
+
+
+def writeAlignment(output, gene, alignmentId, protein, exons, hasStart,
+                   hasStop, rng):
+    contig = gene.contig
+    strand = gene.strand
+    start = exons[0][0]
+    end = exons[-1][1]
+    identity = rng.uniform(0.2, 1)
+    if hasStart and hasStop:
+        coverage = rng.uniform(0.85, 1)
+    else:
+        coverage = rng.uniform(0.3, 1)
+    ID = f'MP{alignmentId:07d}'
+    topProt = ';topProt=TRUE' if rng.random() < 0.05 else ''
+    output.write(row(contig, 'mRNA', start, end, rng.randint(50, 3000),
+                     strand, '.',
+                     f'ID={ID};Rank=1;Identity={formatFraction(identity)};'
+                     f'Positive={formatFraction(min(1, identity + 0.1))};'
+                     f'Target={protein} 1 {rng.randint(100, 900)};'
+                     f'prot={protein};qcov={formatFraction(coverage)}'))
+
+    ordered = exons if strand == '+' else list(reversed(exons))
+    for i, (exonStart, exonEnd) in enumerate(ordered):
+        output.write(row(contig, 'CDS', exonStart, exonEnd,
+                         rng.randint(-20, 150), strand, '0',
+                         f'Parent={ID};prot={protein};'
+                         f'eScore={rng.randint(-20, 150)}'))
+        if i + 1 == len(ordered):
+            continue
+        if strand == '+':
+            intronStart, intronEnd = exonEnd + 1, ordered[i + 1][0] - 1
+        else:
+            intronStart, intronEnd = ordered[i + 1][1] + 1, exonStart - 1
+        if intronEnd <= intronStart:
+            continue
+        splice = rng.choices(SPLICE_SITES, SPLICE_SITE_WEIGHTS)[0]
+        output.write(row(contig, 'intron', intronStart, intronEnd, '.',
+                         strand, '.',
+                         f'Parent={ID};prot={protein};'
+                         f'al_score={formatFraction(rng.uniform(0, 1))};'
+                         f'LeScore={rng.randint(-10, 150)};'
+                         f'ReScore={rng.randint(-10, 150)};'
+                         f'splice_sites={splice}{topProt}'))
+
+    if hasStart:
+        codon = (start, start + 2) if strand == '+' else (end - 2, end)
+        output.write(row(contig, 'start_codon', codon[0], codon[1], '.',
+                         strand, '0',
+                         f'Parent={ID};prot={protein};'
+                         f'al_score={formatFraction(rng.uniform(0, 1))};'
+                         f'eScore={rng.randint(-10, 150)}{topProt}'))
+    if hasStop or rng.random() < 0.2:
+        codon = (end + 1, end + 3) if strand == '+' else (start - 3, start - 1)
+        output.write(row(contig, 'stop_codon', codon[0], codon[1], '.',
+                         strand, '0',
+                         f'Parent={ID};prot={protein};'
+                         f'al_score={formatFraction(rng.uniform(0, 1))};'
+                         f'eScore={rng.randint(-10, 150)};'
+                         f'proteinEnd={int(hasStop)}{topProt}'))
+
+
+def generate(output, proteins=10000, loci=2000, depth=20, exons=8,
+             contigs=10, seed=1, sortedOutput=False):
+    """Write a synthetic miniprot boundary scorer output.
+
+    Args:
+        output: Output file handle
+        proteins: Size of the protein pool the alignments are drawn from
+        loci: Number of loci, distributed evenly among the contigs
+        depth: Average number of alignments in a locus cluster
+        exons: Maximum number of exons of a gene
+        contigs: Number of contigs
+        seed: Random seed
+        sortedOutput: Write alignments in the order of loci. By default,
+                      alignments are shuffled, as in the miniprot output
+                      ordered by proteins.
+    """
+    rng = random.Random(seed)
+    blocks = []
+    alignmentId = 0
+    positions = [rng.randint(1000, 5000) for c in range(contigs)]
+    for locus in range(loci):
+        c = locus % contigs
+        gene = Gene(f'chr{c + 1}', rng.choice(['+', '-']), positions[c],
+                    rng.randint(1, exons), rng)
+        positions[c] = max(gene.end + rng.randint(-2000, 20000), 1)
+        for i in range(max(1, round(rng.gauss(depth, depth / 3)))):
+            alignmentId += 1
+            p = rng.randrange(proteins)
+            exonsAligned, hasStart, hasStop = mutateExons(gene, rng)
+            block = io.StringIO()
+            writeAlignment(block, gene, alignmentId, f'{p}_0:{p:06x}',
+                           exonsAligned, hasStart, hasStop, rng)
+            blocks.append(block.getvalue())
+    if not sortedOutput:
+        rng.shuffle(blocks)
+    for block in blocks:
+        output.write(block)
+    return alignmentId
+
+
+def main():
+    args = parseCmd()
+    parameters = dict(proteins=args.proteins, loci=args.loci,
+                      depth=args.depth, exons=args.exons,
+                      contigs=args.contigs, seed=args.seed,
+                      sortedOutput=args.sorted)
+    if args.output == '-':
+        generate(sys.stdout, **parameters)
+    else:
+        with CompressedFiles.openFile(args.output, 'w') as output:
+            generate(output, **parameters)
+
+
+def parseCmd():
+
+    parser = argparse.ArgumentParser(description='Generate a synthetic \
+        miniprot boundary scorer output for benchmarks.',
+                                     formatter_class=argparse.
+                                     ArgumentDefaultsHelpFormatter)
+
+    parser.add_argument('output', type=str,
+                        help='Output gff, "-" for stdout. The output is \
+        compressed if the name ends with .gz or .zst.')
+    parser.add_argument('--proteins', type=int, default=10000,
+                        help='Size of the protein pool.')
+    parser.add_argument('--loci', type=int, default=2000,
+                        help='Number of loci.')
+    parser.add_argument('--depth', type=int, default=20,
+                        help='Average number of alignments per locus.')
+    parser.add_argument('--exons', type=int, default=8,
+                        help='Maximum number of exons per gene.')
+    parser.add_argument('--contigs', type=int, default=10,
+                        help='Number of contigs.')
+    parser.add_argument('--seed', type=int, default=1,
+                        help='Random seed.')
+    parser.add_argument('--sorted', action='store_true',
+                        help='Write alignments in the order of loci instead \
+        of shuffling them.')
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# ==============================================================
+# Tomas Bruna
+#
+# Benchmark of the raw row throughput of gff reading. Compares
+# csv.reader over a text file, filtered by the feature type in Python as
+# the scripts did before, with the memory-mapped GffReader. The feature
+# selections of the main consumers are replayed on a large miniprot
+# boundary scorer output, a synthetic one from generateMiniprot.py by
+# default.
+# ==============================================================
+
+
+import argparse
+import csv
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import generateMiniprot  # noqa: E402
+import GffReader  # noqa: E402
+
+
+# Consumer, feature types (None for all rows) and case-insensitive matching
+SELECTIONS = [("all rows", None, False),
+              ("collapseGff.loadData", {"intron", "start_codon", "cds",
+                                        "start", "stop_codon", "stop"},
+               True),
+              ("cds_with_upstream_support.loadHints",
+               {"intron", "start_codon"}, True),
+              ("visualizeMiniprothint.plotScores", {"intron"}, True),
+              ("scorer2gtf.loadStopCodons", {"stop_codon"}, False)]
+
+
+def csvRows(fileName, features, ignoreCase):
+    with open(fileName) as f:
+        for row in csv.reader(f, delimiter='\t'):
+            if features is None:
+                yield row
+            elif (row[2].lower() if ignoreCase else row[2]) in features:
+                yield row
+
+
+def measure(rows, fileName, features, ignoreCase, repeats):
+    """Return the best time of reading the file and the number of
+    yielded rows."""
+    best = None
+    for i in range(repeats):
+        start = time.perf_counter()
+        count = 0
+        for row in rows(fileName, features, ignoreCase):
+            count += 1
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, count
+
+
+def main():
+    args = parseCmd()
+    fileName = args.input
+    if fileName is None:
+        handle, fileName = tempfile.mkstemp(suffix='.gff')
+        with os.fdopen(handle, "w") as output:
+            generateMiniprot.generate(output, loci=args.loci)
+    with open(fileName) as f:
+        inputRows = sum(1 for line in f)
+
+    print("\t".join(["consumer", "rows", "csv_rows_per_s",
+                     "GffReader_rows_per_s", "speedup"]))
+    for name, features, ignoreCase in SELECTIONS:
+        before, count = measure(csvRows, fileName, features, ignoreCase,
+                                args.repeats)
+        after, readCount = measure(GffReader.readRows, fileName, features,
+                                   ignoreCase, args.repeats)
+        if count != readCount:
+            sys.exit(f'error: Different numbers of rows read for {name}.')
+        print("\t".join([name, str(count), str(round(inputRows / before)),
+                         str(round(inputRows / after)),
+                         str(round(before / after, 2))]))
+
+    if args.input is None:
+        os.remove(fileName)
+
+
+def parseCmd():
+
+    parser = argparse.ArgumentParser(description='Benchmark of the raw row \
+        throughput of csv.reader and GffReader.')
+
+    parser.add_argument('input', type=str, nargs='?',
+                        help='Uncompressed miniprot boundary scorer output. \
+        By default, a synthetic one is generated.')
+    parser.add_argument('--loci', type=int, default=20000,
+                        help='Number of loci of the synthetic input.')
+    parser.add_argument('--repeats', type=int, default=3,
+                        help='Report the best of this many repeats.')
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# ==============================================================
+# Tomas Bruna
+#
+# Benchmark of the representative selection in a single giant cluster, as
+# produced by tandem gene families. Compares the linear scan of all later
+# alignments for each seed with the interval-indexed seed-child search.
+# ==============================================================
+
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import AlignmentCluster  # noqa: E402
+import AlignmentStore  # noqa: E402
+import selectRepresentativeAlignments  # noqa: E402
+
+
+def buildTandemFamily(genes, depth, exons, seed):
+    """Build a store with a tandem array of genes. Neighboring genes are
+    connected by chimeric alignments, so all alignments form one cluster."""
+    rng = random.Random(seed)
+    store = AlignmentStore.AlignmentStore()
+    position = 1000
+    structures = []
+    for g in range(genes):
+        structure = []
+        for e in range(exons):
+            length = rng.randint(100, 300)
+            structure.append((position, position + length - 1))
+            position += length + rng.randint(100, 500)
+        structures.append(structure)
+        position += rng.randint(200, 2000)
+
+    alignment = 0
+    for g, structure in enumerate(structures):
+        for d in range(depth):
+            blocks = structure
+            if d == 0 and g + 1 < len(structures):
+                # Chimeric alignment bridging two neighboring genes
+                blocks = structure[-1:] + structures[g + 1][:1]
+            i = store.addAlignment(f'MP{alignment:07d}', rng.random(),
+                                   f'prot{alignment}')
+            store.scores[i] = rng.randint(50, 3000)
+            store.identities[i] = rng.random()
+            for start, end in blocks:
+                shift = rng.choice([0, 0, 0, -3, 3])
+                store.addExon(i, "chr1", start + shift, end, "+")
+            alignment += 1
+    store.sortExons()
+    return store
+
+
+def select(store, indexed):
+    if indexed:
+        AlignmentCluster.MIN_INDEXED_CLUSTER_SIZE = 32
+    else:
+        AlignmentCluster.MIN_INDEXED_CLUSTER_SIZE = sys.maxsize
+    clusters = selectRepresentativeAlignments.clusterAlignments(store)
+    start = time.perf_counter()
+    selected = []
+    for cluster in clusters.values():
+        selected += cluster.splitByBestAlignments(0.01, 0.5, 0, 10, 0.8, 0.9)
+    return time.perf_counter() - start, len(clusters), selected
+
+
+def main():
+    args = parseCmd()
+    print("\t".join(["alignments", "clusters", "linear_s", "indexed_s",
+                     "speedup", "same_selection"]))
+    for genes in args.genes:
+        store = buildTandemFamily(genes, args.depth, args.exons, args.seed)
+        linear, clusterCount, selectedLinear = select(store, False)
+        indexed, clusterCount, selectedIndexed = select(store, True)
+        print("\t".join([str(len(store)), str(clusterCount),
+                         f'{linear:.3f}', f'{indexed:.3f}',
+                         f'{linear / indexed:.1f}',
+                         str(selectedLinear == selectedIndexed)]))
+
+
+def parseCmd():
+
+    parser = argparse.ArgumentParser(description='Benchmark of the \
+        representative selection in a synthetic giant cluster.')
+
+    parser.add_argument('--genes', type=int, nargs='+',
+                        default=[50, 200, 800],
+                        help='Numbers of genes in the tandem family.')
+    parser.add_argument('--depth', type=int, default=25,
+                        help='Alignments per gene.')
+    parser.add_argument('--exons', type=int, default=4,
+                        help='Exons per gene.')
+    parser.add_argument('--seed', type=int, default=1,
+                        help='Random seed.')
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    main()
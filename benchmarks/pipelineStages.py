@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+# ==============================================================
+# Tomas Bruna
+#
+# Benchmark suite of the main processing stages on a synthetic miniprot
+# boundary scorer output generated by generateMiniprot.py (or on a given
+# input). Each stage runs in a fresh process, which prepares the stage
+# inputs and then measures the wall time, CPU time and peak RSS of the
+# stage itself. Results are printed as a table and saved to a JSON file,
+# which can be given to --compare in a later run of another version.
+# ==============================================================
+
+
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import collapseGff  # noqa: E402
+import CompressedFiles  # noqa: E402
+import count_cds_overlaps  # noqa: E402
+import generateMiniprot  # noqa: E402
+import print_high_confidence  # noqa: E402
+import scorer2gtf  # noqa: E402
+import selectRepresentativeAlignments  # noqa: E402
+
+
+# Thresholds of the first, relaxed selection of hints in miniprothint
+HINT_THRESHOLDS = '--intronCoverage 0 --startCoverage 0 --stopCoverage 0 ' \
+    '--intronAlignment 0.1 --startAlignment 0.01 --stopAlignment 0.01 ' \
+    '--minExonScore 25 --addAllSpliceSites'
+
+RESULT_COLUMNS = ["wall_s", "cpu_s", "peak_rss_mb", "stage_rss_mb",
+                  "input_rows", "output_rows"]
+
+
+def peakRss():
+    """Return the peak RSS of this process in MB."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class Timer():
+    """Measure the wall time, CPU time and the peak RSS growth of a
+    block."""
+
+    def __enter__(self):
+        self.rss = peakRss()
+        self.cpu = time.process_time()
+        self.wall = time.perf_counter()
+        return self
+
+    def __exit__(self, *exception):
+        self.wall = time.perf_counter() - self.wall
+        self.cpu = time.process_time() - self.cpu
+        self.peakRss = peakRss()
+        self.rss = self.peakRss - self.rss
+
+
+class Files():
+
+    def __init__(self, workDir):
+        self.input = f'{workDir}/input.gff'
+        self.representatives = f'{workDir}/representatives.gff'
+        self.filtered = f'{workDir}/filtered.gff'
+        self.collapsed = f'{workDir}/collapsed.gff'
+        self.gtf = f'{workDir}/input.gtf'
+
+
+def readRows(fileName):
+    with open(fileName) as f:
+        return [line.rstrip("\n").split("\t") for line in f]
+
+
+def countRows(fileName):
+    with open(fileName) as f:
+        return sum(1 for line in f)
+
+
+def writeRows(rows, fileName):
+    with open(fileName, "w") as output:
+        for row in rows:
+            output.write("\t".join(row) + "\n")
+
+
+def selectionArgs(files):
+    return selectRepresentativeAlignments.parseCmd([files.input])
+
+
+def loadGff(files, timer):
+    with timer:
+        ranges = selectRepresentativeAlignments.RowRanges(files.input)
+        store = selectRepresentativeAlignments.loadAlignments(files.input,
+                                                              ranges=ranges)
+    return countRows(files.input), len(store)
+
+
+def clusterAlignments(files, timer):
+    store = selectRepresentativeAlignments.loadAlignments(files.input)
+    with timer:
+        clusters = selectRepresentativeAlignments.clusterAlignments(store)
+    return len(store), len(clusters)
+
+
+def splitByBestAlignments(files, timer):
+    store = selectRepresentativeAlignments.loadAlignments(files.input)
+    clusters = selectRepresentativeAlignments.clusterAlignments(store)
+    with timer:
+        selected = selectRepresentativeAlignments.selectAlignments(
+            clusters.values(), selectionArgs(files), store)
+    return len(store), len(selected)
+
+
+def printSelected(files, timer):
+    ranges = selectRepresentativeAlignments.RowRanges(files.input)
+    store = selectRepresentativeAlignments.loadAlignments(files.input,
+                                                          ranges=ranges)
+    clusters = selectRepresentativeAlignments.clusterAlignments(store)
+    selected = selectRepresentativeAlignments.selectAlignments(
+        clusters.values(), selectionArgs(files), store)
+    del clusters, store
+    with open(files.representatives, "w") as output, timer:
+        ranges.printSelected(selected, output)
+    return countRows(files.input), countRows(files.representatives)
+
+
+def filterDecide(files, timer):
+    rows = readRows(files.representatives)
+    args = print_high_confidence.parseCmd(['-'] + HINT_THRESHOLDS.split())
+    with timer:
+        filtered = list(print_high_confidence.selectHighConfidence(rows,
+                                                                   args))
+    writeRows(filtered, files.filtered)
+    return len(rows), len(filtered)
+
+
+def collapse(files, timer):
+    with timer:
+        collapseGff.collapse(files.filtered, outputFile=files.collapsed)
+    return countRows(files.filtered), countRows(files.collapsed)
+
+
+def countCdsOverlaps(files, timer):
+    starts = [row for row in readRows(files.collapsed)
+              if row[2] == "start_codon"]
+    cds = [row for row in readRows(files.representatives)
+           if row[2] == "CDS"]
+    with timer:
+        starts = list(count_cds_overlaps.filterStarts(starts, cds))
+    return len(starts) + len(cds), len(starts)
+
+
+def exportGtf(files, timer):
+    rows = readRows(files.input)
+    with open(files.gtf, "w") as output, timer:
+        stops = scorer2gtf.loadStopCodons(rows)
+        scorer2gtf.convert(rows, stops, False, output)
+    return len(rows), countRows(files.gtf)
+
+
+# Stages in the order of execution, later stages read the files written
+# by the earlier ones
+STAGES = {"loadGff": loadGff,
+          "clusterAlignments": clusterAlignments,
+          "splitByBestAlignments": splitByBestAlignments,
+          "printSelected": printSelected,
+          "Filter.decide": filterDecide,
+          "collapse": collapse,
+          "count_cds_overlaps": countCdsOverlaps,
+          "scorer2gtf": exportGtf}
+
+
+def runStage(name, workDir):
+    """Run one stage in this process and print its results as JSON."""
+    timer = Timer()
+    inputRows, outputRows = STAGES[name](Files(workDir), timer)
+    print(json.dumps({"stage": name,
+                      "wall_s": round(timer.wall, 3),
+                      "cpu_s": round(timer.cpu, 3),
+                      "peak_rss_mb": round(timer.peakRss, 1),
+                      "stage_rss_mb": round(timer.rss, 1),
+                      "input_rows": inputRows,
+                      "output_rows": outputRows}))
+
+
+def measureStage(name, workDir):
+    process = subprocess.run([sys.executable, os.path.abspath(__file__),
+                              '--stage', name, '--workdir', workDir],
+                             stdout=subprocess.PIPE, text=True)
+    if process.returncode != 0:
+        sys.exit(f'error: Benchmark of stage {name} failed.')
+    return json.loads(process.stdout.splitlines()[-1])
+
+
+def version():
+    """Return the git commit of the benchmarked code, if available."""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                              cwd=os.path.dirname(os.path.abspath(__file__)),
+                              stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL,
+                              text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def prepareInput(args, files):
+    """Generate or copy (and decompress) the input, return a description
+    of it."""
+    if args.input:
+        CompressedFiles.copyFile(args.input, files.input)
+        description = {"file": os.path.abspath(args.input)}
+    else:
+        with open(files.input, "w") as output:
+            alignments = generateMiniprot.generate(
+                output, args.proteins, args.loci, args.depth, args.exons,
+                args.contigs, args.seed)
+        description = {"proteins": args.proteins, "loci": args.loci,
+                       "depth": args.depth, "exons": args.exons,
+                       "contigs": args.contigs, "seed": args.seed,
+                       "alignments": alignments}
+    description["rows"] = countRows(files.input)
+    description["bytes"] = os.path.getsize(files.input)
+    return description
+
+
+def printResults(stages, previous):
+    header = ["stage"] + RESULT_COLUMNS
+    if previous:
+        header += ["previous_wall_s", "wall_ratio"]
+    print("\t".join(header))
+    for stage in stages:
+        line = [stage["stage"]] + [str(stage[column])
+                                   for column in RESULT_COLUMNS]
+        if previous:
+            before = previous.get(stage["stage"])
+            if before is None:
+                line += ["NA", "NA"]
+            else:
+                ratio = stage["wall_s"] / max(before["wall_s"], 1e-3)
+                line += [str(before["wall_s"]), f'{ratio:.2f}']
+        print("\t".join(line))
+
+
+def main():
+    args = parseCmd()
+    if args.stage:
+        runStage(args.stage, args.workdir)
+        return
+
+    previous = None
+    if args.compare:
+        with open(args.compare) as f:
+            previous = {stage["stage"]: stage
+                        for stage in json.load(f)["stages"]}
+
+    workDir = args.workdir or tempfile.mkdtemp(prefix='miniprothint_bench')
+    if not os.path.isdir(workDir):
+        os.mkdir(workDir)
+    files = Files(workDir)
+    results = {"version": version(),
+               "python": platform.python_version(),
+               "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+               "input": prepareInput(args, files),
+               "stages": []}
+    for name in STAGES:
+        results["stages"].append(measureStage(name, workDir))
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    printResults(results["stages"], previous)
+    if not args.workdir:
+        shutil.rmtree(workDir)
+
+
+def parseCmd():
+
+    parser = argparse.ArgumentParser(description='Benchmark of the main \
+        processing stages. Each stage is measured in a separate process, \
+        the results are saved to a JSON file.',
+                                     formatter_class=argparse.
+                                     ArgumentDefaultsHelpFormatter)
+
+    parser.add_argument('--output', type=str, default='pipelineStages.json',
+                        help='JSON file with the results.')
+    parser.add_argument('--compare', type=str,
+                        help='Results of a previous run, e.g., of another \
+        version. The wall time ratios to it are printed.')
+    parser.add_argument('--input', type=str,
+                        help='Benchmark an existing miniprot boundary scorer \
+        output instead of a synthetic one.')
+    parser.add_argument('--workdir', type=str,
+                        help='Directory for the input and the intermediate \
+        files, kept after the run. By default, a temporary directory is \
+        used and removed.')
+
+    generator = parser.add_argument_group('Synthetic input, see \
+        generateMiniprot.py')
+    generator.add_argument('--proteins', type=int, default=10000,
+                           help='Size of the protein pool.')
+    generator.add_argument('--loci', type=int, default=2000,
+                           help='Number of loci.')
+    generator.add_argument('--depth', type=int, default=20,
+                           help='Average number of alignments per locus.')
+    generator.add_argument('--exons', type=int, default=8,
+                           help='Maximum number of exons per gene.')
+    generator.add_argument('--contigs', type=int, default=10,
+                           help='Number of contigs.')
+    generator.add_argument('--seed', type=int, default=1,
+                           help='Random seed.')
+
+    parser.add_argument('--stage', choices=list(STAGES),
+                        help=argparse.SUPPRESS)
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    main()
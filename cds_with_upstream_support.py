@@ -4,59 +4,105 @@
 #
 # This script selects a subset of CDS regions which upstream coordinate is
 # either a start codon in starts.gff or neighbors an intron defined in
-# starts.gff.
+# introns.gff. Starts and introns only support CDS on the same contig and
+# strand.
 # ==============================================================
 
 
-import csv
+import GffReader
 import argparse
 
 
-intronEnds = set()
-starts = set()
+HINT_TYPES = {"intron", "start_codon"}
 
 
-def loadHints(hints):
-    for row in csv.reader(open(hints), delimiter='\t'):
-        if row[2].lower() == "intron":
-            if (row[6] == "+"):
-                intronEnds.add(int(row[4]))
+def loadHints(hints, index=None):
+    """Index upstream coordinates of CDS supported by introns and start
+    codons in hints.
+
+    Args:
+        hints: Rows with start codons and introns
+        index: Index to add the hints to, a new index is created if None
+
+    Returns:
+        Dictionary mapping (contig, strand) to a set of supported CDS
+        upstream coordinates: the CDS start on the + strand and the CDS
+        end on the - strand
+    """
+    if index is None:
+        index = {}
+    for row in hints:
+        featureType = row[2].lower()
+        if featureType == "intron":
+            if row[6] == "+":
+                coordinate = int(row[4]) + 1
             elif row[6] == "-":
-                intronEnds.add(int(row[3]))
-        elif row[2].lower() == "start_codon":
-            if (row[6] == "+"):
-                starts.add(int(row[3]))
-            elif (row[6] == "-"):
-                starts.add(int(row[4]))
-
-    return intronEnds, starts
-
-
-def filterCDS(cds):
-    for row in csv.reader(open(cds), delimiter='\t'):
-        if row[2].lower() == "cds":
-            if (row[6] == "+"):
-                cdsStart = int(row[3])
-                if ((cdsStart - 1) in intronEnds) or (cdsStart in starts):
-                    print("\t".join(row))
+                coordinate = int(row[3]) - 1
+            else:
+                continue
+        elif featureType == "start_codon":
+            if row[6] == "+":
+                coordinate = int(row[3])
             elif row[6] == "-":
-                cdsStart = int(row[4])
-                if ((cdsStart + 1) in intronEnds) or (cdsStart in starts):
-                    print("\t".join(row))
+                coordinate = int(row[4])
+            else:
+                continue
+        else:
+            continue
+
+        supported = index.get((row[0], row[6]))
+        if supported is None:
+            supported = set()
+            index[(row[0], row[6])] = supported
+        supported.add(coordinate)
+
+    return index
+
+
+def filterCDS(cds, index):
+    """Yield CDS rows with an upstream support in the index."""
+    empty = set()
+    for row in cds:
+        if row[2].lower() != "cds":
+            continue
+        if row[6] == "+":
+            upstream = row[3]
+        elif row[6] == "-":
+            upstream = row[4]
+        else:
+            continue
+        if int(upstream) in index.get((row[0], row[6]), empty):
+            yield row
+
+
+def selectSupportedCDS(cds, hints):
+    """Return CDS rows supported by start codons or introns in hints on the
+    same contig and strand.
+
+    Args:
+        cds: CDS rows to be filtered
+        hints: Rows with start codons and introns used in filtering
+    """
+    return list(filterCDS(cds, loadHints(hints)))
 
 
 def main():
     args = parseCmd()
-    loadHints(args.starts)
-    loadHints(args.introns)
-    filterCDS(args.cds)
+    index = loadHints(GffReader.readRows(args.starts, HINT_TYPES,
+                                         ignoreCase=True))
+    loadHints(GffReader.readRows(args.introns, HINT_TYPES, ignoreCase=True),
+              index)
+    for row in filterCDS(GffReader.readRows(args.cds, {"cds"},
+                                            ignoreCase=True), index):
+        print("\t".join(row))
 
 
 def parseCmd():
 
     parser = argparse.ArgumentParser(description='This script selects a subset\
         of CDS regions which upstream coordinate is either a start codon in \
-        starts.gff or neighbors an intron defined in introns.gff.')
+        starts.gff or neighbors an intron defined in introns.gff. Starts and \
+        introns only support CDS on the same contig and strand.')
 
     parser.add_argument('cds', metavar='cds.gff', type=str,
                         help='CDS segments to be filtered')
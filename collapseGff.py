@@ -7,38 +7,55 @@
 
 
 import argparse
-import csv
-import re
+import sys
+import CompressedFiles
+import ExternalSort
+import GffAttributes
+import GffReader
+import ProteinSupport
 
 
-def signature(row):
-    return f'{row[0]}_{row[2]}_{row[3]}_{row[4]}_{row[6]}'
+FEATURE_TYPES = {"intron", "start_codon", "cds", "start", "stop_codon",
+                 "stop"}
 
 
-def extractAttribute(row, feature):
-    regex = feature + '=([^;]+)'
-    return re.search(regex, row[8]).groups()[0]
+def signature(row):
+    return f'{row[0]}_{row[2]}_{row[3]}_{row[4]}_{row[6]}'
 
 
 class Feature:
-    def __init__(self, row):
+    def __init__(self, row, first=0, attributes=None):
+        """
+        Args:
+            row: First row of the feature, it is modified
+            first: Position of the first row of the feature in the input
+            attributes: GffAttributes.Attributes of the row if already
+                        parsed
+        """
         self.row = row
+        self.first = first
         self.count = 1
-        self.prots = [extractAttribute(row, "prot")]
+        if attributes is None:
+            attributes = GffAttributes.Attributes(row[8])
+        self.prots = [attributes["prot"]]
         if row[2] != "cds":
-            self.alScore = float(extractAttribute(row, "al_score"))
+            self.alScore = float(attributes["al_score"])
         if row[2] == "intron":
-            self.spliceSites = extractAttribute(row, "splice_sites")
+            self.spliceSites = attributes["splice_sites"]
         row[8] = ""
 
-    def add(self, row):
+    def add(self, row, attributes=None):
+        if attributes is None:
+            attributes = GffAttributes.Attributes(row[8])
         if row[2] != "cds":
-            self.alScore = max(float(extractAttribute(row, "al_score")),
-                               self.alScore)
-        self.prots.append(extractAttribute(row, "prot"))
+            self.alScore = max(float(attributes["al_score"]), self.alScore)
+        self.prots.append(attributes["prot"])
         self.count += 1
 
     def print(self, printProts):
+        return "\t".join(self.collapsedRow(printProts))
+
+    def collapsedRow(self, printProts):
         self.row[5] = str(self.count)
         if self.row[2].lower() != "cds":
             if self.alScore == 0:
@@ -56,7 +73,7 @@ class Feature:
         if self.row[8] == "":
             self.row[8] = "."
 
-        return "\t".join(self.row)
+        return self.row
 
 
 class Codon():
@@ -65,19 +82,27 @@ class Codon():
 
 
 def loadData(inputFile):
-    features = {}
-    for row in csv.reader(open(inputFile), delimiter='\t'):
-        if len(row) != 9:
-            continue
+    return loadFeatures(GffReader.readRows(inputFile, FEATURE_TYPES,
+                                           ignoreCase=True))
+
+
+def isFeature(row):
+    """Check whether a row is collapsed. The feature type of the row is
+    lowercased."""
+    if len(row) != 9:
+        return False
+    row[2] = row[2].lower()
+    return row[2] in FEATURE_TYPES
 
-        row[2] = row[2].lower()
-        if row[2] != "intron" and row[2] != "start_codon" and \
-           row[2] != "cds" and row[2] != "start" and \
-           row[2] != "stop_codon" and row[2] != "stop":
+
+def loadFeatures(rows):
+    features = {}
+    for i, row in enumerate(rows):
+        if not isFeature(row):
             continue
 
         if signature(row) not in features:
-            features[signature(row)] = Feature(row)
+            features[signature(row)] = Feature(row, i)
         else:
             features[signature(row)].add(row)
 
@@ -87,9 +112,9 @@ def loadData(inputFile):
 def printCollapsed(features, printProts, outputFile=None, append=False):
     if outputFile:
         if append:
-            output = open(outputFile, "a")
+            output = CompressedFiles.openFile(outputFile, "a")
         else:
-            output = open(outputFile, "w")
+            output = CompressedFiles.openFile(outputFile, "w")
 
     for f in features.values():
         if outputFile:
@@ -100,14 +125,130 @@ def printCollapsed(features, printProts, outputFile=None, append=False):
         output.close()
 
 
-def collapse(inputFile, printProts=True, outputFile=None, append=False):
-    features = loadData(inputFile)
-    printCollapsed(features, printProts, outputFile, append)
+def streamFeatures(indexedRows):
+    """Collapse rows sorted by start within each contig in a single sweep.
+
+    Rows with the same signature have the same contig and start, so they
+    are adjacent in the sorted input. Features are yielded once the sweep
+    passes their start, only features with the current start are kept in
+    memory. The order of features is the order of their first rows, the
+    same as in loadFeatures.
+
+    Args:
+        indexedRows: Iterable of (index, row) pairs. Feature.first is set to
+                     the index of the first row of a feature.
+    """
+    group = {}
+    contig = None
+    start = None
+    finishedContigs = set()
+    for index, row in indexedRows:
+        if not isFeature(row):
+            continue
+
+        rowStart = int(row[3])
+        if row[0] != contig or rowStart != start:
+            if row[0] != contig:
+                if row[0] in finishedContigs:
+                    sys.exit('error: Rows of a contig are not contiguous '
+                             'in the input: ' + "\t".join(row))
+                if contig is not None:
+                    finishedContigs.add(contig)
+            elif rowStart < start:
+                sys.exit('error: The input is not sorted by start '
+                         '(sort -k1,1 -k4,4n): ' + "\t".join(row))
+            yield from group.values()
+            group = {}
+            contig = row[0]
+            start = rowStart
+
+        feature = group.get(signature(row))
+        if feature is None:
+            group[signature(row)] = Feature(row, index)
+        else:
+            feature.add(row)
+    yield from group.values()
+
+
+def collapseStream(rows, printProts=True, sortedInput=False,
+                   chunkRows=ExternalSort.DEFAULT_CHUNK_ROWS, tempDir=None):
+    """Yield collapsed rows in the same order as collapseRows, without
+    keeping all features in memory.
+
+    Sorted input is collapsed in a single sweep. Unsorted input is first
+    sorted by coordinates and the input order, collapsed and the collapsed
+    rows are sorted back by the input order of their first rows. Both sorts
+    spill to temporary files if there are more than chunkRows rows.
+
+    Args:
+        rows: Iterable of gff rows. The rows are modified.
+        printProts: Print source proteins of each feature
+        sortedInput: The rows of each contig are contiguous and sorted by
+                     start
+        chunkRows: Maximum number of rows sorted in memory at once
+        tempDir: Directory for the temporary files of the sort
+    """
+    if sortedInput:
+        for feature in streamFeatures(enumerate(rows)):
+            yield feature.collapsedRow(printProts)
+        return
+
+    # The input order is kept as an extra column through the sort
+    indexed = (row + [str(i)] for i, row in enumerate(rows)
+               if isFeature(row))
+    sortedRows = ExternalSort.sortRows(
+        indexed, lambda row: (row[0], int(row[3]), int(row[9])), chunkRows,
+        tempDir)
+    features = streamFeatures((int(row.pop()), row) for row in sortedRows)
+    collapsed = (feature.collapsedRow(printProts) + [str(feature.first)]
+                 for feature in features)
+    for row in ExternalSort.sortRows(collapsed, lambda row: int(row[9]),
+                                     chunkRows, tempDir):
+        row.pop()
+        yield row
+
+
+def collapse(inputFile, printProts=True, outputFile=None, append=False,
+             sortedInput=False, chunkRows=ExternalSort.DEFAULT_CHUNK_ROWS,
+             tempDir=None, compactProts=None):
+    """Collapse features of a gff file. The output is the same as with the
+    in-memory loadData and printCollapsed, the memory use is limited by
+    chunkRows, see collapseStream. If compactProts is a file name, the
+    supporting proteins are saved to it and referenced from the output,
+    see ProteinSupport."""
+    if outputFile:
+        output = CompressedFiles.openFile(outputFile,
+                                          "a" if append else "w")
+    else:
+        output = sys.stdout
+    support = ProteinSupport.ProteinSupport() if compactProts else None
+
+    # Only rows of the collapsed types are read, the row indices used to
+    # order the features keep their order
+    rows = GffReader.readRows(inputFile, FEATURE_TYPES, ignoreCase=True)
+    for row in collapseStream(rows, printProts, sortedInput, chunkRows,
+                              tempDir):
+        if support is not None:
+            row[8] = support.compact(row[8])
+        output.write("\t".join(row) + "\n")
+
+    if outputFile:
+        output.close()
+    if support is not None:
+        support.save(compactProts)
+
+
+def collapseRows(rows, printProts=True):
+    """Collapse in-memory gff rows. The input rows are modified."""
+    features = loadFeatures(rows)
+    return [f.collapsedRow(printProts) for f in features.values()]
 
 
 def main():
     args = parseCmd()
-    collapse(args.input, not args.dontPrintProteins)
+    collapse(args.input, not args.dontPrintProteins,
+             sortedInput=args.sortedInput, chunkRows=args.chunkRows,
+             tempDir=args.tempDir, compactProts=args.compactProts)
 
 
 def parseCmd():
@@ -121,6 +262,27 @@ def parseCmd():
     parser.add_argument('--dontPrintProteins', action='store_true',
                         help='Do not print source proteins for each feature.')
 
+    parser.add_argument('--sortedInput', action='store_true',
+                        help='Rows of each contig are contiguous in the \
+        input and sorted by start, e.g., with sort -k1,1 -k4,4n. Features \
+        are collapsed in a single pass with constant memory. Otherwise, the \
+        input is sorted first.')
+
+    parser.add_argument('--chunkRows', type=int,
+                        default=ExternalSort.DEFAULT_CHUNK_ROWS,
+                        help='Maximum number of rows sorted in memory at \
+        once. Larger inputs are sorted with temporary files.')
+
+    parser.add_argument('--tempDir', type=str,
+                        help='Directory for the temporary files. The system \
+        default temporary directory is used by default.')
+
+    parser.add_argument('--compactProts', type=str, metavar='PROTS',
+                        help='Save the source proteins of all features to \
+        the binary file PROTS and print only a reference "protSet=N" to \
+        the proteins of each feature. Use expandProts.py to get the \
+        proteins back.')
+
     return parser.parse_args()
 
 
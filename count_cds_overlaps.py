@@ -4,93 +4,161 @@
 #
 # Compute and print the number of CDS segments overlapping each start. CDS
 # regions which start before a start codon starting coordinate and end after a
-# start codon ending coordinate are considered to be overlapping. Both input
-# files (start codons and CDS coordinates in gff format) need to be sorted by
-# chromosome, start and end. For example like this: sort -k1,1 -k4,4n -k5,5n
-# starts.gff > starts_sorted.gff. The file with CDS coordinates can be collapsed
-# (with the collapseGff.py script) for faster execution.
+# start codon ending coordinate are considered to be overlapping. The input
+# files do not need to be sorted. The file with CDS coordinates can be
+# collapsed (with the collapseGff.py script) for faster execution.
+#
+# The CDS segments of each contig are indexed by sorted starts and sorted
+# ends with prefix sums of their coverage. The coverage of CDS overlapping
+# a start [a, b] is
+#   W(CDS start < a) - W(CDS end <= b) + W(a <= CDS start, CDS end <= b),
+# the first two terms are found by binary search and the last term only
+# counts the few CDS which lie within the start codon.
 # ==============================================================
 
 
-import csv
 import argparse
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import accumulate, islice, repeat
+from operator import and_, le, lshift, or_, rshift
+import GffReader
 
 
-class CDS:
-
-    def __init__(self, start, end, coverage):
-        self.start = start
-        self.end = end
-        self.coverage = coverage
+# Coordinates and coverages are packed into single integers, which are
+# sorted without a key function
+COVERAGE_BITS = 32
+END_BITS = 40
+COVERAGE_MASK = (1 << COVERAGE_BITS) - 1
+END_MASK = (1 << END_BITS) - 1
 
 
-def loadCDS(cdsFileName):
-    codingSegments = {}
-    cdsFile = open(cdsFileName)
-    cdses = csv.reader(cdsFile, delimiter='\t')
-    for row in cdses:
-        if not row[0] in codingSegments:
-            codingSegments[row[0]] = []
+def shift(values, bits):
+    return map(lshift, values, repeat(bits))
 
-        coverage = 1
-        if row[5] != ".":
-            coverage = int(row[5])
 
-        codingSegments[row[0]].append(CDS(int(row[3]),
-                                      int(row[4]), coverage))
-    cdsFile.close()
-    return codingSegments
+def field(packed, bits, mask):
+    return map(and_, map(rshift, packed, repeat(bits)), repeat(mask))
 
 
-def filterStarts(startsFileName, cdsFileName):
-    codingSegments = loadCDS(cdsFileName)
+class CDSIndex:
+    """CDS segments of one contig (and strand) indexed for overlap
+    queries."""
 
-    startsFile = open(startsFileName)
-    starts = csv.reader(startsFile, delimiter='\t')
+    def __init__(self, starts, ends, coverages):
+        """
+        Args:
+            starts, ends, coverages: Lists of CDS coordinates and coverages
+        """
+        if all(map(le, starts, islice(starts, 1, None))):
+            # CDS are usually sorted already
+            self.starts = array('q', starts)
+            self.startOrderEnds = array('q', ends)
+            self.startOrderCoverages = array('q', coverages)
+        else:
+            packed = sorted(map(or_, map(or_,
+                                         shift(starts,
+                                               END_BITS + COVERAGE_BITS),
+                                         shift(ends, COVERAGE_BITS)),
+                                coverages))
+            self.starts = array('q', map(rshift, packed,
+                                         repeat(END_BITS + COVERAGE_BITS)))
+            # Ends and coverages in the order of CDS starts
+            self.startOrderEnds = array('q', field(packed, COVERAGE_BITS,
+                                                   END_MASK))
+            self.startOrderCoverages = array('q', map(and_, packed,
+                                                      repeat(COVERAGE_MASK)))
+            del packed
+        self.startCoverage = array('q', [0])
+        self.startCoverage.extend(accumulate(self.startOrderCoverages))
+
+        packed = sorted(map(or_, shift(ends, COVERAGE_BITS), coverages))
+        self.ends = array('q', map(rshift, packed, repeat(COVERAGE_BITS)))
+        self.endCoverage = array('q', [0])
+        self.endCoverage.extend(accumulate(map(and_, packed,
+                                               repeat(COVERAGE_MASK))))
+
+    def overlaps(self, start, end):
+        """Return the coverage of CDS starting before start and ending
+        after end."""
+        startsBefore = bisect_left(self.starts, start)
+        overlaps = self.startCoverage[startsBefore] - \
+            self.endCoverage[bisect_right(self.ends, end)]
+        # Add back CDS within [start, end], they were subtracted with the
+        # CDS ending before end but not counted with the CDS starting
+        # before start
+        for i in range(startsBefore, bisect_right(self.starts, end)):
+            if self.startOrderEnds[i] <= end:
+                overlaps += self.startOrderCoverages[i]
+        return overlaps
+
+
+def segmentKey(row, strandSpecific):
+    return (row[0], row[6]) if strandSpecific else row[0]
+
+
+def parseCoverages(scores):
+    """Parse CDS scores as coverages, the coverage is 1 if there is no
+    score."""
+    if "." not in scores:
+        return list(map(int, scores))
+    return [1 if score == "." else int(score) for score in scores]
+
+
+def loadCDS(cdses, strandSpecific=False):
+    """Return a dictionary of CDSIndex objects by contig, or by contig and
+    strand if strandSpecific is set."""
+    segments = {}
+    for row in cdses:
+        key = segmentKey(row, strandSpecific)
+        columns = segments.get(key)
+        if columns is None:
+            columns = ([], [], [])
+            segments[key] = columns
+        columns[0].append(row[3])
+        columns[1].append(row[4])
+        columns[2].append(row[5])
 
-    prevChromosome = ""
-    CDSpointer = 0
-    CDSNum = 0
+    codingSegments = {}
+    for key in list(segments):
+        starts, ends, scores = segments.pop(key)
+        codingSegments[key] = CDSIndex(list(map(int, starts)),
+                                       list(map(int, ends)),
+                                       parseCoverages(scores))
+    return codingSegments
 
-    for start in starts:
-        chrom = start[0]
-        startStart = int(start[3])
-        startEnd = int(start[4])
 
-        if prevChromosome != chrom:
-            CDSpointer = 0
-            CDSNum = len(codingSegments[chrom])
+def filterStarts(starts, cdses, strandSpecific=False):
+    """Yield start rows annotated with the number of overlapping CDS, in
+    the order of the input starts.
 
-        while (CDSpointer < CDSNum and
-               codingSegments[chrom][CDSpointer].end <= startEnd):
-            # Shift CDS starting point to first CDS which can overlap
-            # with any of the subsequent starts
-            CDSpointer += 1
+    Args:
+        starts: Start codon rows in any order. The rows are modified.
+        cdses: CDS rows in any order
+        strandSpecific: Only count CDS on the same strand as the start
+    """
+    codingSegments = loadCDS(cdses, strandSpecific)
 
+    for start in starts:
+        index = codingSegments.get(segmentKey(start, strandSpecific))
         startOverlaps = 0
-        i = CDSpointer
-        while i < CDSNum and codingSegments[chrom][i].start < startStart:
-            # While any CDS starts before the current start
-            if (codingSegments[chrom][i].start < startStart
-               and codingSegments[chrom][i].end > startEnd):
-                startOverlaps += codingSegments[chrom][i].coverage
-            i += 1
+        if index is not None:
+            startOverlaps = index.overlaps(int(start[3]), int(start[4]))
 
         if start[8] == ".":
             start[8] = "CDS_overlap=" + str(startOverlaps) + ";"
         else:
             start[8] += " CDS_overlap=" + str(startOverlaps) + ";"
 
-        print("\t".join(start))
-
-        prevChromosome = chrom
-
-    startsFile.close()
+        yield start
 
 
 def main():
     args = parseCmd()
-    filterStarts(args.starts, args.cds)
+    starts = GffReader.readRows(args.starts)
+    cdses = GffReader.readRows(args.cds)
+    for start in filterStarts(starts, cdses, args.strandSpecific):
+        print("\t".join(start))
 
 
 def parseCmd():
@@ -98,19 +166,20 @@ def parseCmd():
     parser = argparse.ArgumentParser(description='Compute and print the number\
         of CDS  segments overlapping each start. CDS regions which start \
         before a start codon starting coordinate and end after a start codon \
-        ending coordinate are considered to be overlapping. Both input files \
-        (start codons and CDS coordinates in gff format) need to be sorted by \
-        chromosome, start and end. For example like this: sort -k1,1 -k4,4n \
-        -k5,5n starts.gff > starts_sorted.gff. The file with CDS coordinates \
-        can be collapsed (with the collapseGff.py script) for faster \
-        execution.')
+        ending coordinate are considered to be overlapping. The input files \
+        do not need to be sorted, starts are printed in the input order. The \
+        file with CDS coordinates can be collapsed (with the collapseGff.py \
+        script) for faster execution.')
 
     parser.add_argument('starts', metavar='starts.gff', type=str,
-                        help='Sorted start codons in gff format.')
+                        help='Start codons in gff format.')
     parser.add_argument('cds', metavar='cds.gff', type=str,
-                        help='Sorted CDS regions in gff format. If the 6th \
+                        help='CDS regions in gff format. If the 6th \
         score column contains a number, this number is treated as coverage of \
         the given CDS region.')
+    parser.add_argument('--strandSpecific', action='store_true',
+                        help='Only count CDS regions on the same strand as \
+        the start codon. By default, CDS on both strands are counted.')
 
     return parser.parse_args()
 
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+# ==============================================================
+# Tomas Bruna
+#
+# Expand protein set references of hints with compact protein support
+# (--compactProts) back to the "prots=P1,P2,...;" attributes.
+# ==============================================================
+
+
+import argparse
+import sys
+import CompressedFiles
+import ProteinSupport
+
+
+def expandFile(inputFile, support, output):
+    with CompressedFiles.openFile(inputFile) as f:
+        for line in f:
+            fields = line.rstrip("\n").split("\t")
+            if len(fields) == 9:
+                fields[8] = support.expand(fields[8])
+                line = "\t".join(fields) + "\n"
+            output.write(line)
+
+
+def main():
+    args = parseCmd()
+    expandFile(args.input, ProteinSupport.SupportFile(args.prots),
+               sys.stdout)
+
+
+def parseCmd():
+
+    parser = argparse.ArgumentParser(description='Expand protein set \
+        references of hints written with --compactProts back to the lists \
+        of supporting proteins. The output is printed to stdout.')
+
+    parser.add_argument('input', metavar='hints.gff', type=str,
+                        help='Hints with protSet references, e.g., \
+        miniprothint.gff or hc.gff.')
+
+    parser.add_argument('prots', metavar='hints.prots', type=str,
+                        help='Protein file written together with the hints, \
+        e.g., miniprothint.prots.')
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    main()
@@ -6,171 +6,1015 @@
 
 
 import argparse
+import contextlib
+import heapq
+import json
+import multiprocessing
+import shutil
 import sys
-import time
-import subprocess
-import collapseGff
 import tempfile
-import shutil
 import os
+import AlignmentCache
+import Checkpoints
+import CompressedFiles
+import ExternalSort
+import collapseGff
+import GffAttributes
+import GffReader
+import ProteinSupport
+import StageReport
+import selectRepresentativeAlignments
+import print_high_confidence
+import cds_with_upstream_support
+import count_cds_overlaps
+import scorer2gtf
 
 
-tempFiles = []
 workDir = ''
-binDir = ''
+keepTemp = False
+report = StageReport.StageReport()
 
 MIN_EXON_SCORE_ALL = 25
 MIN_INTRON_AL_ALL = 0.1
 MIN_START_AL_ALL = 0.01
 MIN_STOP_AL_ALL = 0.01
 
+# Relaxed print_high_confidence thresholds of the hints by feature type
+HINT_OPTIONS = {
+    "intron": f'--intronCoverage 0 --intronAlignment {MIN_INTRON_AL_ALL} '
+              f'--minExonScore {MIN_EXON_SCORE_ALL} --addAllSpliceSites',
+    "start_codon": f'--startCoverage 0 --startAlignment {MIN_START_AL_ALL} '
+                   f'--minExonScore {MIN_EXON_SCORE_ALL}',
+    "stop_codon": f'--stopCoverage 0 --stopAlignment {MIN_STOP_AL_ALL} '
+                  f'--minExonScore {MIN_EXON_SCORE_ALL}',
+    "cds": f'--minExonScore {MIN_EXON_SCORE_ALL}'}
+
+# Options which affect the outputs, shared by all shards of a run
+PIPELINE_OPTIONS = ["ignoreCoverage", "hcOptions", "topNperSeed",
+                    "minScoreFraction", "maxSubFraction", "minSubCoverage",
+                    "compactProts", "sortOutputs", "compressOutputs"]
+
+TRAINING_OPTIONS = '--topNperSeed 0 --minSubCoverage 2'
+LOW_COVERAGE_OPTIONS = '--intronCoverage 1 --stopCoverage 1 --startCoverage 1'
+# Stages selecting the rows of gtf stages
+GTF_SOURCES = {"representativesGtf": "representatives",
+               "trainingGenesGtf": "trainingGenes"}
+# Shard files open at once by scatter and gather, two files per shard
+MAX_OPEN_SHARDS = 64
+
+
+def readRows(fileName):
+    return list(GffReader.readRows(fileName))
+
+
+def writeRows(rows, fileName, keys=None):
+    """Write rows to a file. If keys are given, they are written to a
+    fileName.keys file, one key per line. The rows are compressed if the
+    file name has a compression extension."""
+    with CompressedFiles.openFile(fileName, "w") as f:
+        for row in rows:
+            f.write("\t".join(row) + "\n")
+    if keys is not None:
+        writeKeys(keys, fileName + ".keys")
+
+
+def formatKey(key):
+    if isinstance(key, int):
+        return str(key)
+    return "\t".join(map(str, key))
+
+
+def parseKey(text):
+    fields = text.rstrip("\n").split("\t")
+    if len(fields) == 1:
+        return int(fields[0])
+    return (int(fields[0]), fields[1], int(fields[2]))
 
-def systemCall(cmd):
-    if subprocess.call(["bash", "-c", cmd]) != 0:
-        sys.exit('[' + time.ctime() + '] error: exited due to an ' +
-                 'error in command: ' + cmd)
 
+def writeKeys(keys, fileName):
+    with open(fileName, "w") as f:
+        for key in keys:
+            f.write(formatKey(key) + "\n")
 
-def callScript(name, args):
-    systemCall(binDir + '/' + name + ' ' + args)
 
+def readKeys(fileName):
+    with open(fileName) as f:
+        return [parseKey(line) for line in f]
 
-def temp(prefix, suffix):
+
+def temp(prefix, suffix, rows):
+    """Save intermediate rows to the tmp folder if --nocleanup is set."""
+    if not keepTemp:
+        return
     if not os.path.isdir(workDir + "/tmp"):
         os.mkdir(workDir + "/tmp")
     tmp = tempfile.NamedTemporaryFile(delete=False, dir=workDir + "/tmp",
                                       prefix=prefix, suffix=suffix)
-    tempFiles.append(tmp.name)
-    return tmp
+    tmp.close()
+    writeRows(rows, tmp.name)
+
+
+def subsetKeys(rows, keys, subset):
+    """Return keys of the subset rows. The subset must consist of the same
+    row objects as rows, in the same order."""
+    subsetKeys = []
+    i = 0
+    for row in subset:
+        while rows[i] is not row:
+            i += 1
+        subsetKeys.append(keys[i])
+        i += 1
+    return subsetKeys
+
+
+def sortRows(rows):
+    """Sort rows in the same way as `LC_ALL=C sort -k1,1 -k4,4n -k5,5n`."""
+    return sorted(rows, key=ExternalSort.coordinateKey)
+
+
+def sortOutput(fileName, args, withKeys=False):
+    """Sort an output file by coordinates in place if --sortOutputs is
+    set. Rows which do not fit into --sortMemory are sorted in temporary
+    files in the workdir. If withKeys is set, fileName.keys is sorted along
+    with the rows."""
+    if args.sortOutputs:
+        ExternalSort.sortFile(fileName, memory=args.sortMemory * 2**20,
+                              tempDir=workDir,
+                              keysFile=fileName + ".keys" if withKeys
+                              else None)
+
+
+def highConfidence(rows, keys, options=''):
+    """Filter rows by print_high_confidence thresholds given as command
+    line options. Return copies of the passing rows and their keys."""
+    args = print_high_confidence.parseCmd(['-'] + options.split())
+    filter = print_high_confidence.Filter(args)
+    selected, selectedKeys = [], []
+    for row, key in zip(rows, keys):
+        row = print_high_confidence.prepareRow(row)
+        if filter.decide(row):
+            selected.append(row)
+            selectedKeys.append(key)
+    return selected, selectedKeys
+
+
+def collapseHints(reps, repKeys):
+    """Filter introns, starts, stops (with proteinEnd=1 only) and CDS of
+    representative alignments by the HINT_OPTIONS thresholds and collapse
+    them in a single pass.
+
+    Returns:
+        Dictionary mapping a lowercase feature type to a dictionary of
+        collapsed features by signature. The first of a feature is the key
+        of its first row.
+    """
+    filters = {featureType: print_high_confidence.Filter(
+                   print_high_confidence.parseCmd(['-'] + options.split()))
+               for featureType, options in HINT_OPTIONS.items()}
+    features = {featureType: {} for featureType in HINT_OPTIONS}
+    for row, key in zip(reps, repKeys):
+        featureType = row[2].lower()
+        filter = filters.get(featureType)
+        if filter is None:
+            continue
+        if featureType == "stop_codon" and \
+                GffAttributes.extract(row[8], "proteinEnd") != "1":
+            continue
+        row = print_high_confidence.prepareRow(row)
+        if not filter.decide(row) or not collapseGff.isFeature(row):
+            continue
+
+        # Attributes parsed by the filter are reused
+        collapsed = features[featureType]
+        signature = collapseGff.signature(row)
+        feature = collapsed.get(signature)
+        if feature is None:
+            collapsed[signature] = collapseGff.Feature(row, key,
+                                                       filter.attributes)
+        else:
+            feature.add(row, filter.attributes)
+    return features
 
 
-def cleanup():
-    for file in tempFiles:
-        os.remove(file)
-    shutil.rmtree(workDir + "/tmp")
+def collapsedRows(features, printProts=True):
+    """Return rows and keys of collapsed features."""
+    features = features.values()
+    return ([f.collapsedRow(printProts) for f in features],
+            [f.first for f in features])
 
 
 def setup(args):
     global workDir
-    global binDir
+    global keepTemp
+    global report
     workDir = args.workdir
+    keepTemp = args.nocleanup
     if not os.path.isdir(workDir):
         os.mkdir(workDir)
-    binDir = os.path.abspath(os.path.dirname(__file__))
+    report = StageReport.StageReport(f'{workDir}/profile' if args.profile
+                                     else None)
 
 
-def processMiniprotOutput(miniprot, ignoreCoverage, args):
+def reportFile():
+    return f'{workDir}/report.json'
+
+
+class ParsedInput():
+    """Input rows parsed in memory, their keys and the alignment store."""
+
+    def __init__(self, miniprot, rows, keys):
+        self.rows = rows
+        self.keys = keys
+        self.store = selectRepresentativeAlignments.loadAlignments(miniprot,
+                                                                   rows)
+        # Saved gtf export of all rows, if available
+        self.gtf = None
+
+    def selectRows(self, selected):
+        """Return rows of the selected alignments and their keys."""
+        rows = list(selectRepresentativeAlignments.selectRows(self.rows,
+                                                              selected))
+        return rows, subsetKeys(self.rows, self.keys, rows)
+
+
+def parseInput(miniprot, args):
+    """Parse the input. With --cache, the parsed input is loaded from
+    workdir/cache if it was built from the same input, otherwise the cache
+    is (re)built."""
+    cache = args.cache or args.rebuildCache
+    if cache and (CompressedFiles.isStdin(miniprot) or
+                  CompressedFiles.isCompressed(miniprot)):
+        # The cache addresses rows by their byte offsets in the input
+        sys.stderr.write("warning: The cache needs an uncompressed input "
+                         "file, --cache is ignored.\n")
+        cache = False
+    if not cache:
+        rows = readRows(miniprot)
+        return ParsedInput(miniprot, rows, range(len(rows)))
+
+    selectRepresentativeAlignments.checkExtension(miniprot)
+    cacheDir = f'{workDir}/cache'
+    if args.rebuildCache:
+        AlignmentCache.invalidate(cacheDir)
+    elif AlignmentCache.isValid(miniprot, cacheDir, args.trustMtime):
+        return AlignmentCache.CachedInput(miniprot, cacheDir)
+
+    rows = readRows(miniprot)
+    parsed = ParsedInput(miniprot, rows, range(len(rows)))
+    if not os.path.isdir(cacheDir):
+        os.mkdir(cacheDir)
+    AlignmentCache.invalidate(cacheDir)
+    exportGtf(rows, f'{cacheDir}/miniprot.gtf')
+    if AlignmentCache.build(miniprot, rows, parsed.store, cacheDir):
+        parsed.gtf = f'{cacheDir}/miniprot.gtf'
+    return parsed
+
+
+def clusterAlignments(store):
+    """Cluster alignments and report the distribution of cluster sizes."""
+    with report.measure("clusterAlignments"):
+        clusters = selectRepresentativeAlignments.clusterAlignments(store)
+        report.record(alignments=len(store), clusters=len(clusters),
+                      clusterSizes=StageReport.sizeDistribution(
+                          len(cluster.alignments)
+                          for cluster in clusters.values()))
+    return clusters
+
+
+def loadInput(miniprot, args):
+    with report.measure("parseInput"):
+        parsed = parseInput(miniprot, args)
+        if isinstance(parsed, ParsedInput):
+            report.record(outputRows=len(parsed.rows))
+        report.record(alignments=len(parsed.store))
+    return parsed
+
+
+def selectRepresentatives(miniprot, parsed, clusters, options):
+    """Return rows of representative alignments and their keys."""
+    args = selectRepresentativeAlignments.parseCmd([miniprot] +
+                                                   options.split())
+    selected = selectRepresentativeAlignments.selectAlignments(
+        clusters.values(), args)
+    return parsed.selectRows(selected)
+
+
+def gtfKeys(rows, keys):
+    """Yield keys of the gtf lines exported from rows. Each mRNA and CDS row
+    is converted to two gtf lines, both get the key of the source row."""
+    for row, key in zip(rows, keys):
+        if row[2] == "mRNA" or row[2] == "CDS":
+            yield key
+            yield key
+
+
+def exportGtf(rows, outputFile, keys=None):
+    """Export rows to gtf. Keys of the gtf lines are saved to
+    outputFile.keys if keys of rows are given."""
+    stops = scorer2gtf.loadStopCodons(rows)
+    with CompressedFiles.openFile(outputFile, "w") as output:
+        scorer2gtf.convert(rows, stops, False, output)
+    if keys is not None:
+        writeKeys(gtfKeys(rows, keys), outputFile + ".keys")
+    report.record(inputRows=len(rows),
+                  outputRows=2 * sum(row[2] == "mRNA" or row[2] == "CDS"
+                                     for row in rows))
+
+
+def exportGtfs(rows, targets, keys=None):
+    """Export rows and subsets of them to gtf files in a single scan of the
+    rows, see scorer2gtf.exportGtfs.
+
+    Args:
+        rows: All rows
+        targets: List of (outputFile, subset). The subset must consist of
+                 the same row objects as rows, None exports all rows.
+        keys: Keys of rows. If given, keys of the gtf lines are saved to
+              outputFile.keys as in exportGtf.
+    """
+    outputs = [CompressedFiles.openFile(outputFile, "w")
+               for outputFile, subset in targets]
+    try:
+        counts = scorer2gtf.exportGtfs(
+            rows, [(output, subset) for output, (outputFile, subset)
+                   in zip(outputs, targets)])
+        consistent = True
+    except scorer2gtf.StopCodonOrderError:
+        counts = [0] * len(targets)
+        consistent = False
+    finally:
+        for output in outputs:
+            output.close()
+
+    # If stop codons could not be resolved per alignment, or a subset is not
+    # made of the rows, the files are exported on their own
+    for t, (outputFile, subset) in enumerate(targets):
+        if subset is None:
+            subset = rows
+            subsetKeyList = keys
+        else:
+            subsetKeyList = None if keys is None \
+                else subsetKeys(rows, keys, subset)
+        expected = 2 * sum(row[2] == "mRNA" or row[2] == "CDS"
+                           for row in subset)
+        if consistent and counts[t] == expected:
+            if keys is not None:
+                writeKeys(gtfKeys(subset, subsetKeyList),
+                          outputFile + ".keys")
+            continue
+        exportGtf(subset, outputFile, subsetKeyList)
+        counts[t] = expected
+    report.record(inputRows=len(rows), outputRows=sum(counts))
+
+
+def representativeOptions(args):
+    return (f'--topNperSeed {args.topNperSeed} '
+            f'--minScoreFraction {args.minScoreFraction} '
+            f'--maxSubFraction {args.maxSubFraction} '
+            f'--minSubCoverage {args.minSubCoverage}')
+
 
-    reps = f'{workDir}/miniprot_representatives.gff'
-    callScript('selectRepresentativeAlignments.py',
-               f'{miniprot} '
-               f'--topNperSeed {args.topNperSeed} '
-               f'--minScoreFraction {args.minScoreFraction} '
-               f'--maxSubFraction {args.maxSubFraction} '
-               f'--minSubCoverage {args.minSubCoverage} '
-               f'> {reps}')
-
-    processIntrons(reps)
-    processStarts(reps)
-    processStops(reps)
-
-    # if reliable introns have mostly coverage 1 and ignoreCoverage is set,
-    # then run again with coverage thresholds set to 1
-    if ignoreCoverage and hasLowCoverage():
-        callScript('print_high_confidence.py',
-                   f'{workDir}/miniprothint.gff --intronCoverage 1 '
-                   f'--stopCoverage 1 --startCoverage 1 > {workDir}/hc.gff')
+def processHints(reps, repKeys):
+    """Return collapsed introns, starts and stops of representative
+    alignments and their keys."""
+    with report.measure("collapse"):
+        features = collapseHints(reps, repKeys)
+        introns, intronKeys = collapsedRows(features["intron"])
+        stops, stopKeys = collapsedRows(features["stop_codon"])
+        report.record(inputRows=len(reps), introns=len(introns),
+                      starts=len(features["start_codon"]),
+                      stops=len(stops), cds=len(features["cds"]))
+    with report.measure("starts"):
+        starts = supportedStarts(features["start_codon"], features["cds"],
+                                 introns)
+        report.record(inputRows=len(features["start_codon"]),
+                      inputCDS=len(features["cds"]), outputRows=len(starts))
+    hints = introns + starts + stops
+    report.record(inputRows=len(reps), outputRows=len(hints))
+    hintKeys = [(0, "", key) for key in intronKeys] + \
+        [(1, row[0], i) for i, row in enumerate(starts)] + \
+        [(2, "", key) for key in stopKeys]
+    return hints, hintKeys
+
+
+def runPipeline(miniprot, parsed, args):
+    """Run all stages on the parsed whole input or a shard.
+
+    Every output row has a key. Row keys are integers increasing with the
+    input order, hint keys are (section, contig, position) tuples. Merging
+    outputs of contig shards by keys gives the output of a single run.
+
+    Returns:
+        outputs: Dictionary mapping an output file name to (rows, keys).
+                 Gtf outputs hold the source rows of the export. A file
+                 name is given instead if the output was already saved.
+                 Set hc_lowCoverage.gff is only computed with
+                 --ignoreCoverage.
+        stats: Counts of all and coverage 1 high alignment introns
+    """
+    outputs = {}
+    clusters = clusterAlignments(parsed.store)
+
+    with report.measure("representatives"):
+        reps, repKeys = selectRepresentatives(miniprot, parsed, clusters,
+                                              representativeOptions(args))
+        report.record(outputRows=len(reps))
+    outputs['miniprot_representatives.gff'] = (reps, repKeys)
+
+    with report.measure("hints"):
+        hints, hintKeys = processHints(reps, repKeys)
+    outputs['miniprothint.gff'] = (hints, hintKeys)
+
+    with report.measure("hc"):
+        stats = lowCoverageStats(hints, hintKeys)
+        outputs['hc.gff'] = highConfidence(hints, hintKeys, args.hcOptions)
+        if args.ignoreCoverage:
+            outputs['hc_lowCoverage.gff'] = highConfidence(
+                hints, hintKeys, f'{args.hcOptions} {LOW_COVERAGE_OPTIONS}')
+        report.record(inputRows=len(hints),
+                      outputRows=len(outputs['hc.gff'][0]))
+
+    with report.measure("trainingGenes"):
+        outputs['miniprot_trainingGenes.gff'] = selectRepresentatives(
+            miniprot, parsed, clusters, TRAINING_OPTIONS)
+        report.record(
+            outputRows=len(outputs['miniprot_trainingGenes.gff'][0]))
+
+    if parsed.gtf is not None:
+        outputs['miniprot.gtf'] = parsed.gtf
     else:
-        callScript('print_high_confidence.py',
-                   f'{workDir}/miniprothint.gff > {workDir}/hc.gff')
-
-    callScript('selectRepresentativeAlignments.py',
-               f'{miniprot} '
-               f'--topNperSeed 0 '
-               f'--minSubCoverage 2 '
-               f'> {workDir}/miniprot_trainingGenes.gff')
-
-    callScript('scorer2gtf.py', f'{miniprot} > {workDir}/miniprot.gtf')
-    callScript('scorer2gtf.py', f'{reps} > {workDir}/miniprot_representatives.gtf')
-    callScript('scorer2gtf.py', f'{workDir}/miniprot_trainingGenes.gff > '
-                                f'{workDir}/miniprot_trainingGenes.gtf')
-
-
-def processIntrons(miniprot):
-    intronsAll = temp('intronsAll', '.gff')
-    systemCall(f'grep intron {miniprot} > {intronsAll.name}')
-    introns01 = temp('introns01', '.gff')
-    callScript('print_high_confidence.py',
-               f'{intronsAll.name} --intronCoverage 0 --intronAlignment '
-               f'{MIN_INTRON_AL_ALL} --minExonScore {MIN_EXON_SCORE_ALL} '
-               f'--addAllSpliceSites > {introns01.name}')
-    collapseGff.collapse(introns01.name, outputFile=f'{workDir}/miniprothint.gff')
-
-
-def processStops(miniprot):
-    stopsAll = temp('stopsAllEnd', '.gff')
-    systemCall(f'grep stop_codon {miniprot} | grep proteinEnd=1 > {stopsAll.name}')
-    stopsPositive = temp('stopsPositive', '.gff')
-    callScript('print_high_confidence.py',
-               f'{stopsAll.name} --stopCoverage 0 --stopAlignment '
-               f'{MIN_STOP_AL_ALL} --minExonScore {MIN_EXON_SCORE_ALL} '
-               f'> {stopsPositive.name}')
-    collapseGff.collapse(stopsPositive.name,
-                         outputFile=f'{workDir}/miniprothint.gff',
-                         append=True)
-
-
-def processStarts(miniprot):
-    startsAll = temp('startsAll', '.gff')
-    systemCall(f'grep start_codon {miniprot} > {startsAll.name}')
-    startsPositive = temp('startsPositive', '.gff')
-    callScript('print_high_confidence.py',
-               f'{startsAll.name} --startCoverage 0 --startAlignment '
-               f'{MIN_START_AL_ALL} --minExonScore {MIN_EXON_SCORE_ALL} '
-               f'> {startsPositive.name}')
-    startsCollapsed = temp('startsCollapsed', '.gff')
-    startsCollapsedS = temp('startsCollapsedSorted', '.gff')
-    collapseGff.collapse(startsPositive.name, outputFile=startsCollapsed.name)
-    systemCall(f'sort -k1,1 -k4,4n -k5,5n {startsCollapsed.name} > '
-               f'{startsCollapsedS.name}')
-
-    cds = temp('cds', '.gff')
-    cdsF = temp('cdsF', '.gff')
-    cdsC = temp('cdsCollapsed', '.gff')
-    cdsSupported = temp('cdsCollapsed', '.gff')
-    cdsSupportedS = temp('cdsCollapsed', '.gff')
-    systemCall(f'grep CDS {miniprot} > {cds.name}')
-    callScript('print_high_confidence.py',
-               f'{cds.name} --minExonScore {MIN_EXON_SCORE_ALL} > {cdsF.name}')
-    collapseGff.collapse(cdsF.name, printProts=False, outputFile=cdsC.name)
+        outputs['miniprot.gtf'] = (parsed.rows, parsed.keys)
+    outputs['miniprot_representatives.gtf'] = \
+        outputs['miniprot_representatives.gff']
+    outputs['miniprot_trainingGenes.gtf'] = \
+        outputs['miniprot_trainingGenes.gff']
+    return outputs, stats
+
+
+def writeOutputs(outputs, withKeys=False):
+    gtfs = {}
+    if not isinstance(outputs.get('miniprot.gtf'), str):
+        # Gtf outputs are subsets of all rows, all are converted in one scan
+        gtfs = {name: output for name, output in outputs.items()
+                if name.endswith(".gtf") and not isinstance(output, str)}
+    for name, output in outputs.items():
+        if name in gtfs:
+            continue
+        with report.measure(f'write_{name}'):
+            if isinstance(output, str):
+                shutil.copyfile(output, f'{workDir}/{name}')
+                continue
+            rows, keys = output
+            if not withKeys:
+                keys = None
+            if name.endswith(".gtf"):
+                exportGtf(rows, f'{workDir}/{name}', keys)
+            else:
+                writeRows(rows, f'{workDir}/{name}', keys)
+                report.record(outputRows=len(rows))
+    if gtfs:
+        with report.measure("write_gtf"):
+            rows, keys = gtfs['miniprot.gtf']
+            exportGtfs(rows, [(f'{workDir}/{name}',
+                               None if name == 'miniprot.gtf' else output[0])
+                              for name, output in gtfs.items()],
+                       keys if withKeys else None)
+
+
+class Stage():
+    """Pipeline stage with its input files, parameters and output files."""
+
+    def __init__(self, name, inputs, params, outputs):
+        self.name = name
+        self.inputs = inputs
+        self.params = params
+        self.outputs = outputs
+
+    def upToDate(self, checkpoints):
+        return checkpoints.upToDate(self.name, self.inputs, self.params,
+                                    self.outputs)
+
+
+def protsFile():
+    return f'{workDir}/miniprothint.prots'
+
+
+def outputFile(name, args):
+    """Return the workdir path of a final output, with the extension of
+    --compressOutputs."""
+    return CompressedFiles.outputName(f'{workDir}/{name}',
+                                      args.compressOutputs)
+
+
+def pipelineStages(miniprot, args):
+    """Return stages of the pipeline in the order of execution."""
+    reps = outputFile('miniprot_representatives.gff', args)
+    trainingGenes = outputFile('miniprot_trainingGenes.gff', args)
+    hints = outputFile('miniprothint.gff', args)
+    hintOutputs = [hints]
+    if args.compactProts:
+        hintOutputs.append(protsFile())
+    repOutputs = [reps]
+    if args.sortOutputs:
+        # Input order of the sorted representatives
+        repOutputs.append(reps + ".keys")
+    stages = [Stage("representatives", {"input": miniprot},
+                    {"options": representativeOptions(args)}, repOutputs),
+              Stage("trainingGenes", {"input": miniprot},
+                    {"options": TRAINING_OPTIONS}, [trainingGenes]),
+              Stage("hints", {"representatives": reps},
+                    {"compactProts": args.compactProts}, hintOutputs),
+              Stage("hc", {"hints": hints},
+                    {"ignoreCoverage": args.ignoreCoverage,
+                     "hcOptions": args.hcOptions},
+                    [outputFile('hc.gff', args)]),
+              Stage("gtf", {"input": miniprot}, {},
+                    [outputFile('miniprot.gtf', args)]),
+              Stage("representativesGtf", {"representatives": reps}, {},
+                    [outputFile('miniprot_representatives.gtf', args)]),
+              Stage("trainingGenesGtf", {"trainingGenes": trainingGenes}, {},
+                    [outputFile('miniprot_trainingGenes.gtf', args)])]
+    for stage in stages:
+        if args.sortOutputs:
+            stage.params["sortOutputs"] = True
+        if args.compressOutputs:
+            stage.params["compressOutputs"] = args.compressOutputs
+    return stages
+
+
+def processMiniprotOutput(miniprot, ignoreCoverage, args):
+    """Run the pipeline stages which are not up to date.
+
+    Outputs of skipped stages are read from the workdir when they are
+    needed by the next stages.
+    """
+    checkpoints = Checkpoints.Checkpoints(workDir, not args.rerun,
+                                          args.trustMtime)
+    stages = pipelineStages(miniprot, args)
+
+    if args.threads > 1 and not all(stage.upToDate(checkpoints)
+                                    for stage in stages[:3]):
+        for stage in stages:
+            checkpoints.invalidate(stage.name)
+        processShards(miniprot, args)
+        for stage in stages:
+            checkpoints.record(stage.name, stage.inputs, stage.params,
+                               stage.outputs)
+        return
+
+    loaded = {}
+    # Stages which selected their rows from the parsed input in this run and
+    # gtf stages already exported along with the full gtf
+    selected = set()
+    exported = set()
+
+    def parsed():
+        if "parsed" not in loaded:
+            loaded["parsed"] = loadInput(miniprot, args)
+        return loaded["parsed"]
+
+    def clusters():
+        if "clusters" not in loaded:
+            loaded["clusters"] = clusterAlignments(parsed().store)
+        return loaded["clusters"]
+
+    def rows(stage):
+        """Return rows of the only output of a stage. Sorted
+        representatives are returned in the input order."""
+        if stage not in loaded:
+            loaded[stage] = readRows(outputs[stage])
+            if stage == "representatives" and args.sortOutputs:
+                keys = readKeys(outputs[stage] + ".keys")
+                loaded[stage] = [loaded[stage][i] for i in
+                                 sorted(range(len(keys)),
+                                        key=keys.__getitem__)]
+        return loaded[stage]
+
+    def representatives():
+        reps, keys = selectRepresentatives(miniprot, parsed(), clusters(),
+                                           representativeOptions(args))
+        loaded["representatives"] = reps
+        selected.add("representatives")
+        report.record(outputRows=len(reps))
+        if args.sortOutputs:
+            writeRows(reps, outputs["representatives"], keys)
+            sortOutput(outputs["representatives"], args, withKeys=True)
+        else:
+            writeRows(reps, outputs["representatives"])
+            if os.path.isfile(outputs["representatives"] + ".keys"):
+                os.remove(outputs["representatives"] + ".keys")
+
+    def trainingGenes():
+        loaded["trainingGenes"] = selectRepresentatives(
+            miniprot, parsed(), clusters(), TRAINING_OPTIONS)[0]
+        selected.add("trainingGenes")
+        report.record(outputRows=len(loaded["trainingGenes"]))
+        writeRows(loaded["trainingGenes"], outputs["trainingGenes"])
+        sortOutput(outputs["trainingGenes"], args)
+
+    def hints():
+        reps = rows("representatives")
+        loaded["hints"] = processHints(reps, range(len(reps)))[0]
+        if args.compactProts:
+            support = ProteinSupport.ProteinSupport()
+            for row in loaded["hints"]:
+                row[8] = support.compact(row[8])
+            support.save(protsFile())
+        elif os.path.isfile(protsFile()):
+            os.remove(protsFile())
+        writeRows(loaded["hints"], outputs["hints"])
+        sortOutput(outputs["hints"], args)
+
+    def hc():
+        hints = rows("hints")
+        keys = range(len(hints))
+        options = args.hcOptions
+        # if reliable introns have mostly coverage 1 and ignoreCoverage is
+        # set, then use coverage thresholds set to 1
+        if ignoreCoverage and hasLowCoverage(lowCoverageStats(hints, keys)):
+            options += ' ' + LOW_COVERAGE_OPTIONS
+        hc = highConfidence(hints, keys, options)[0]
+        report.record(inputRows=len(hints), outputRows=len(hc))
+        writeRows(hc, outputs["hc"])
+        sortOutput(outputs["hc"], args)
+
+    def gtf():
+        if parsed().gtf is not None:
+            CompressedFiles.copyFile(parsed().gtf, outputs["gtf"])
+        else:
+            # Pending gtf stages of rows selected in this run are exported in
+            # the same scan of all rows
+            targets = [(outputs["gtf"], None)]
+            for stage in stages:
+                source = GTF_SOURCES.get(stage.name)
+                if source in selected and not stage.upToDate(checkpoints):
+                    checkpoints.invalidate(stage.name)
+                    targets.append((outputs[stage.name], loaded[source]))
+                    exported.add(stage.name)
+            exportGtfs(parsed().rows, targets)
+        sortOutput(outputs["gtf"], args)
+
+    def representativesGtf():
+        if "representativesGtf" not in exported:
+            exportGtf(rows("representatives"), outputs["representativesGtf"])
+        sortOutput(outputs["representativesGtf"], args)
+
+    def trainingGenesGtf():
+        if "trainingGenesGtf" not in exported:
+            exportGtf(rows("trainingGenes"), outputs["trainingGenesGtf"])
+        sortOutput(outputs["trainingGenesGtf"], args)
+
+    run = {"representatives": representatives,
+           "trainingGenes": trainingGenes, "hints": hints, "hc": hc,
+           "gtf": gtf, "representativesGtf": representativesGtf,
+           "trainingGenesGtf": trainingGenesGtf}
+    outputs = {stage.name: stage.outputs[0] for stage in stages}
+
+    for stage in stages:
+        if stage.upToDate(checkpoints):
+            sys.stderr.write(f'info: Stage {stage.name} is up to date, '
+                             'skipping.\n')
+            report.skip(stage.name)
+            continue
+        checkpoints.invalidate(stage.name)
+        with report.measure(stage.name):
+            run[stage.name]()
+        checkpoints.record(stage.name, stage.inputs, stage.params,
+                           stage.outputs)
+
+
+def writeShardInputs(lines, contigShards, shardDirs, firstShard):
+    """Write the input lines of the given shards with their keys. Lines of
+    the other shards are skipped.
+
+    Args:
+        lines: Input lines
+        contigShards: Shard of each contig
+        shardDirs: Directories of the shards to write
+        firstShard: Shard of the comment lines after the last alignment row
+    """
+    outputs = {}
+    try:
+        for shard, shardDir in shardDirs.items():
+            shardInput = f'{shardDir}/miniprot.gff'
+            outputs[shard] = (open(shardInput, "w"),
+                              open(shardInput + ".keys", "w"))
+        pending = []
+        for i, line in enumerate(lines):
+            fields = line.split("\t", 1)
+            shard = contigShards.get(fields[0])
+            if shard is None:
+                pending.append((i, line))
+                continue
+            if shard in outputs:
+                rowsOut, keysOut = outputs[shard]
+                for key, pendingLine in pending:
+                    rowsOut.write(pendingLine)
+                    keysOut.write(f'{key}\n')
+                rowsOut.write(line)
+                keysOut.write(f'{i}\n')
+            pending = []
+        if firstShard in outputs:
+            rowsOut, keysOut = outputs[firstShard]
+            for key, pendingLine in pending:
+                rowsOut.write(pendingLine)
+                keysOut.write(f'{key}\n')
+    finally:
+        for rowsOut, keysOut in outputs.values():
+            rowsOut.close()
+            keysOut.close()
+
+
+def scatter(miniprot, shardCount, shardsDir, args):
+    """Split the input into self-contained shards by contigs. Contigs are
+    assigned to shards so that the numbers of alignments are balanced.
+    Features never span contigs, so no feature is split between shards.
+
+    Comment lines, such as the PAF lines of the native miniprot output,
+    go to the shard of the next alignment row. Each shard input is saved
+    with the keys of its rows, which are the line numbers in the input,
+    and with the pipeline options in shard.json. The list of shards is
+    saved in manifest.json.
+
+    The input is read once to count the contigs and once per
+    MAX_OPEN_SHARDS shards to write them, which bounds the number of open
+    files. Stdin input is saved to a temporary file in shardsDir while the
+    contigs are counted.
+
+    Returns:
+        List of shard directories, shards without contigs are skipped
+    """
+    if not os.path.isdir(shardsDir):
+        os.mkdir(shardsDir)
+    counts = {}
+    spool = None
+    with CompressedFiles.openFile(miniprot) as f:
+        lines = f
+        if CompressedFiles.isStdin(miniprot):
+            spool = CompressedFiles.Spool(shardsDir)
+            lines = spool.tee(f)
+        for line in lines:
+            fields = line.split("\t", 3)
+            if len(fields) < 3 or line[0] == "#":
+                continue
+            counts[fields[0]] = counts.get(fields[0], 0) + \
+                (fields[2] == "mRNA")
+
+    loads = [(0, i) for i in range(shardCount)]
+    contigShards = {}
+    for contig in sorted(counts, key=lambda c: (-counts[c], c)):
+        load, shard = heapq.heappop(loads)
+        contigShards[contig] = shard
+        heapq.heappush(loads, (load + counts[contig], shard))
+
+    used = sorted(set(contigShards.values()))
+    options = {option: getattr(args, option)
+               for option in PIPELINE_OPTIONS}
+    shardDirs = {}
+    for shard in used:
+        shardDirs[shard] = f'{shardsDir}/shard_{shard}'
+        if not os.path.isdir(shardDirs[shard]):
+            os.mkdir(shardDirs[shard])
+        with open(f'{shardDirs[shard]}/shard.json', "w") as f:
+            json.dump(options, f, indent=2)
+
+    # The input is read again for each batch of shards
+    with spool.lines() if spool is not None else \
+            contextlib.nullcontext() as spooled:
+        for start in range(0, len(used), MAX_OPEN_SHARDS):
+            batch = {shard: shardDirs[shard]
+                     for shard in used[start:start + MAX_OPEN_SHARDS]}
+            if spooled is None:
+                with CompressedFiles.openFile(miniprot) as f:
+                    writeShardInputs(f, contigShards, batch, used[0])
+            else:
+                spooled.seek(0)
+                writeShardInputs(spooled, contigShards, batch, used[0])
+
+    shardContigs = {shard: [] for shard in used}
+    for contig in sorted(contigShards):
+        shardContigs[contigShards[contig]].append(contig)
+    stdin = CompressedFiles.isStdin(miniprot)
+    manifest = {"input": miniprot if stdin else os.path.abspath(miniprot),
+                "inputSize": None if stdin else os.path.getsize(miniprot),
+                "options": options,
+                "shards": [{"directory": f'shard_{shard}',
+                            "contigs": shardContigs[shard],
+                            "alignments": sum(counts[contig] for contig
+                                              in shardContigs[shard])}
+                           for shard in used]}
+    with open(f'{shardsDir}/manifest.json', "w") as f:
+        json.dump(manifest, f, indent=2)
+    return [shardDirs[shard] for shard in used]
+
+
+def processShard(shardDir, args):
+    """Run the pipeline on one shard and save its outputs with keys and
+    the low coverage statistics of the shard. The stage report of the
+    shard is saved to report.json in the shard directory."""
+    global workDir
+    global keepTemp
+    global report
+    workDir = shardDir
+    keepTemp = args.nocleanup
+    report = StageReport.StageReport(f'{shardDir}/profile' if args.profile
+                                     else None)
+    shardInput = f'{shardDir}/miniprot.gff'
+    with report.measure("parseInput"):
+        parsed = ParsedInput(shardInput, readRows(shardInput),
+                             readKeys(shardInput + ".keys"))
+        report.record(outputRows=len(parsed.rows),
+                      alignments=len(parsed.store))
+    outputs, stats = runPipeline(shardInput, parsed, args)
+    writeOutputs(outputs, withKeys=True)
+    with open(f'{shardDir}/stats.json', "w") as f:
+        json.dump({"highAlIntrons": stats[0],
+                   "highAlIntronsCoverage1": stats[1]}, f)
+    report.values["shard"] = os.path.basename(shardDir)
+    report.save(f'{shardDir}/report.json')
+
+
+def processShardTask(task):
+    processShard(*task)
+
+
+def readKeyed(fileName):
+    """Yield (key, line) pairs of a shard output."""
+    with open(fileName) as lines, open(fileName + ".keys") as keys:
+        for line, key in zip(lines, keys):
+            yield parseKey(key), line
+
+
+def mergeShards(shardDirs, name, outputFile, support=None, withKeys=False):
+    """Merge a shard output by keys into the output of a single run. If
+    support is given, supporting proteins of the merged rows are replaced
+    by references to it. If withKeys is set, the keys of the merged rows
+    are saved to outputFile.keys.
+
+    Groups of MAX_OPEN_SHARDS shards are merged to temporary files first if
+    there are more shards, which bounds the number of open files."""
+    if len(shardDirs) > MAX_OPEN_SHARDS:
+        with tempfile.TemporaryDirectory(dir=workDir) as groupsDir:
+            groupDirs = []
+            for start in range(0, len(shardDirs), MAX_OPEN_SHARDS):
+                groupDirs.append(f'{groupsDir}/group_{len(groupDirs)}')
+                os.mkdir(groupDirs[-1])
+                mergeShards(shardDirs[start:start + MAX_OPEN_SHARDS], name,
+                            f'{groupDirs[-1]}/{name}', withKeys=True)
+            mergeShards(groupDirs, name, outputFile, support, withKeys)
+        return
+
+    keys = open(outputFile + ".keys", "w") if withKeys else None
+    with CompressedFiles.openFile(outputFile, "w") as output:
+        for key, line in heapq.merge(*[readKeyed(f'{shardDir}/{name}')
+                                       for shardDir in shardDirs],
+                                     key=lambda pair: pair[0]):
+            if support is not None:
+                line = support.compactLine(line)
+            output.write(line)
+            if keys is not None:
+                keys.write(formatKey(key) + "\n")
+    if keys is not None:
+        keys.close()
+
+
+def gather(shardDirs, options):
+    """Merge outputs of all shards. The low coverage decision is made from
+    the statistics summed over all shards. Supporting proteins are compacted
+    and the outputs are sorted after the merge, in the same way as in a
+    single run.
+
+    Args:
+        shardDirs: Processed shard directories
+        options: Namespace with ignoreCoverage, compactProts, sortOutputs,
+                 compressOutputs and sortMemory
+    """
+    stats = [0, 0]
+    shardReports = []
+    for shardDir in shardDirs:
+        if not os.path.isfile(f'{shardDir}/stats.json'):
+            sys.exit(f'error: Shard {shardDir} was not processed.')
+        with open(f'{shardDir}/stats.json') as f:
+            shardStats = json.load(f)
+        stats[0] += shardStats["highAlIntrons"]
+        stats[1] += shardStats["highAlIntronsCoverage1"]
+        if os.path.isfile(f'{shardDir}/report.json'):
+            with open(f'{shardDir}/report.json') as f:
+                shardReports.append(json.load(f))
+        if os.path.isdir(f'{shardDir}/profile'):
+            # Keep shard profiles when the shards are removed
+            if not os.path.isdir(f'{workDir}/profile'):
+                os.mkdir(f'{workDir}/profile')
+            target = f'{workDir}/profile/{os.path.basename(shardDir)}'
+            if os.path.isdir(target):
+                shutil.rmtree(target)
+            shutil.move(f'{shardDir}/profile', target)
+    report.values["shards"] = shardReports
+
+    hc = 'hc.gff'
+    if options.ignoreCoverage and hasLowCoverage(stats):
+        hc = 'hc_lowCoverage.gff'
+
+    support = ProteinSupport.ProteinSupport() if options.compactProts \
+        else None
+    for name in ['miniprot_representatives.gff', 'miniprothint.gff',
+                 'hc.gff', 'miniprot_trainingGenes.gff', 'miniprot.gtf',
+                 'miniprot_representatives.gtf',
+                 'miniprot_trainingGenes.gtf']:
+        source = hc if name == 'hc.gff' else name
+        # hc.gff is a subset of the hints, its protein sets are already
+        # in the support when it is merged
+        hintSupport = support if name in ['miniprothint.gff', 'hc.gff'] \
+            else None
+        # Sorted representatives keep their input order in the keys
+        withKeys = options.sortOutputs and \
+            name == 'miniprot_representatives.gff'
+        mergeShards(shardDirs, source, outputFile(name, options),
+                    hintSupport, withKeys)
+        sortOutput(outputFile(name, options), options, withKeys)
+    if support is not None:
+        support.save(protsFile())
+    elif os.path.isfile(protsFile()):
+        os.remove(protsFile())
+
+
+def loadManifest(shardsDir):
+    if not os.path.isfile(f'{shardsDir}/manifest.json'):
+        sys.exit(f'error: No shard manifest found in {shardsDir}. Run '
+                 'the scatter command first.')
+    with open(f'{shardsDir}/manifest.json') as f:
+        return json.load(f)
+
+
+def loadShardOptions(shardDir, nocleanup, profile=False):
+    """Return pipeline options of a shard saved by scatter."""
+    if not os.path.isfile(f'{shardDir}/shard.json'):
+        sys.exit(f'error: {shardDir} is not a shard directory created by '
+                 'the scatter command.')
+    with open(f'{shardDir}/shard.json') as f:
+        args = argparse.Namespace(**json.load(f))
+    args.nocleanup = nocleanup
+    args.profile = profile
+    return args
+
+
+def processShards(miniprot, args):
+    """Run the pipeline on contig shards of the input in parallel and
+    merge the shard outputs."""
+    shardsDir = f'{workDir}/shards'
+    with report.measure("scatter"):
+        shardDirs = scatter(miniprot, args.threads, shardsDir, args)
+    with report.measure("shards"):
+        with multiprocessing.Pool(min(args.threads,
+                                      max(len(shardDirs), 1))) as pool:
+            pool.map(processShardTask,
+                     [(shardDir, args) for shardDir in shardDirs])
+    with report.measure("gather"):
+        gather(shardDirs, args)
+    if not keepTemp:
+        shutil.rmtree(shardsDir)
+
+
+def supportedStarts(starts, cds, introns):
+    """Return collapsed starts with CDS support, sorted by coordinates.
+
+    Args:
+        starts: Collapsed starts by signature
+        cds: Collapsed CDS by signature
+        introns: Collapsed intron rows
+    """
+    startsCollapsed = sortRows(collapsedRows(starts)[0])
+    temp('startsCollapsedSorted', '.gff', startsCollapsed)
+    cdsC = collapsedRows(cds, printProts=False)[0]
+    temp('cdsCollapsed', '.gff', cdsC)
 
     # This is crucial as there is so much noise in the CDS alignments.
     # Without this step, almost no starts are left with a larger database.
-    callScript('cds_with_upstream_support.py',
-               f'{cdsC.name} {startsCollapsedS.name} '
-               f'{workDir}/miniprothint.gff > {cdsSupported.name}')
-    systemCall(f'sort -k1,1 -k4,4n -k5,5n {cdsSupported.name} > '
-               f'{cdsSupportedS.name}')
-
-    callScript('count_cds_overlaps.py',
-               f'{startsCollapsedS.name} {cdsSupportedS.name} >> '
-               f'{workDir}/miniprothint.gff')
-
-
-def hasLowCoverage():
-    highAlIntrons = temp('highAlIntrons', '.gff')
-    callScript('print_high_confidence.py',
-               f'{workDir}/miniprothint.gff --intronCoverage 1 > '
-               f'{workDir}/highAlIntrons.gff > {highAlIntrons.name}')
-    with open(highAlIntrons.name) as introns:
-        overall, cov1 = 0, 0
-        for line in introns:
-            row = line.split("\t")
-            if row[2].lower() != "intron":
-                continue
-            overall += 1
-            if row[5] == "1":
-                cov1 += 1
+    cdsSupported = cds_with_upstream_support.selectSupportedCDS(
+        cdsC, startsCollapsed + introns)
+    temp('cdsSupported', '.gff', cdsSupported)
+
+    return list(count_cds_overlaps.filterStarts(startsCollapsed,
+                                                cdsSupported))
+
+
+def lowCoverageStats(hints, keys):
+    """Return the number of introns with high alignment score and the number
+    of such introns with coverage 1."""
+    highAlIntrons = highConfidence(hints, keys, '--intronCoverage 1')[0]
+    temp('highAlIntrons', '.gff', highAlIntrons)
+    overall, cov1 = 0, 0
+    for row in highAlIntrons:
+        if row[2].lower() != "intron":
+            continue
+        overall += 1
+        if row[5] == "1":
+            cov1 += 1
+    return overall, cov1
+
+
+def hasLowCoverage(stats):
+    overall, cov1 = stats
     if cov1 / overall > 0.8:
         sys.stderr.write("info: Low coverage detected, coverage will be "
                          "ignored in the high-confidence set.\n")
@@ -181,33 +1025,84 @@ def hasLowCoverage():
 
 
 def main():
+    if len(sys.argv) > 1 and sys.argv[1] in COMMANDS:
+        COMMANDS[sys.argv[1]](sys.argv[2:])
+        return
     args = parseCmd()
     setup(args)
     processMiniprotOutput(args.miniprot, args.ignoreCoverage, args)
-    if (not args.nocleanup):
-        cleanup()
+    report.values.update(input=args.miniprot, threads=args.threads)
+    report.save(reportFile())
 
 
-def parseCmd():
+def scatterCommand(argv):
+    args = parseScatter(argv)
+    setup(args)
+    shardDirs = scatter(args.miniprot, args.shards, f'{workDir}/shards',
+                        args)
+    for shardDir in shardDirs:
+        print(shardDir)
 
-    parser = argparse.ArgumentParser(description='',
-                                     formatter_class=argparse.
-                                     ArgumentDefaultsHelpFormatter)
 
-    parser.add_argument('miniprot', metavar='miniprot_scored.gff', type=str,
-                        help='Miniprot output scored by the miniprot\
-                              boundary scorer.')
+def shardCommand(argv):
+    args = parseShard(argv)
+    processShard(args.shardDir,
+                 loadShardOptions(args.shardDir, args.nocleanup,
+                                  args.profile))
 
-    parser.add_argument('--workdir', type=str, default='.',
-                        help='Keep all the temporary files.')
 
-    parser.add_argument('--nocleanup', action='store_true',
-                        help='Keep all the temporary files.')
+def gatherCommand(argv):
+    args = parseGather(argv)
+    setup(args)
+    shardsDir = f'{workDir}/shards'
+    manifest = loadManifest(shardsDir)
+    options = argparse.Namespace(compactProts=False, sortOutputs=False,
+                                 compressOutputs=None)
+    vars(options).update(manifest["options"])
+    options.sortMemory = args.sortMemory
+    with report.measure("gather"):
+        gather([f'{shardsDir}/{shard["directory"]}'
+                for shard in manifest["shards"]], options)
+    report.values["input"] = manifest["input"]
+    report.save(reportFile())
+    if not keepTemp:
+        shutil.rmtree(shardsDir)
+
 
+COMMANDS = {"scatter": scatterCommand,
+            "shard": shardCommand,
+            "gather": gatherCommand}
+
+
+def addPipelineOptions(parser):
     parser.add_argument('--ignoreCoverage', action='store_true', default=False,
                         help='Add hints to hc.gff no matter the coverage if \
         more than 80%% of introns with high alignment score have coverage=1.')
 
+    parser.add_argument('--hcOptions', type=str, default='',
+                        help='Thresholds of print_high_confidence.py used to \
+        select hc.gff, e.g., --hcOptions="--intronCoverage 3". Coverage \
+        thresholds are set to 1 if low coverage is detected with \
+        --ignoreCoverage.')
+
+    parser.add_argument('--compactProts', action='store_true',
+                        help='Save the proteins supporting each hint to \
+        workdir/miniprothint.prots and reference them from miniprothint.gff \
+        and hc.gff by "protSet=N" instead of listing them. This greatly \
+        reduces the size of the hint files with large protein databases. \
+        Use expandProts.py to get the protein lists back.')
+
+    parser.add_argument('--sortOutputs', action='store_true',
+                        help='Sort all outputs by coordinates, in the same \
+        way as "LC_ALL=C sort -k1,1 -k4,4n -k5,5n". By default, rows are in \
+        the order of the input alignments.')
+
+    parser.add_argument('--compressOutputs', choices=['gz', 'zst'],
+                        help='Compress all outputs with gzip or zstd. The \
+        compression extension is added to the output names, e.g., \
+        miniprothint.gff.gz. The input can be compressed with or without \
+        this option, it is recognized by its content.')
+
     adv = parser.add_argument_group('Advanced options for '
                                     'selectRepresentativeAlignments.py')
 
@@ -231,8 +1126,148 @@ def parseCmd():
         has better average alignment identity than the parent. See \
         selectRepresentativeAlignments.py for details.')
 
+
+def addSortMemoryOption(parser):
+    parser.add_argument('--sortMemory', type=int,
+                        default=ExternalSort.DEFAULT_MEMORY_MB,
+                        help='Approximate memory in MB used to sort an \
+        output with --sortOutputs. Larger outputs are sorted in temporary \
+        files in the workdir.')
+
+
+def parseCmd():
+
+    parser = argparse.ArgumentParser(description='Select reliable hints \
+        from miniprot alignments. To process a large input on multiple \
+        machines, use the "scatter", "shard" and "gather" commands, see \
+        "miniprothint.py scatter -h".',
+                                     formatter_class=argparse.
+                                     ArgumentDefaultsHelpFormatter)
+
+    parser.add_argument('miniprot', metavar='miniprot_scored.gff', type=str,
+                        help='Miniprot output scored by the miniprot\
+                              boundary scorer. Use "-" to read it from \
+        stdin, e.g., piped directly from the scorer.')
+
+    parser.add_argument('--workdir', type=str, default='.',
+                        help='Keep all the temporary files.')
+
+    parser.add_argument('--nocleanup', action='store_true',
+                        help='Keep all the temporary files.')
+
+    parser.add_argument('--threads', type=int, default=1,
+                        help='Split the input by contigs and process the \
+        contig shards in this many parallel processes.')
+
+    parser.add_argument('--rerun', action='store_true',
+                        help='Run all stages. By default, stages recorded in \
+        workdir/stages.json as finished with the same inputs and options are \
+        skipped, e.g., only hc.gff is selected again when only --hcOptions \
+        change.')
+
+    parser.add_argument('--cache', action='store_true',
+                        help='Save the parsed input to workdir/cache and \
+        reuse it in the next runs with the same input and workdir, e.g., \
+        when tuning the selection of representatives. The cache is rebuilt \
+        when the input changes. Not used with --threads.')
+
+    parser.add_argument('--rebuildCache', action='store_true',
+                        help='Rebuild the cache even if it is up to date. \
+        Implies --cache.')
+
+    parser.add_argument('--trustMtime', action='store_true',
+                        help='Consider the input and the stage outputs \
+        unchanged if their sizes and modification times are the same as in \
+        the previous run, without comparing their content hashes, when \
+        validating the cache and skipping up-to-date stages. Faster for \
+        large inputs, but an edit which keeps the size and the modification \
+        time is not detected.')
+
+    parser.add_argument('--profile', action='store_true',
+                        help='Save a cProfile dump of each stage to \
+        workdir/profile/stage.prof. Times, memory and row counts of all \
+        stages are always saved to workdir/report.json.')
+
+    addPipelineOptions(parser)
+    addSortMemoryOption(parser)
+
     return parser.parse_args()
 
 
+def parseScatter(argv):
+
+    parser = argparse.ArgumentParser(prog='miniprothint.py scatter',
+                                     description='Split the input by \
+        contigs into self-contained shards in workdir/shards. Process each \
+        shard with "miniprothint.py shard workdir/shards/shard_N", for \
+        example as a separate cluster job, and merge the results with \
+        "miniprothint.py gather --workdir workdir". The outputs are identical \
+        to a single run. Options affecting the outputs are given here and \
+        saved with the shards. The shard directories are printed to stdout.',
+                                     formatter_class=argparse.
+                                     ArgumentDefaultsHelpFormatter)
+
+    parser.add_argument('miniprot', metavar='miniprot_scored.gff', type=str,
+                        help='Miniprot output scored by the miniprot\
+                              boundary scorer. Use "-" to read it from \
+        stdin, e.g., piped directly from the scorer.')
+
+    parser.add_argument('--shards', type=int, required=True,
+                        help=f'Number of shards. Contigs are distributed \
+        among the shards by their numbers of alignments. The input is read \
+        once per {MAX_OPEN_SHARDS} shards, stdin input from a temporary \
+        copy.')
+
+    parser.add_argument('--workdir', type=str, default='.',
+                        help='Shards are saved to workdir/shards.')
+
+    addPipelineOptions(parser)
+
+    args = parser.parse_args(argv)
+    args.nocleanup = False
+    args.profile = False
+    return args
+
+
+def parseShard(argv):
+
+    parser = argparse.ArgumentParser(prog='miniprothint.py shard',
+                                     description='Process one shard created \
+        by the scatter command.')
+
+    parser.add_argument('shardDir', type=str,
+                        help='Shard directory.')
+
+    parser.add_argument('--nocleanup', action='store_true',
+                        help='Keep all the temporary files.')
+
+    parser.add_argument('--profile', action='store_true',
+                        help='Save a cProfile dump of each stage to \
+        shardDir/profile/stage.prof.')
+
+    return parser.parse_args(argv)
+
+
+def parseGather(argv):
+
+    parser = argparse.ArgumentParser(prog='miniprothint.py gather',
+                                     description='Merge processed shards in \
+        workdir/shards into the final outputs in workdir.')
+
+    parser.add_argument('--workdir', type=str, default='.',
+                        help='Work directory given to the scatter command.')
+
+    parser.add_argument('--nocleanup', action='store_true',
+                        help='Keep the shards.')
+
+    parser.add_argument('--profile', action='store_true',
+                        help='Save a cProfile dump of the merge to \
+        workdir/profile/gather.prof.')
+
+    addSortMemoryOption(parser)
+
+    return parser.parse_args(argv)
+
+
 if __name__ == '__main__':
     main()
@@ -7,17 +7,11 @@
 
 
 import argparse
-import csv
-import re
-
-
-def extractFeature(text, feature):
-    regex = feature + '=([^;]+)'
-    search = re.search(regex, text)
-    if search:
-        return search.groups()[0]
-    else:
-        return None
+import itertools
+import os
+import sys
+import GffAttributes
+import GffReader
 
 
 class Filter:
@@ -26,48 +20,56 @@ class Filter:
         self.args = args
 
     def decide(self, row):
-        self.al_score = extractFeature(row[8], "al_score")
-        if self.al_score:
-            self.al_score = float(self.al_score)
-        self.fullProtein = extractFeature(row[8], "fullProteinAligned")
-        self.topProtein = extractFeature(row[8], "topProt")
+        self.attributes = GffAttributes.Attributes(row[8])
         self.row = row
         self.coverage = int(row[5])
+        featureType = row[2].lower()
 
-        self.__determineCoverageThreshod()
+        # Attributes are only looked up for the feature types and options
+        # which use them
+        if (featureType == "cds"):
+            return self.__CDS()
+        elif featureType not in ("intron", "stop_codon", "start_codon"):
+            return True
 
-        if (row[2].lower() == "intron"):
+        self.al_score = self.attributes.get("al_score")
+        if self.al_score:
+            self.al_score = float(self.al_score)
+
+        self.__determineCoverageThreshod(featureType)
+
+        if (featureType == "intron"):
             return self.__intron()
-        elif (row[2].lower() == "stop_codon"):
+        elif (featureType == "stop_codon"):
             return self.__stop()
-        elif (row[2].lower() == "start_codon"):
-            return self.__start()
-        elif (row[2].lower() == "cds"):
-            return self.__CDS()
         else:
-            return True
+            return self.__start()
 
-    def __determineCoverageThreshod(self):
-        if (self.row[2].lower() == "intron"):
+    def __isTopProtein(self):
+        return self.attributes.get("topProt") == "TRUE"
+
+    def __determineCoverageThreshod(self, featureType):
+        if (featureType == "intron"):
             self.coverageThreshold = self.args.intronCoverage
-        elif (self.row[2].lower() == "stop_codon"):
+        elif (featureType == "stop_codon"):
             self.coverageThreshold = self.args.stopCoverage
-        elif (self.row[2].lower() == "start_codon"):
+        elif (featureType == "start_codon"):
             self.coverageThreshold = self.args.startCoverage
 
-        if ((self.args.addTopProteins and self.topProtein == "TRUE") or
-           (self.args.addFullAligned and self.fullProtein == "TRUE")):
+        if ((self.args.addTopProteins and self.__isTopProtein()) or
+           (self.args.addFullAligned and
+                self.attributes.get("fullProteinAligned") == "TRUE")):
             self.coverageThreshold = 1
 
     def __intron(self):
         if not self.args.addAllSpliceSites:
-            spliceSites = extractFeature(self.row[8], "splice_sites")
+            spliceSites = self.attributes.get("splice_sites")
             if spliceSites is not None and spliceSites.lower() != "gt_ag":
                 if not self.args.addGCAG or spliceSites.lower() != "gc_ag":
                     return False
 
-        ReScore = extractFeature(self.row[8], "ReScore")
-        LeScore = extractFeature(self.row[8], "LeScore")
+        ReScore = self.attributes.get("ReScore")
+        LeScore = self.attributes.get("LeScore")
         if ReScore is not None and LeScore is not None:
             if float(ReScore) < self.args.minExonScore or \
                float(LeScore) < self.args.minExonScore:
@@ -81,13 +83,13 @@ class Filter:
 
     def __stop(self):
         coverageThreshold = self.args.stopCoverage
-        if self.args.addTopProteins and self.topProtein == "TRUE":
+        if self.args.addTopProteins and self.__isTopProtein():
             coverageThreshold = 1
 
         if (self.al_score is None):
             self.al_score = 1
 
-        eScore = extractFeature(self.row[8], "eScore")
+        eScore = self.attributes.get("eScore")
         if eScore is not None:
             if float(eScore) < self.args.minExonScore:
                 return False
@@ -100,10 +102,10 @@ class Filter:
 
     def __start(self):
         coverageThreshold = self.args.startCoverage
-        if self.args.addTopProteins and self.topProtein == "TRUE":
+        if self.args.addTopProteins and self.__isTopProtein():
             coverageThreshold = 1
 
-        CDS_overlap = extractFeature(self.row[8], "CDS_overlap")
+        CDS_overlap = self.attributes.get("CDS_overlap")
         if (CDS_overlap is None):
             CDS_overlap = 0
         else:
@@ -112,7 +114,7 @@ class Filter:
         if (self.al_score is None):
             self.al_score = 1
 
-        eScore = extractFeature(self.row[8], "eScore")
+        eScore = self.attributes.get("eScore")
         if eScore is not None:
             if float(eScore) < self.args.minExonScore:
                 return False
@@ -125,31 +127,284 @@ class Filter:
         return False
 
     def __CDS(self):
-        eScore = extractFeature(self.row[8], "eScore")
+        eScore = self.attributes.get("eScore")
         if eScore is not None:
             if float(eScore) < self.args.minExonScore:
                 return False
         return True
 
 
-def printHighConfidence(args):
-    filter = Filter(args)
-    for row in csv.reader(open(args.input), delimiter='\t'):
-        row[1] = "miniprothint"
+def prepareRow(row):
+    """Return a copy of a row with the miniprothint source and a numeric
+    score, as expected by Filter.decide."""
+    row = row.copy()
+    row[1] = "miniprothint"
+
+    if row[5] == ".":
+        row[5] = "1"
+    return row
 
-        if row[5] == ".":
-            row[5] = "1"
 
+def selectHighConfidence(rows, args):
+    """Yield copies of rows which pass the thresholds in args."""
+    filter = Filter(args)
+    for row in rows:
+        row = prepareRow(row)
         if filter.decide(row):
-            print("\t".join(row))
+            yield row
+
+
+class HintColumns:
+    """Hints of one feature type parsed into columns.
+
+    Threshold conditions are evaluated for all hints at once as masks.
+    A mask is an integer with one byte per hint, the byte is 1 if the hint
+    satisfies the condition. Masks are combined with bitwise operators and
+    the passing hints are counted with bit_count(). Masks are cached for
+    each threshold value, a grid usually repeats a few values many times.
+    """
+
+    def __init__(self):
+        self.indices = []
+        self.columns = {"coverage": [], "alScore": [], "exonScore": [],
+                        "overlap": [], "top": [], "full": [],
+                        "spliceSites": []}
+        self.masks = {}
+
+    def add(self, index, values):
+        self.indices.append(index)
+        for name, value in values.items():
+            self.columns[name].append(value)
+
+    def all(self):
+        return int.from_bytes(b'\x01' * len(self.indices), 'little')
+
+    def atLeast(self, column, threshold):
+        # Columns hold ints and floats, a float threshold compares with both
+        threshold = float(threshold)
+        key = (column, ">=", threshold)
+        mask = self.masks.get(key)
+        if mask is None:
+            mask = int.from_bytes(bytes(map(threshold.__le__,
+                                            self.columns[column])),
+                                  'little')
+            self.masks[key] = mask
+        return mask
+
+    def atMost(self, column, threshold):
+        threshold = float(threshold)
+        key = (column, "<=", threshold)
+        mask = self.masks.get(key)
+        if mask is None:
+            mask = int.from_bytes(bytes(map(threshold.__ge__,
+                                            self.columns[column])),
+                                  'little')
+            self.masks[key] = mask
+        return mask
+
+    def coverage(self, threshold, args, fullAligned):
+        """Mask of hints passing the coverage threshold. The threshold is 1
+        for top proteins and fully aligned proteins, if enabled."""
+        overridden = 0
+        if args.addTopProteins:
+            overridden |= self.atLeast("top", 1)
+        if fullAligned and args.addFullAligned:
+            overridden |= self.atLeast("full", 1)
+        return (self.atLeast("coverage", threshold) & ~overridden) | \
+            (self.atLeast("coverage", 1) & overridden)
+
+    def passing(self, featureType, args):
+        """Return the mask of hints passing the thresholds in args, the same
+        way as Filter.decide."""
+        if featureType == "intron":
+            spliceSites = self.atMost("spliceSites", 0)
+            if args.addAllSpliceSites:
+                spliceSites = self.all()
+            elif args.addGCAG:
+                spliceSites = self.atMost("spliceSites", 1)
+            return spliceSites & \
+                self.atLeast("exonScore", args.minExonScore) & \
+                self.atLeast("alScore", args.intronAlignment) & \
+                self.coverage(args.intronCoverage, args, True)
+        elif featureType == "stop_codon":
+            return self.atLeast("exonScore", args.minExonScore) & \
+                self.atLeast("alScore", args.stopAlignment) & \
+                self.coverage(args.stopCoverage, args, False)
+        elif featureType == "start_codon":
+            return self.atLeast("exonScore", args.minExonScore) & \
+                self.atLeast("alScore", args.startAlignment) & \
+                self.atMost("overlap", args.startOverlap) & \
+                self.coverage(args.startCoverage, args, False)
+        elif featureType == "cds":
+            return self.atLeast("exonScore", args.minExonScore)
+        else:
+            return self.all()
+
+    def passingIndices(self, mask):
+        flags = mask.to_bytes(len(self.indices), 'little')
+        return [index for index, flag in zip(self.indices, flags) if flag]
+
+
+def flag(value):
+    if value not in ("0", "1"):
+        raise ValueError(value)
+    return value == "1"
+
+
+# Thresholds which can be used in a sweep grid and their types
+GRID_THRESHOLDS = {"intronCoverage": int, "startCoverage": int,
+                   "stopCoverage": int, "startAlignment": float,
+                   "stopAlignment": float, "intronAlignment": float,
+                   "minExonScore": float, "startOverlap": int,
+                   "addFullAligned": flag, "addGCAG": flag,
+                   "addAllSpliceSites": flag, "addTopProteins": flag}
+SWEEP_TYPES = ["intron", "start_codon", "stop_codon", "cds", "other"]
+
+
+def loadHintColumns(rows):
+    """Parse rows into HintColumns of each feature type.
+
+    Returns:
+        rows: Rows prepared by prepareRow
+        columns: Dictionary of feature types and their HintColumns
+    """
+    prepared = []
+    columns = {featureType: HintColumns() for featureType in SWEEP_TYPES}
+    inf = float("inf")
+    for row in rows:
+        if len(row) == 0 or row[0][0] == "#":
+            continue
+        row = prepareRow(row)
+        index = len(prepared)
+        prepared.append(row)
+
+        featureType = row[2].lower()
+        if featureType not in columns:
+            columns["other"].add(index, {})
+            continue
+        if featureType == "cds":
+            eScore = GffAttributes.extract(row[8], "eScore")
+            columns["cds"].add(index, {"exonScore": inf if eScore is None
+                                       else float(eScore)})
+            continue
+
+        attributes = GffAttributes.Attributes(row[8])
+        values = {"coverage": int(row[5]),
+                  "top": attributes.get("topProt") == "TRUE",
+                  "full": attributes.get("fullProteinAligned") == "TRUE"}
+        alScore = attributes.get("al_score")
+        if featureType == "intron":
+            if alScore is None:
+                sys.exit('error: Intron without al_score: ' + "\t".join(row))
+            values["alScore"] = float(alScore)
+            spliceSites = attributes.get("splice_sites")
+            if spliceSites is None or spliceSites.lower() == "gt_ag":
+                values["spliceSites"] = 0
+            elif spliceSites.lower() == "gc_ag":
+                values["spliceSites"] = 1
+            else:
+                values["spliceSites"] = 2
+            ReScore = attributes.get("ReScore")
+            LeScore = attributes.get("LeScore")
+            if ReScore is not None and LeScore is not None:
+                values["exonScore"] = min(float(ReScore), float(LeScore))
+            else:
+                values["exonScore"] = inf
+        else:
+            values["alScore"] = 1 if alScore is None else float(alScore)
+            eScore = attributes.get("eScore")
+            values["exonScore"] = inf if eScore is None else float(eScore)
+            if featureType == "start_codon":
+                overlap = attributes.get("CDS_overlap")
+                values["overlap"] = 0 if overlap is None else int(overlap)
+        columns[featureType].add(index, values)
+    return prepared, columns
+
+
+def parseGrid(specs, args):
+    """Return threshold sets of a grid given as NAME=VALUE1,VALUE2,...
+    specifications. The grid is a cartesian product of all values, other
+    thresholds are taken from args.
+
+    Returns:
+        names: Names of the thresholds in the grid
+        thresholdSets: List of argparse.Namespace objects
+    """
+    names, values = [], []
+    for spec in specs:
+        name, separator, valueList = spec.partition("=")
+        if not separator or name not in GRID_THRESHOLDS:
+            sys.exit(f'error: Invalid grid specification "{spec}". Use '
+                     f'NAME=VALUE1,VALUE2,... where NAME is one of: '
+                     f'{", ".join(GRID_THRESHOLDS)}.')
+        convert = GRID_THRESHOLDS[name]
+        try:
+            values.append([convert(value) for value in valueList.split(",")])
+        except ValueError:
+            sys.exit(f'error: Invalid value in grid specification "{spec}".')
+        names.append(name)
+
+    thresholdSets = []
+    for combination in itertools.product(*values):
+        thresholds = argparse.Namespace(**vars(args))
+        for name, value in zip(names, combination):
+            setattr(thresholds, name, value)
+        thresholdSets.append(thresholds)
+    return names, thresholdSets
+
+
+def sweep(args):
+    """Evaluate a grid of threshold sets and print the numbers of passing
+    hints of each feature type for each set."""
+    names, thresholdSets = parseGrid(args.sweep, args)
+    rows, columns = loadHintColumns(GffReader.readRows(args.input))
+
+    if args.sweepOutput and not os.path.isdir(args.sweepOutput):
+        os.mkdir(args.sweepOutput)
+    write = set(args.writeSets) if args.writeSets else None
+
+    print("\t".join(["set"] + names + ["intron", "start_codon",
+                                       "stop_codon", "CDS", "other",
+                                       "total"]))
+    for i, thresholds in enumerate(thresholdSets):
+        masks = {featureType: columns[featureType].passing(featureType,
+                                                           thresholds)
+                 for featureType in SWEEP_TYPES}
+        counts = [masks[featureType].bit_count()
+                  for featureType in SWEEP_TYPES]
+        print("\t".join([str(i)] +
+                        [str(int(value)) if isinstance(value, bool)
+                         else str(value) for value in
+                         (getattr(thresholds, name) for name in names)] +
+                        [str(count) for count in counts] +
+                        [str(sum(counts))]))
+
+        if args.sweepOutput and (write is None or i in write):
+            indices = []
+            for featureType in SWEEP_TYPES:
+                indices += columns[featureType].passingIndices(
+                    masks[featureType])
+            indices.sort()
+            with open(f'{args.sweepOutput}/set_{i}.gff', "w") as output:
+                for index in indices:
+                    output.write("\t".join(rows[index]) + "\n")
+
+
+def printHighConfidence(args):
+    rows = GffReader.readRows(args.input)
+    for row in selectHighConfidence(rows, args):
+        print("\t".join(row))
 
 
 def main():
     args = parseCmd()
-    printHighConfidence(args)
+    if args.sweep:
+        sweep(args)
+    else:
+        printHighConfidence(args)
 
 
-def parseCmd():
+def parseCmd(argv=None):
 
     parser = argparse.ArgumentParser(description='Select and print high confidence features\
                                      from miniprothint output file.')
@@ -198,7 +453,25 @@ def parseCmd():
                         help='Add hints corresponding to the top protein, no matter \
                         the coverage. Other scoring thresholds still apply.')
 
-    return parser.parse_args()
+    sweepGroup = parser.add_argument_group('Threshold sweep')
+    sweepGroup.add_argument('--sweep', type=str, nargs='+',
+                            metavar='NAME=VALUES',
+                            help='Evaluate a grid of threshold sets instead \
+                            of printing the high confidence features. The \
+                            grid is a cartesian product of comma separated \
+                            values of the given thresholds, e.g., --sweep \
+                            intronCoverage=1,2,4 minExonScore=0,25. Flags \
+                            take values 0 or 1. Other thresholds are set by \
+                            the options above. The numbers of passing \
+                            features by type are printed for each set.')
+    sweepGroup.add_argument('--sweepOutput', type=str,
+                            help='Save the passing features of each set to \
+                            sweepOutput/set_N.gff, N is the set number.')
+    sweepGroup.add_argument('--writeSets', type=int, nargs='+',
+                            help='Save only sets with these numbers to \
+                            sweepOutput.')
+
+    return parser.parse_args(argv)
 
 
 if __name__ == '__main__':
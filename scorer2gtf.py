@@ -12,76 +12,220 @@
 
 
 import argparse
-import csv
-import re
+import sys
+import CompressedFiles
+import GffAttributes
+import GffReader
 
 
-def extractAttribute(row, feature):
-    regex = feature + '=([^;]+)'
-    return re.search(regex, row[8]).groups()[0]
+def addStopCodon(row, allStops, validStops):
+    """Add a stop codon row and return the key of its transcript."""
+    attributes = GffAttributes.Attributes(row[8])
+    parent = attributes["Parent"]
+    prot = attributes["prot"]
+    allStops[f'{parent}_{prot}'] = (int(row[3]), int(row[4]))
 
+    proteinEnd = attributes["proteinEnd"]
+    if proteinEnd == "1":
+        validStops.add(f'{parent}_{prot}')
+    return parent, prot
 
-def loadStopCodons(scorerFile):
+
+def loadStopCodons(rows):
     allStops = {}
     validStops = set()
-    for row in csv.reader(open(scorerFile), delimiter='\t'):
+    for row in rows:
         if row[2] == "stop_codon":
-            parent = extractAttribute(row, "Parent")
-            prot = extractAttribute(row, "prot")
-            allStops[f'{parent}_{prot}'] = (int(row[3]), int(row[4]))
-
-            proteinEnd = extractAttribute(row, "proteinEnd")
-            if proteinEnd == "1":
-                validStops.add(f'{parent}_{prot}')
+            addStopCodon(row, allStops, validStops)
 
     return allStops, validStops
 
 
-def convert(scorerFile, stopsInCDS):
-    allStops, validStops = loadStopCodons(scorerFile)
-    for row in csv.reader(open(scorerFile), delimiter='\t'):
-        if row[2] == "mRNA":
-            ID = extractAttribute(row, "ID")
-            prot = extractAttribute(row, "prot")
-            row[2] = "transcript"
-            row[8] = f'transcript_id "{ID}_{prot}"; gene_id "{ID}_{prot}";'
-
-            if f'{ID}_{prot}' in validStops:
-                if row[6] == '+':
+def convertRow(row, stops, stopsInCDS):
+    """Convert an mRNA or a CDS row to gtf.
+
+    Returns:
+        Alignment ID and protein of the row and two gtf lines, None for
+        rows of other types
+    """
+    allStops, validStops = stops
+    if row[2] == "mRNA":
+        row = row.copy()
+        attributes = GffAttributes.Attributes(row[8])
+        ID = attributes["ID"]
+        prot = attributes["prot"]
+        row[2] = "transcript"
+        row[8] = f'transcript_id "{ID}_{prot}"; gene_id "{ID}_{prot}";'
+
+        if f'{ID}_{prot}' in validStops:
+            if row[6] == '+':
+                row[4] = str(int(row[4]) + 3)
+            else:
+                row[3] = str(int(row[3]) - 3)
+
+        gene = row.copy()
+        gene[2] = "gene"
+        gene[8] = f'gene_id "{ID}_{prot}";'
+        return ID, prot, "\t".join(gene) + "\n" + "\t".join(row) + "\n"
+    elif row[2] == "CDS":
+        row = row.copy()
+        attributes = GffAttributes.Attributes(row[8])
+        score = attributes["eScore"]
+        parent = attributes["Parent"]
+        prot = attributes["prot"]
+
+        if stopsInCDS and f'{parent}_{prot}' in allStops:
+            if row[6] == '+':
+                if int(row[4]) + 1 == allStops[f'{parent}_{prot}'][0]:
                     row[4] = str(int(row[4]) + 3)
-                else:
+            else:
+                if int(row[3]) - 1 == allStops[f'{parent}_{prot}'][1]:
                     row[3] = str(int(row[3]) - 3)
 
-            gene = row.copy()
-            gene[2] = "gene"
-            gene[8] = f'gene_id "{ID}_{prot}";'
-            print("\t".join(gene))
-            print("\t".join(row))
+        row[5] = score
+        row[8] = f'transcript_id "{parent}_{prot}"; gene_id "{parent}_{prot}";'
+        exon = row.copy()
+        exon[2] = "exon"
+        exon[7] = "."
+        return parent, prot, "\t".join(exon) + "\n" + "\t".join(row) + "\n"
+    return None
+
+
+def convert(rows, stops, stopsInCDS, output):
+    """Convert scorer rows to gtf and write them to output.
+
+    Args:
+        rows: Rows of the miniprot boundary scorer output
+        stops: All and valid stop codons as returned by loadStopCodons
+        stopsInCDS: Extend terminal CDS to include stop codons
+        output: Output file handle
+    """
+    for row in rows:
+        converted = convertRow(row, stops, stopsInCDS)
+        if converted is not None:
+            output.write(converted[2])
+
+
+class StopCodonOrderError(Exception):
+    """Rows of an alignment are not contiguous, or transcripts are not
+    unique, so stop codons cannot be resolved per alignment."""
+
+
+def convertStream(rows, stopsInCDS=False):
+    """Convert scorer rows to gtf in a single pass, with the same result as
+    loadStopCodons followed by convert.
+
+    Rows are buffered per alignment, from its mRNA row to the next one, and
+    converted with the stop codons of the alignment. StopCodonOrderError is
+    raised if a row does not belong to the alignment of its block or if a
+    transcript appears in two blocks. A stop codon could then affect rows
+    outside of its block.
+
+    Yields:
+        Converted rows of each alignment and their gtf lines, two lines per
+        row in one string
+    """
+    transcripts = set()
+    block = []
+    blockStops = []
+    stops = ({}, set())
+
+    def convertBlock():
+        converted = [convertRow(row, stops, stopsInCDS) for row in block]
+        ID, prot, text = converted[0]
+        key = f'{ID}_{prot}'
+        if block[0][2] != "mRNA" or key in transcripts:
+            raise StopCodonOrderError(key)
+        transcripts.add(key)
+        for stop in blockStops:
+            if stop[0] != ID or stop[1] != prot:
+                raise StopCodonOrderError(stop[0])
+        for row in converted:
+            if row[0] != ID or row[1] != prot:
+                raise StopCodonOrderError(row[0])
+        return [row[2] for row in converted]
+
+    for row in rows:
+        if row[2] == "mRNA":
+            if block:
+                yield block, convertBlock()
+            elif blockStops:
+                raise StopCodonOrderError(blockStops[0][0])
+            block = [row]
+            blockStops = []
+            stops = ({}, set())
         elif row[2] == "CDS":
-            score = extractAttribute(row, "eScore")
-            parent = extractAttribute(row, "Parent")
-            prot = extractAttribute(row, "prot")
-
-            if stopsInCDS and f'{parent}_{prot}' in allStops:
-                if row[6] == '+':
-                    if int(row[4]) + 1 == allStops[f'{parent}_{prot}'][0]:
-                        row[4] = str(int(row[4]) + 3)
-                else:
-                    if int(row[3]) - 1 == allStops[f'{parent}_{prot}'][1]:
-                        row[3] = str(int(row[3]) - 3)
-
-            row[5] = score
-            row[8] = f'transcript_id "{parent}_{prot}"; gene_id "{parent}_{prot}";'
-            exon = row.copy()
-            exon[2] = "exon"
-            exon[7] = "."
-            print("\t".join(exon))
-            print("\t".join(row))
+            block.append(row)
+        elif row[2] == "stop_codon":
+            blockStops.append(addStopCodon(row, *stops))
+    if block:
+        yield block, convertBlock()
+    elif blockStops:
+        raise StopCodonOrderError(blockStops[0][0])
+
+
+def exportGtfs(rows, targets, stopsInCDS=False):
+    """Convert scorer rows in a single pass and write each converted row to
+    every target which selects it.
+
+    Args:
+        rows: Iterable of rows of the miniprot boundary scorer output
+        targets: List of (output, subset) pairs. The output is an open file
+                 and the subset holds the row objects written to it, None
+                 selects all rows.
+        stopsInCDS: Extend terminal CDS to include stop codons
+
+    Returns:
+        Number of gtf lines written to each target
+
+    Raises:
+        StopCodonOrderError: See convertStream. The outputs are incomplete.
+    """
+    members = [None if subset is None else set(map(id, subset))
+               for output, subset in targets]
+    counts = [0] * len(targets)
+    for block, texts in convertStream(rows, stopsInCDS):
+        for t, (output, subset) in enumerate(targets):
+            selected = texts if members[t] is None else \
+                [text for row, text in zip(block, texts)
+                 if id(row) in members[t]]
+            output.write("".join(selected))
+            counts[t] += 2 * len(selected)
+    return counts
+
+
+def convertFile(fileName, stopsInCDS, output):
+    """Convert a scorer file of any row order, stop codons are loaded from
+    the whole file first."""
+    stops = loadStopCodons(GffReader.readRows(fileName, {"stop_codon"}))
+    convert(GffReader.readRows(fileName, {"mRNA", "CDS"}), stops, stopsInCDS,
+            output)
 
 
 def main():
     args = parseCmd()
-    convert(args.scorerFile, args.stopsInCDS)
+    stdin = CompressedFiles.isStdin(args.scorerFile)
+    if not stdin and not sys.stdout.seekable():
+        # A partial output could not be rewritten
+        convertFile(args.scorerFile, args.stopsInCDS, sys.stdout)
+        return
+
+    start = None if stdin else sys.stdout.tell()
+    try:
+        exportGtfs(GffReader.readRows(args.scorerFile,
+                                      {"mRNA", "CDS", "stop_codon"}),
+                   [(sys.stdout, None)], args.stopsInCDS)
+        return
+    except StopCodonOrderError:
+        if stdin:
+            sys.exit('error: Rows of the alignments on stdin are not '
+                     'contiguous or their IDs are not unique, stop codons '
+                     'cannot be assigned in a single pass. Convert the input '
+                     'from a file instead.')
+
+    sys.stdout.seek(start)
+    sys.stdout.truncate()
+    convertFile(args.scorerFile, args.stopsInCDS, sys.stdout)
 
 
 def parseCmd():
@@ -95,7 +239,9 @@ def parseCmd():
         miniprot output.')
 
     parser.add_argument('scorerFile', metavar='miniprot_parsed.gff', type=str,
-                        help='The input gff to collapse.')
+                        help='The input gff to collapse. Use "-" to read \
+        it from stdin. Rows of each alignment must then be contiguous, as \
+        in the output of the miniprot boundary scorer.')
 
     parser.add_argument('--stopsInCDS',  default=False, action='store_true',
                         help='Extend terminal CDS to include stop codons.')
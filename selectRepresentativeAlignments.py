@@ -7,146 +7,23 @@
 
 
 import argparse
-import re
 import sys
 import os
 import csv
+import heapq
+import io
+import mmap
+import multiprocessing
+from array import array
+from collections import deque
 import AlignmentCluster
+import AlignmentStore
+import CompressedFiles
+import GffAttributes
 
 
-class Exon():
-    def __init__(self, row, parent):
-        self.contig = row[0]
-        self.start = int(row[3])
-        self.end = int(row[4])
-        self.strand = row[6]
-        self.parent = parent
-
-    def print(self, Parent):
-        print("\t".join([self.contig, "miniprot", "CDS", str(self.start),
-                         str(self.end), ".", self.strand, ".",
-                         f'Parent={Parent};']))
-
-    def printGff2(self, match):
-        print("\t".join([self.contig, "miniprot", "HSP", str(self.start),
-                         str(self.end), ".", self.strand, ".",
-                         f'Match {match}']))
-
-    def __lt__(self, other):
-        if self.contig != other.contig:
-            return self.contig < other.contig
-        elif self.strand != other.strand:
-            return self.strand < other.strand
-        elif self.start != other.start:
-            return self.start < other.start
-        else:
-            return self.end < other.end
-
-
-class Alignment():
-    def __init__(self, ID, coverage, target):
-        self.ID = ID
-        self.start = sys.maxsize
-        self.end = -sys.maxsize
-        self.cluster = None
-        self.CDSlen = 0
-        self.exons = []
-        self.used = False
-        self.selected = False
-        self.selectedCount = 0
-        self.seed = False
-        self.subLocus = False
-        self.coverage = coverage
-        self.identity = 0
-        self.target = target.split()[0]
-
-    def addExon(self, exon):
-        self.start = min(self.start, exon.start)
-        self.end = max(self.end, exon.end)
-        self.CDSlen += exon.end - exon.start + 1
-        self.exons.append(exon)
-
-    def addScore(self, score):
-        self.score = float(score)
-
-    def getContig(self):
-        return self.exons[0].contig
-
-    def getStrand(self):
-        return self.exons[0].strand
-
-    def print(self, clusterId='', exons=True):
-        print("\t".join([self.getContig(), "miniprot", "mRNA", str(self.start),
-                         str(self.end), str(self.score), self.getStrand(),
-                         ".", f'ID={self.ID}; score={str(self.score)};'
-                         f'qcov={str(round(self.coverage, 4))};'
-                         f'identity={str(round(self.identity, 4))};'
-                         f'cluster={str(clusterId)}']))
-        if exons:
-            for exon in self.exons:
-                exon.print(self.ID)
-
-    def printGff2(self):
-        print("\t".join([self.getContig(), "miniprot", "match",
-                         str(self.start), str(self.end), str(int(self.score)),
-                         self.getStrand(), ".",
-                         f'Match {self.target}_{self.ID};'
-                         f'coverage {str(round(self.coverage, 2))};'
-                         f'subjectName {self.target};'
-                         f'Alias {self.target}'
-                         ]))
-        for exon in self.exons:
-            exon.printGff2(f'{self.target}_{self.ID}')
-
-    def printLocus(self, outFh, addQcov=False):
-        toPrint = [self.getContig(), self.getStrand(), str(self.start),
-                   str(self.end), self.target]
-        if addQcov:
-            toPrint.append(str(round(self.coverage, 2)))
-        outFh.write("\t".join(toPrint) + "\n")
-
-    def getCDSOverlap(self, other):
-        if self.start > other.end or self.end < other.start:
-            return 0
-        i = 0
-        j = 0
-        overlap = 0
-        while i < len(self.exons) and j < len(other.exons):
-            exon1 = self.exons[i]
-            exon2 = other.exons[j]
-            if exon1.end < exon2.start:
-                i += 1
-            elif exon2.end < exon1.start:
-                j += 1
-            else:
-                overlap += min(exon1.end, exon2.end) - \
-                    max(exon1.start, exon2.start) + 1
-                if exon1.end < exon2.end:
-                    i += 1
-                else:
-                    j += 1
-        return overlap / self.CDSlen
-
-    def __lt__(self, other):
-        return self.score > other.score
-
-
-def extractAttributeGtf(text, att):
-    regex = att + ' "([^"]+)"'
-    result = re.search(regex, text)
-    if result:
-        return result.groups()[0]
-    else:
-        return None
-
-
-def extractAttributeGff(text, att):
-    regex = att + '=([^;]+)'
-    result = re.search(regex, text)
-    if result:
-        return result.groups()[0]
-    else:
-        return None
+# Minimal total cost of a batch of streamed clusters sent to a worker
+STREAM_BATCH_COST = 10 ** 6
 
 
 def getRootCluster(clusterTree, i):
@@ -156,49 +33,66 @@ def getRootCluster(clusterTree, i):
         clusterTree: Cluster pointers
         i: Index of the cluster of interest
     """
-    while clusterTree[i] != i:
-        i = clusterTree[i]
-    return i
+    root = i
+    while clusterTree[root] != root:
+        root = clusterTree[root]
+    # Path compression
+    while clusterTree[i] != root:
+        clusterTree[i], i = root, clusterTree[i]
+    return root
 
 
-def clusterAlignments(allExons, alignments):
+def clusterAlignments(store):
     """Cluster overlapping seeds. Only CDS-level overlaps are considered.
     """
 
     clusterId = -1
-    prevContig = ""
-    prevStrand = ""
+    prevContig = -1
+    prevStrand = -1
     currentClusterEnd = 0
     clusterTree = []
-    ID2cluster = {}
+    alignment2cluster = array('l', [-1]) * len(store)
     clusters = {}
 
+    contigs = store.exonContigs
+    strands = store.exonStrands
+    starts = store.exonStarts
+    ends = store.exonEnds
+    parents = store.exonParents
+
     # Cluster by exons. Do not build objects for the temp clusters
-    for exon in allExons:
-        if prevContig != exon.contig or exon.start > currentClusterEnd or \
-           prevStrand != exon.strand:
+    for i in range(len(starts)):
+        contig = contigs[i]
+        strand = strands[i]
+        if prevContig != contig or starts[i] > currentClusterEnd or \
+           prevStrand != strand:
             clusterId += 1
             clusterTree.append(clusterId)
-            currentClusterEnd = exon.end
+            currentClusterEnd = ends[i]
         else:
-            if exon.end > currentClusterEnd:
-                currentClusterEnd = exon.end
+            if ends[i] > currentClusterEnd:
+                currentClusterEnd = ends[i]
 
-        if exon.parent not in ID2cluster:
-            ID2cluster[exon.parent] = clusterId
-        elif ID2cluster[exon.parent] != clusterId:
+        parent = parents[i]
+        if alignment2cluster[parent] == -1:
+            alignment2cluster[parent] = clusterId
+        elif alignment2cluster[parent] != clusterId:
             parentCluster = getRootCluster(clusterTree, clusterId)
-            clusterTree[parentCluster] = getRootCluster(clusterTree,
-                                                        ID2cluster[exon.parent]
-                                                        )
-        prevContig = exon.contig
-        prevStrand = exon.strand
+            clusterTree[parentCluster] = getRootCluster(
+                clusterTree, alignment2cluster[parent])
+        prevContig = contig
+        prevStrand = strand
 
     # Assign alignments to the final clusters
-    for alignment in alignments.values():
-        rootClusterId = getRootCluster(clusterTree, ID2cluster[alignment.ID])
+    for alignment in range(len(store)):
+        if alignment2cluster[alignment] == -1:
+            # Alignment without any CDS
+            continue
+        rootClusterId = getRootCluster(clusterTree,
+                                       alignment2cluster[alignment])
         if rootClusterId not in clusters:
-            clusters[rootClusterId] = AlignmentCluster.Cluster(rootClusterId)
+            clusters[rootClusterId] = AlignmentCluster.Cluster(rootClusterId,
+                                                               store)
         clusters[rootClusterId].addAlignment(alignment)
 
     return clusters
@@ -209,101 +103,474 @@ def getCoverageFromPAF(row):
     return (int(row[4]) - int(row[3])) / int(row[2])
 
 
-def loadGff(miniprot):
+def addRow(store, alignments, row, pafCoverage=None):
+    """Add an mRNA or a CDS row to the alignment store.
+
+    Args:
+        store: AlignmentStore
+        alignments: Dictionary of alignment IDs and their indices in store
+        row: gff row. Rows of other types are skipped.
+        pafCoverage: Query coverage from the last PAF line. None if the
+                     input is not in the native miniprot format.
+
+    Returns:
+        ID of the alignment, None for rows of other types
+    """
+    if row[2] == 'mRNA':
+        attributes = GffAttributes.Attributes(row[8])
+        ID = attributes.get("ID")
+    elif row[2] == 'CDS':
+        attributes = GffAttributes.Attributes(row[8])
+        ID = attributes.get("Parent")
+    else:
+        return None
+
+    alignment = alignments.get(ID)
+    if alignment is None:
+        if pafCoverage is not None:
+            target = attributes.get("Target")
+            alignment = store.addAlignment(ID, pafCoverage, target)
+        else:
+            target = attributes.get("prot")
+            alignment = store.addAlignment(ID, -1, target)
+        alignments[ID] = alignment
+
+    if row[2] == 'mRNA':
+        store.scores[alignment] = float(row[5])
+        store.identities[alignment] = float(attributes.get("Identity"))
+        if pafCoverage is None:
+            store.coverages[alignment] = float(attributes.get("qcov"))
+    else:
+        store.addExon(alignment, row[0], int(row[3]), int(row[4]), row[6])
+    return ID
+
+
+class RowRanges():
+    """Byte ranges of the rows of each alignment in an uncompressed input,
+    recorded while the input is parsed.
+
+    Rows of an alignment follow each other in the miniprot output, so an
+    alignment usually has a single range. The selected alignments are then
+    copied from the memory-mapped input, the discarded rows are not parsed
+    again.
+    """
+
+    def __init__(self, fileName):
+        self.fileName = fileName
+        # Alignment IDs and the [start, end) byte ranges of their rows, in
+        # the order of the input
+        self.IDs = []
+        self.starts = array('q')
+        self.ends = array('q')
+        self.offset = 0
+        self.rowEnd = 0
+        # The run of rows of one alignment which is being read
+        self.runID = None
+        self.runStart = 0
+        self.parentPrefix = None
+
+    def lines(self):
+        """Yield lines of the input and track the offset of the next
+        one."""
+        with open(self.fileName, "rb") as f:
+            for line in f:
+                self.offset += len(line)
+                yield line.decode()
+        self.endRun(self.rowEnd)
+
+    def endRun(self, end):
+        if self.runID is not None:
+            self.IDs.append(self.runID)
+            self.starts.append(self.runStart)
+            self.ends.append(end)
+            self.runID = None
+
+    def owner(self, row):
+        """Return the ID of the alignment a row belongs to, in the same
+        way as selectRows."""
+        if row[0][0] == "#":
+            return None
+        if row[2] == 'mRNA':
+            return GffAttributes.extract(row[8], "ID")
+        # Other rows usually belong to the alignment of the previous row
+        if self.runID is not None and row[8].startswith(self.parentPrefix):
+            return self.runID
+        return GffAttributes.extract(row[8], "Parent")
+
+    def add(self, row, ID=None):
+        """Record the range of the last parsed row.
+
+        Args:
+            row: The last row parsed from lines()
+            ID: ID of the alignment if already known, otherwise it is
+                extracted from the row
+        """
+        start = self.rowEnd
+        self.rowEnd = self.offset
+        if ID is None:
+            ID = self.owner(row)
+        if ID is not None and ID == self.runID:
+            return
+        self.endRun(start)
+        if ID is not None:
+            self.runID = ID
+            self.runStart = start
+            self.parentPrefix = f'Parent={ID};'
+
+    def printSelected(self, selected, output):
+        """Print rows of the selected alignments, as printSelected."""
+        selected = set(selected)
+        if not self.IDs:
+            return
+        with open(self.fileName, "rb") as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        with data:
+            for i, ID in enumerate(self.IDs):
+                if ID not in selected:
+                    continue
+                chunk = data[self.starts[i]:self.ends[i]]
+                if b'"' in chunk or b'\r' in chunk:
+                    # Quoting and line ends are normalized when the rows
+                    # are parsed, they are printed in the same way
+                    reader = csv.reader(io.StringIO(chunk.decode(),
+                                                    newline=None),
+                                        delimiter='\t')
+                    for row in reader:
+                        output.write("\t".join(row) + "\n")
+                    continue
+                output.write(chunk.decode())
+                if not chunk.endswith(b'\n'):
+                    output.write("\n")
+
+
+def loadGff(rows, ranges=None):
+    """Load alignments from gff rows.
+
+    Args:
+        rows: Rows parsed from the lines of ranges, if given
+        ranges: RowRanges recording the byte ranges of the rows
+    """
+    store = AlignmentStore.AlignmentStore()
     alignments = {}
-    allExons = []
-    pafDetected = False
-    coverage = -1
-    for row in csv.reader(open(miniprot), delimiter='\t'):
+    pafCoverage = None
+    for row in rows:
         if row[0][0] == "#":
             if row[0] == "##PAF":
-                pafDetected = True
-                coverage = getCoverageFromPAF(row)
-            else:
-                continue
+                pafCoverage = getCoverageFromPAF(row)
+            if ranges is not None:
+                ranges.add(row)
+            continue
+        ID = addRow(store, alignments, row, pafCoverage)
+        if ranges is not None:
+            ranges.add(row, ID)
 
-        if row[2] == 'mRNA':
-            ID = extractAttributeGff(row[8], "ID")
-        elif row[2] == 'CDS':
-            ID = extractAttributeGff(row[8], "Parent")
-        else:
+    return store
+
+
+def checkExtension(miniprot):
+    """Check the gff extension, which may be followed by a compression
+    extension. Stdin input "-" has no extension."""
+    if CompressedFiles.isStdin(miniprot):
+        return
+    ext = os.path.splitext(CompressedFiles.stripExtension(miniprot))[1]
+    if ext != ".gff" and ext != ".gff3":
+        sys.exit(f'error: Unexpected file extension: {ext}')
+
+
+def loadAlignments(miniprot, rows=None, ranges=None):
+    """Load alignments from a miniprot gff and sort their exons.
+
+    Args:
+        miniprot: Name of the miniprot gff file
+        rows: Already parsed rows of the file. If None, the file is read.
+        ranges: RowRanges of the file to be filled with the byte ranges of
+                the alignments. Given rows must be parsed from its lines().
+    """
+    checkExtension(miniprot)
+    if rows is None:
+        lines = CompressedFiles.openFile(miniprot) if ranges is None \
+            else ranges.lines()
+        rows = csv.reader(lines, delimiter='\t')
+    store = loadGff(rows, ranges)
+
+    # Sorting the exons of each alignment here makes the code more
+    # predictable (worth being a bit slower)
+    store.sortExons()
+
+    return store
+
+
+class Locus():
+    """Alignments with overlapping spans which are still being read."""
+
+    def __init__(self):
+        self.store = AlignmentStore.AlignmentStore()
+        self.alignments = {}
+        self.end = 0
+
+    def clusters(self):
+        self.store.sortExons()
+        return clusterAlignments(self.store).values()
+
+
+def streamClusters(rows):
+    """Yield alignment clusters from coordinate-sorted rows.
+
+    The rows must be sorted by contig and start coordinate, for example by
+    sort -k1,1 -k4,4n. Alignments with overlapping spans on the same strand
+    are collected in a locus. A locus is clustered as soon as the sweep
+    passes its end and it is dropped afterwards, so only the open loci
+    are kept in memory. CDS-level clusters never cross loci borders, the
+    clusters are thus the same as those of clusterAlignments.
+    """
+    loci = {}
+    contig = None
+    prevStart = 0
+    finishedContigs = set()
+
+    for row in rows:
+        if row[0][0] == "#":
+            if row[0] == "##PAF":
+                sys.exit('error: Native miniprot output (with PAF lines) '
+                         'cannot be processed as a coordinate-sorted input.')
+            continue
+        if row[2] != 'mRNA' and row[2] != 'CDS':
             continue
 
-        if ID not in alignments:
-            if pafDetected:
-                target = extractAttributeGff(row[8], "Target")
-            else:
-                target = extractAttributeGff(row[8], "prot")
-            alignments[ID] = Alignment(ID, coverage, target)
+        start = int(row[3])
+        if row[0] != contig:
+            for locus in loci.values():
+                yield from locus.clusters()
+            loci = {}
+            finishedContigs.add(contig)
+            contig = row[0]
+            if contig in finishedContigs:
+                sys.exit(f'error: The input is not sorted, contig "{contig}"'
+                         ' appears in more than one block.')
+        elif start < prevStart:
+            sys.exit(f'error: The input is not sorted by coordinates at '
+                     f'{contig}:{start}.')
+        prevStart = start
 
-        if row[2] == 'mRNA':
-            alignments[ID].addScore(row[5])
-            alignments[ID].identity = float(extractAttributeGff(row[8],
-                                                                "Identity"))
-            if not pafDetected:
-                alignments[ID].coverage = float(extractAttributeGff(row[8],
-                                                                    "qcov"))
-        else:
-            exon = Exon(row, ID)
-            alignments[ID].addExon(exon)
-            allExons.append(exon)
+        # Close all loci which end before the sweep position
+        for strand in list(loci.keys()):
+            if loci[strand].end < start:
+                yield from loci.pop(strand).clusters()
 
-    return allExons, alignments
+        locus = loci.get(row[6])
+        if locus is None:
+            locus = Locus()
+            loci[row[6]] = locus
+        addRow(locus.store, locus.alignments, row)
+        locus.end = max(locus.end, int(row[4]))
 
+    for locus in loci.values():
+        yield from locus.clusters()
 
-def loadAlignments(miniprot):
 
-    ext = os.path.splitext(miniprot)[1]
+def selectionParameters(args):
+    return (args.minOverlap4SeedChildren, args.minScoreFraction,
+            args.minSeedCoverage, args.topNperSeed, args.maxSubFraction,
+            args.minSubCoverage)
 
-    if ext == ".gff" or ext == ".gff3":
-        allExons, alignments = loadGff(miniprot)
-    else:
-        sys.exit(f'error: Unexpected file extension: {ext}')
 
-    allExons.sort()
-    # We could sort this later when cycling through alignments, but sorting
-    # here makes the code more predictable (worth being a bit slower)
-    for alignment in alignments.values():
-        alignment.exons.sort()
+def selectAlignments(clusters, args, store=None):
+    """Select representative alignments from all clusters.
 
-    return allExons, alignments
+    The clusters can be selected from repeatedly, with different parameters.
 
+    Args:
+        clusters: Iterable of alignment clusters
+        args: Selection parameters
+        store: AlignmentStore shared by all clusters, if there is one. It
+               is passed to the worker processes only once if args.threads
+               is larger than 1.
+    """
+    if args.threads > 1:
+        return selectAlignmentsParallel(clusters, args, store)
 
-def printSelected(miniprot, selected):
+    selected = []
+    for cluster in clusters:
+        s = cluster.splitByBestAlignments(*selectionParameters(args))
+        selected += s
+    return selected
+
+
+# Alignment store shared by all clusters processed in a worker process
+workerStore = None
+
+
+def initWorker(store):
+    global workerStore
+    workerStore = store
+
+
+def selectBatch(task):
+    """Select alignments from a batch of clusters in a worker process.
+
+    Args:
+        task: Tuple of selection parameters and a list of clusters. Each
+              cluster is a (store, clusterId, alignments) tuple. If store is
+              None, the store shared by the worker is used.
+    Returns:
+        List of selected alignment IDs for each cluster in the batch
+    """
+    parameters, clusters = task
+    selected = []
+    for store, clusterId, alignments in clusters:
+        cluster = AlignmentCluster.Cluster(clusterId, store or workerStore)
+        for alignment in alignments:
+            cluster.addAlignment(alignment)
+        selected.append(cluster.splitByBestAlignments(*parameters))
+    return selected
+
+
+def clusterCost(cluster):
+    # The selection is quadratic in the cluster size
+    return len(cluster.alignments) ** 2
+
+
+def balanceBatches(clusters, batchCount):
+    """Split cluster positions into batches with a similar total cost.
+
+    Clusters are assigned from the most expensive one to the currently
+    cheapest batch.
+    """
+    batches = [(0, i, []) for i in range(batchCount)]
+    order = sorted(range(len(clusters)), reverse=True,
+                   key=lambda i: clusterCost(clusters[i]))
+    for i in order:
+        cost, batchId, batch = heapq.heappop(batches)
+        batch.append(i)
+        heapq.heappush(batches, (cost + clusterCost(clusters[i]), batchId,
+                                 batch))
+    batches.sort(reverse=True)
+    return [batch for cost, batchId, batch in batches if batch]
+
+
+def streamBatches(clusters, store, maxCost):
+    """Group a stream of clusters into consecutive batches."""
+    batch = []
+    cost = 0
+    for cluster in clusters:
+        clusterStore = None if cluster.store is store else cluster.store
+        batch.append((clusterStore, cluster.clusterId, cluster.alignments))
+        cost += clusterCost(cluster)
+        if cost >= maxCost:
+            yield batch
+            batch = []
+            cost = 0
+    if batch:
+        yield batch
+
+
+def selectAlignmentsParallel(clusters, args, store=None):
+    """Select representative alignments in args.threads processes.
+
+    The result, including the order of selected alignments, is the same
+    as in the serial selectAlignments.
+
+    If all clusters share one store, the clusters are split into batches
+    balanced by cluster size. Otherwise (streamed clusters), consecutive
+    clusters are batched and only a limited number of batches is in
+    flight at a time, so the memory stays bounded.
+    """
+    parameters = selectionParameters(args)
+    selected = []
+    with multiprocessing.Pool(args.threads, initializer=initWorker,
+                              initargs=(store,)) as pool:
+        if store is not None:
+            clusters = list(clusters)
+            batches = balanceBatches(clusters, args.threads * 4)
+            tasks = [(parameters, [(None, clusters[i].clusterId,
+                                    clusters[i].alignments) for i in batch])
+                     for batch in batches]
+            results = [None] * len(clusters)
+            for batch, result in zip(batches, pool.map(selectBatch, tasks,
+                                                       chunksize=1)):
+                for i, s in zip(batch, result):
+                    results[i] = s
+            for s in results:
+                selected += s
+        else:
+            pending = deque()
+            for batch in streamBatches(clusters, store, STREAM_BATCH_COST):
+                pending.append(pool.apply_async(selectBatch,
+                                                ((parameters, batch),)))
+                if len(pending) >= args.threads * 2:
+                    for s in pending.popleft().get():
+                        selected += s
+            while pending:
+                for s in pending.popleft().get():
+                    selected += s
+    return selected
+
+
+def selectRows(rows, selected):
+    """Yield gff rows belonging to the selected alignments."""
     selected = set(selected)
-    for row in csv.reader(open(miniprot), delimiter='\t'):
+    for row in rows:
         if row[0][0] == "#":
             continue
 
         if row[2] == 'mRNA':
-            ID = extractAttributeGff(row[8], "ID")
+            ID = GffAttributes.extract(row[8], "ID")
         else:
-            ID = extractAttributeGff(row[8], "Parent")
+            ID = GffAttributes.extract(row[8], "Parent")
 
         if ID in selected:
-            print("\t".join(row))
+            yield row
+
+
+def printSelected(miniprot, selected, output, lines=None):
+    """Print rows of the selected alignments. The rows are read from the
+    miniprot file, or from lines if given."""
+    if lines is None:
+        lines = CompressedFiles.openFile(miniprot)
+    with lines:
+        for row in selectRows(csv.reader(lines, delimiter='\t'), selected):
+            output.write("\t".join(row) + "\n")
+
+
+def isAlignmentLine(line):
+    return line[0] != "#"
 
 
 def main():
     args = parseCmd()
-    allExons, alignments = loadAlignments(args.miniprot)
+    checkExtension(args.miniprot)
+    spool = None
+    ranges = None
+    if CompressedFiles.isStdin(args.miniprot):
+        # Stdin is read once, alignment rows are saved for printing the
+        # selected alignments. Comment lines, such as the long PAF lines,
+        # are not needed.
+        spool = CompressedFiles.Spool()
+        lines = spool.tee(CompressedFiles.openFile(args.miniprot),
+                          isAlignmentLine)
+    elif args.sortedInput or CompressedFiles.isCompressed(args.miniprot):
+        lines = CompressedFiles.openFile(args.miniprot)
+    else:
+        ranges = RowRanges(args.miniprot)
+        lines = ranges.lines()
+    rows = csv.reader(lines, delimiter='\t')
+    if args.sortedInput:
+        clusters = streamClusters(rows)
+    else:
+        store = loadAlignments(args.miniprot, rows, ranges)
+        clusters = clusterAlignments(store).values()
 
-    clusters = clusterAlignments(allExons, alignments)
+    selected = selectAlignments(clusters, args,
+                                None if args.sortedInput else store)
 
-    selected = []
-    for cluster in clusters.values():
-        s = cluster.splitByBestAlignments(args.minOverlap4SeedChildren,
-                                          args.minScoreFraction,
-                                          args.minSeedCoverage,
-                                          args.topNperSeed,
-                                          args.maxSubFraction,
-                                          args.minSubCoverage)
-        selected += s
-
-    printSelected(args.miniprot, selected)
+    if ranges is not None:
+        ranges.printSelected(selected, sys.stdout)
+    else:
+        printSelected(args.miniprot, selected, sys.stdout,
+                      None if spool is None else spool.lines())
 
 
-def parseCmd():
+def parseCmd(argv=None):
 
     parser = argparse.ArgumentParser(description='Select the best\
         alignments from overlapping miniprot results.',
@@ -313,7 +580,8 @@ def parseCmd():
     parser.add_argument('miniprot', metavar='miniprot.gtf/gff', type=str,
                         help='Raw miniprot alignments in a gff format \
         produced by miniprot or miniprot boundary scorer. If in native \
-        miniprot format, each alignment must be preceded by the PAF line')
+        miniprot format, each alignment must be preceded by the PAF line. \
+        Use "-" to read the alignments from stdin.')
 
     parser.add_argument('--minSeedCoverage', type=float, default=0,
                         help='Minimum query coveragy for an alignment to be\
@@ -342,7 +610,18 @@ def parseCmd():
                         needs to have has better average alignment identity \
                         than the parent.')
 
-    return parser.parse_args()
+    parser.add_argument('--sortedInput', action='store_true',
+                        help='The input is sorted by contig and start \
+                        coordinate, for example by sort -k1,1 -k4,4n. \
+                        Alignments are clustered and selected while the \
+                        input is read, which bounds the memory usage by the \
+                        largest locus instead of the whole input.')
+
+    parser.add_argument('--threads', type=int, default=1,
+                        help='Number of processes used for the selection of \
+                        representative alignments from clusters.')
+
+    return parser.parse_args(argv)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+# ==============================================================
+# Tomas Bruna
+#
+# Regression tests of ExternalSort. Sorting many spilled runs must not
+# keep more files open than are merged at once.
+# ==============================================================
+
+
+import os
+import random
+import resource
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import ExternalSort  # noqa: E402
+
+
+def openFiles():
+    return len(os.listdir("/proc/self/fd"))
+
+
+class SortRowsTest(unittest.TestCase):
+
+    def setUp(self):
+        random.seed(1)
+        # Few distinct keys, the index column checks that the sort is stable
+        self.rows = [[f'chr{random.randrange(3)}', "miniprot", "intron",
+                      str(random.randrange(100)), "1", str(i)]
+                     for i in range(20000)]
+
+    def key(self, row):
+        return (row[0], int(row[3]))
+
+    @unittest.skipUnless(os.path.isdir("/proc/self/fd"),
+                         "Open files are counted in /proc/self/fd")
+    def testManyRunsUnderLowFileLimit(self):
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        # Room for the merged runs, but far fewer than the spilled runs
+        limit = openFiles() + ExternalSort.MAX_MERGE_RUNS + 16
+        chunkRows = 10
+        self.assertGreater(len(self.rows) // chunkRows, 4 * limit)
+        with tempfile.TemporaryDirectory() as tempDir:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (limit, hard))
+            try:
+                result = list(ExternalSort.sortRows(iter(self.rows), self.key,
+                                                    chunkRows, tempDir))
+            finally:
+                resource.setrlimit(resource.RLIMIT_NOFILE, (soft, hard))
+            self.assertEqual(os.listdir(tempDir), [])
+        self.assertEqual(result, sorted(self.rows, key=self.key))
+
+    def testMemoryLimit(self):
+        with tempfile.TemporaryDirectory() as tempDir:
+            result = list(ExternalSort.sortRows(iter(self.rows), self.key,
+                                                tempDir=tempDir,
+                                                memory=100 * 1000))
+            self.assertEqual(os.listdir(tempDir), [])
+        self.assertEqual(result, sorted(self.rows, key=self.key))
+
+    def testInterruptedSortRemovesRuns(self):
+        with tempfile.TemporaryDirectory() as tempDir:
+            rows = ExternalSort.sortRows(iter(self.rows), self.key, 100,
+                                         tempDir)
+            next(rows)
+            rows.close()
+            self.assertEqual(os.listdir(tempDir), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
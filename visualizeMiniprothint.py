@@ -7,33 +7,23 @@
 
 
 import argparse
-import csv
-import re
 import sys
 import random
 import matplotlib as mpl
 mpl.use('Agg')
 import matplotlib.pyplot as plt
+import GffReader
+import GffAttributes
 
 
 def getSignature(row):
     return row[0] + "_" + row[3] + "_" + row[4] + "_" + row[6]
 
 
-def extractFeature(text, feature):
-    regex = feature + '=([^;]+)'
-    search = re.search(regex, text)
-    if search:
-        return search.groups()[0]
-    else:
-        return None
-
-
 def loadAnnotation(annotFile):
     annot = set()
-    for row in csv.reader(open(annotFile), delimiter='\t'):
-        if (row[2].lower() == "intron"):
-            annot.add(getSignature(row))
+    for row in GffReader.readRows(annotFile, {"intron"}, ignoreCase=True):
+        annot.add(getSignature(row))
     return annot
 
 
@@ -46,10 +36,7 @@ def plotScores(annot, inputFile, outputFile, args):
     maxX = 0
     maxY = 0
 
-    for row in csv.reader(open(inputFile), delimiter='\t'):
-        if (row[2].lower() != "intron"):
-            continue
-
+    for row in GffReader.readRows(inputFile, {"intron"}, ignoreCase=True):
         signature = getSignature(row)
         color = 'purple'
         if signature in annot:
@@ -58,7 +45,7 @@ def plotScores(annot, inputFile, outputFile, args):
         else:
             FP += 1
 
-        x = float(extractFeature(row[8], "al_score")) + \
+        x = float(GffAttributes.extract(row[8], "al_score")) + \
             random.uniform(-0.01, 0.01)
         y = float(row[5]) + random.uniform(-0.5, 0.5)
 